@@ -0,0 +1,17 @@
+"""Runs the FastAPI app in-process against a throwaway database, without uvicorn or sockets"""
+import contextlib
+import os
+import httpx
+
+@contextlib.asynccontextmanager
+async def app_client(database_path : str):
+    """Yields an httpx client bound to the app. The settings are read on import, so this must
+    run before anything imports main, settings or sql.*"""
+    os.environ['SCHOOL_DB_PATH'] = database_path
+    import main
+    await main.app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://benchmark') as client:
+            yield client
+    finally:
+        await main.app.router.shutdown()
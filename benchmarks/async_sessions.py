@@ -0,0 +1,114 @@
+"""Concurrent request throughput with the blocking session vs the async session
+
+Every "request" runs a list query like the /students/obtain/ handler, N of them at the
+same time inside one event loop, which is what uvicorn does with our async handlers.
+A probe task measures how long the event loop is stalled, that's the latency any other
+request (even "/") pays while the queries run.
+
+Usage: python -m benchmarks.async_sessions [--rows 20000] [--concurrency 1 8 32 64]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, select, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sql.definition import Base, Student, Career
+
+def prepare_database(path : str, rows : int):
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Career), [{'id': 1, 'name': 'Benchmark'}])
+        connection.execute(insert(Student), [{'firstName': f'Name{i}', 'secondName': f'Last{i}', 'studentId': 10000 + i,
+                                              'birthday': date(2000, 1, 1), 'semester': 1 + i % 10, 'gpa': i % 100,
+                                              'careerId': 1} for i in range(rows)])
+    engine.dispose()
+
+def percentile(values : list, pct : float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+async def run_sync(path : str, concurrency : int, requests : int) -> list:
+    engine = create_engine(f'sqlite:///{path}')
+    Session = sessionmaker(bind=engine)
+    latencies = []
+
+    async def request():
+        start = time.perf_counter()
+        with Session() as session:
+            session.execute(select(Student).where(Student.semester == 3)).scalars().all()
+        latencies.append(time.perf_counter() - start)
+
+    await gather_in_waves(request, concurrency, requests)
+    engine.dispose()
+    return latencies
+
+async def run_async(path : str, concurrency : int, requests : int) -> list:
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    Session = async_sessionmaker(bind=engine)
+    latencies = []
+
+    async def request():
+        start = time.perf_counter()
+        async with Session() as session:
+            (await session.execute(select(Student).where(Student.semester == 3))).scalars().all()
+        latencies.append(time.perf_counter() - start)
+
+    await gather_in_waves(request, concurrency, requests)
+    await engine.dispose()
+    return latencies
+
+async def gather_in_waves(request, concurrency : int, requests : int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            await request()
+
+    await asyncio.gather(*(limited() for _ in range(requests)))
+
+async def with_loop_probe(runner, path : str, concurrency : int, requests : int):
+    """Runs the benchmark while sampling the event loop lag every millisecond"""
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    probe_task = asyncio.create_task(probe())
+    latencies = await runner(path, concurrency, requests)
+    done.set()
+    await probe_task
+    return latencies, lags
+
+def report(label : str, concurrency : int, latencies : list, lags : list, elapsed : float):
+    print(f'{label:>6} c={concurrency:<4} {len(latencies) / elapsed:8.1f} req/s  '
+          f'query p50={statistics.median(latencies) * 1000:7.2f}ms  '
+          f'loop stall p99={percentile(lags, 99) * 1000:7.2f}ms max={max(lags) * 1000:7.2f}ms')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.db')
+        prepare_database(path, args.rows)
+        for concurrency in args.concurrency:
+            for label, runner in (('sync', run_sync), ('async', run_async)):
+                start = time.perf_counter()
+                latencies, lags = asyncio.run(with_loop_probe(runner, path, concurrency, args.requests))
+                report(label, concurrency, latencies, lags, time.perf_counter() - start)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Rows per second of /students/create/ in a loop vs /students/create/bulk
+
+Usage: python -m benchmarks.bulk_students [--single 500] [--bulk 10000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from benchmarks.app_client import app_client
+
+def student(number : int) -> dict:
+    return {'firstName': f'Name{number}', 'secondName': f'Last{number}', 'studentId': 10000 + number,
+            'birthday': '2002-04-11', 'semester': 1 + number % 10, 'gpa': number % 100, 'careerId': 1}
+
+async def run(single : int, bulk : int, batch : int):
+    with tempfile.TemporaryDirectory() as folder:
+        async with app_client(os.path.join(folder, 'bench.db')) as client:
+            await client.post('/careers/create/', json={'name': 'Benchmark'})
+
+            start = time.perf_counter()
+            for number in range(single):
+                response = await client.post('/students/create/', json=student(number))
+                assert response.status_code == 201, response.text
+            single_rate = single / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for offset in range(single, single + bulk, batch):
+                response = await client.post('/students/create/bulk', json=[student(number) for number in range(offset, min(single + bulk, offset + batch))])
+                assert all(item['status_code'] == 201 for item in response.json()), response.text
+            bulk_rate = bulk / (time.perf_counter() - start)
+
+    print(f'single endpoint: {single_rate:10.1f} rows/s')
+    print(f'bulk endpoint:   {bulk_rate:10.1f} rows/s  ({bulk_rate / single_rate:.0f}x)')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--single', type=int, default=500, help='Students created one request at a time')
+    parser.add_argument('--bulk', type=int, default=10000, help='Students created through the bulk endpoint')
+    parser.add_argument('--batch', type=int, default=5000, help='Students per bulk request')
+    args = parser.parse_args()
+    asyncio.run(run(args.single, args.bulk, args.batch))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Records per second of the single create endpoints
+
+Every /create/ endpoint runs in a loop against a throwaway database: the careers first, then the
+subjects, teachers, students and classes that reference them. The duplicates (same name, same
+unique id) are sent after the inserts to time the rejected path too.
+
+Usage: python -m benchmarks.creates [--records 1000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from benchmarks.app_client import app_client
+
+def bodies(records : int) -> dict:
+    return {
+        '/careers/create/': [{'name': f'Career {number}'} for number in range(records)],
+        '/subjects/create': [{'name': f'Subject {number}', 'semester': 1 + number % 10, 'careerId': 1 + number % records} for number in range(records)],
+        '/teachers/create/': [{'employeeId': 1000 + number, 'firstName': 'Teacher', 'secondName': f'Number {number}'} for number in range(records)],
+        '/students/create/': [{'firstName': 'Student', 'secondName': f'Number {number}', 'studentId': 10000 + number, 'birthday': '2002-04-11',
+                                'semester': 1 + number % 10, 'gpa': number % 100, 'careerId': 1 + number % records} for number in range(records)],
+        #One hour per teacher and group numbers from 100 to 999
+        '/classes/create/': [{'hour': '10:00 AM', 'groupNo': 100 + number, 'idTeacher': 1 + number, 'idSubject': 1 + number % records}
+                                for number in range(min(records, 900))],
+    }
+
+async def run(records : int):
+    with tempfile.TemporaryDirectory() as folder:
+        async with app_client(os.path.join(folder, 'bench.db')) as client:
+            print(f'{"endpoint":22}{"created/s":>12}{"rejected/s":>12}')
+            for path, items in bodies(records).items():
+                for expected in (201, 400):
+                    start = time.perf_counter()
+                    for body in items:
+                        response = await client.post(path, json=body)
+                        assert response.status_code == expected, response.text
+                    rate = len(items) / (time.perf_counter() - start)
+                    if expected == 201:
+                        created = rate
+                print(f'{path:22}{created:12.1f}{rate:12.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1000, help='Records created by every endpoint')
+    args = parser.parse_args()
+    asyncio.run(run(args.records))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Enrollment conflict checks: one join query per class vs the in-memory bitset schedules
+
+Enrolls every student in --per-student classes at different hours. The query check is the fixed
+check_disponibility query of the old code, run for a sample of students because it's the slow one.
+
+Usage: python -m benchmarks.enrollments [--students 100000] [--per-student 6] [--query-sample 10000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, select, insert, and_
+from sql.definition import Base, Career, Subject, Teacher, Class, Student, StudentClass, set_sqlite_pragmas
+from sqlalchemy import event
+from schedules import Schedule_Index
+
+def hour_label(slot : int) -> str:
+    return f'{7 + slot % 12 if 7 + slot % 12 <= 12 else slot % 12 - 5:02d}:00 {"AM" if 7 + slot % 12 < 12 else "PM"}'
+
+def prepare_database(path : str, students : int, hours : int, groups : int):
+    engine = create_engine(f'sqlite:///{path}')
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Career), [{'id': 1, 'name': 'Benchmark'}])
+        connection.execute(insert(Subject), [{'id': 1, 'name': 'Benchmark', 'semester': 1, 'careerId': 1}])
+        connection.execute(insert(Teacher), [{'id': number + 1, 'employeeId': 1000 + number, 'firstName': f'Name{number}',
+                                                'secondName': 'Teacher'} for number in range(groups)])
+        #One class per teacher at every hour
+        connection.execute(insert(Class), [{'id': hour * groups + group + 1, 'hour': hour_label(hour), 'groupNo': hour * groups + group,
+                                            'idTeacher': group + 1, 'idSubject': 1} for hour in range(hours) for group in range(groups)])
+        for start in range(0, students, 50000):
+            connection.execute(insert(Student), [{'id': number + 1, 'firstName': f'Name{number}', 'secondName': 'Student',
+                                                    'studentId': 10000 + number, 'birthday': date(2000, 1, 1), 'semester': 1,
+                                                    'gpa': 80, 'careerId': 1} for number in range(start, min(students, start + 50000))])
+    return engine
+
+def query_is_free(connection, student_id : int, class_id : int) -> bool:
+    hour = select(Class.hour).filter(Class.id == class_id).scalar_subquery()
+    return connection.execute(select(Class.id).join(StudentClass, and_(StudentClass.idClass == Class.id, StudentClass.idStudent == student_id)).\
+                                filter(Class.hour == hour).limit(1)).first() is None
+
+def run_queries(engine, plan : list) -> tuple:
+    checks = 0
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        for student_id, class_ids in plan:
+            for class_id in class_ids:
+                assert query_is_free(connection, student_id, class_id)
+                checks += 1
+            connection.execute(insert(StudentClass), [{'idStudent': student_id, 'idClass': class_id} for class_id in class_ids])
+            connection.commit()
+    return checks, time.perf_counter() - start
+
+def run_bitset(engine, plan : list) -> tuple:
+    index = Schedule_Index()
+    with engine.connect() as connection:
+        index.load(connection)
+        check_time = 0
+        start = time.perf_counter()
+        for student_id, class_ids in plan:
+            check_start = time.perf_counter()
+            assert not index.conflicts(student_id, class_ids)
+            check_time += time.perf_counter() - check_start
+            with index.enrollment(student_id, class_ids):
+                connection.execute(insert(StudentClass), [{'idStudent': student_id, 'idClass': class_id} for class_id in class_ids])
+                connection.commit()
+    return check_time, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--per-student', type=int, default=6)
+    parser.add_argument('--hours', type=int, default=12, help='Distinct class hours')
+    parser.add_argument('--groups', type=int, default=50, help='Classes at every hour')
+    parser.add_argument('--query-sample', type=int, default=10000, help='Students enrolled with the query check')
+    args = parser.parse_args()
+
+    randomizer = random.Random(5)
+    plan = [(student_id, [hour * args.groups + randomizer.randrange(args.groups) + 1 for hour in randomizer.sample(range(args.hours), args.per_student)])
+            for student_id in range(1, args.students + 1)]
+    enrollments = args.students * args.per_student
+
+    with tempfile.TemporaryDirectory() as folder:
+        engine = prepare_database(os.path.join(folder, 'queries.db'), args.students, args.hours, args.groups)
+        sample = plan[:args.query_sample]
+        checks, elapsed = run_queries(engine, sample)
+        engine.dispose()
+        query_check = elapsed / checks
+        print(f'query check:  {len(sample):>7} students, {elapsed:8.2f}s with inserts  '
+              f'({len(sample) / elapsed:9.0f} students/s, ~{elapsed / len(sample) * args.students:7.1f}s for all)')
+
+        engine = prepare_database(os.path.join(folder, 'bitset.db'), args.students, args.hours, args.groups)
+        check_time, elapsed = run_bitset(engine, plan)
+        engine.dispose()
+        print(f'bitset check: {args.students:>7} students, {elapsed:8.2f}s with inserts  ({args.students / elapsed:9.0f} students/s)')
+        print(f'per class check: query {query_check * 1e6:8.2f}us (with its share of the insert), '
+              f'bitset {check_time / enrollments * 1e6:8.3f}us ({enrollments} checks in {check_time:.3f}s)')
+
+if __name__ == '__main__':
+    main()
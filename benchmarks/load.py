@@ -0,0 +1,274 @@
+"""Load test of every endpoint of the API over a synthetic school
+
+The school is generated with sql.generator into a throwaway database, then every endpoint gets the
+same number of requests from a pool of concurrent clients over the app in-process. The reads go
+first, then the creates and modifications, and the deletes last (they remove what the creates added,
+so the reads always see the generated school).
+
+For every endpoint the throughput, the latency percentiles and the SQL statements per request are
+printed and saved as JSON; with --baseline the results of a previous run are compared endpoint by
+endpoint, and with --query-budgets the run fails if an endpoint goes over its budget in
+queries.QUERY_BUDGETS (so it can run in CI).
+
+Usage: python -m benchmarks.load [--students 20000] [--requests 200] [--concurrency 8] [--output load.json] [--baseline old.json] [--query-budgets]
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Callable, Union
+from benchmarks.app_client import app_client
+
+class Endpoint:
+    """One endpoint under load. request(number) gives the arguments of client.request for the
+    request number, record(number, response) keeps what the later endpoints need (e.g. created ids)"""
+    def __init__(self, method : str, path : str, request : Callable, status : int = 200, record : Union[Callable,None] = None,
+                    pool : Union[list,None] = None, share : float = 1.0):
+        self.name = f'{method} {path}'
+        self.method = method
+        self.request = request
+        self.status = status
+        self.record = record
+        #Requests that consume a list of records (modifications, deletes) stop when it runs out
+        self.pool = pool
+        #Heavy endpoints (exports, the timetable, imports) get a fraction of the requests
+        self.share = share
+
+    def requests(self, requests : int) -> int:
+        count = max(1, int(requests * self.share))
+        return count if self.pool is None else min(count, len(self.pool))
+
+def percentile(latencies : list, fraction : float) -> float:
+    """Nearest-rank percentile of sorted latencies"""
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+def endpoints(school : dict, classes : list, randomizer : random.Random) -> list:
+    from sql.generator import FIRST_NAMES, LAST_NAMES, SLOTS
+    careers, subjects, teachers, students = school['careers'], school['subjects'], school['teachers'], school['students']
+    #Records created by the load itself, the modifications and deletes use them
+    created = collections.defaultdict(list)
+    free_groups = sorted(set(range(100, 1000)) - {group_no for _, _, group_no in classes})
+    by_hour = collections.defaultdict(list)
+    for class_id, hour, _ in classes:
+        by_hour[hour].append(class_id)
+
+    def keep(kind : str) -> Callable:
+        return lambda number, response: created[kind].append(response.json()['id'])
+
+    def unique_hour(number : int) -> str:
+        #The generated classes are on the hour, so minutes 1 to 59 are always free for any teacher
+        return f'{number // 59 % 12 + 1:02d}:{number % 59 + 1:02d} {"AM" if number // 708 % 2 == 0 else "PM"}'
+
+    def new_student(number : int) -> dict:
+        return {'firstName': 'Load', 'secondName': f'Student {number}', 'studentId': 5000000 + number, 'birthday': '2002-04-11',
+                'semester': 1 + number % 10, 'gpa': number % 100, 'careerId': 1 + number % careers}
+
+    def record_enrollment(number : int, response):
+        created['enrollments'].append(created['students'][number])
+
+    def record_bulk(number : int, response):
+        created['students'].extend(item['id'] for item in response.json() if item['status_code'] == 201)
+
+    def bulk_classes() -> list:
+        return [randomizer.choice(by_hour[hour]) for hour in randomizer.sample(sorted(by_hour), min(3, len(by_hour)))]
+
+    def enrollment(number : int) -> dict:
+        return {'params': {'student_id': created['students'][number], 'class_id': classes[number % len(classes)][0]}}
+
+    return [
+        #region reads
+        Endpoint('GET', '/', lambda number: {'url': '/'}),
+        Endpoint('GET', '/careers/obtain/', lambda number: {'url': '/careers/obtain/'}),
+        Endpoint('GET', '/careers/search/', lambda number: {'url': '/careers/search/', 'params': {'id': randomizer.randint(1, careers)}}),
+        Endpoint('GET', '/careers/{career_id}/stats', lambda number: {'url': f'/careers/{randomizer.randint(1, careers)}/stats'}),
+        Endpoint('GET', '/subjects/obtain/', lambda number: {'url': '/subjects/obtain/',
+                    'params': {'careerId': randomizer.randint(1, careers), 'semester': randomizer.randint(1, 10)}}),
+        Endpoint('GET', '/subjects/search/', lambda number: {'url': '/subjects/search/', 'json': {'id': randomizer.randint(1, subjects)}}),
+        Endpoint('GET', '/teachers/obtain/', lambda number: {'url': '/teachers/obtain/', 'params': {'after': randomizer.randrange(teachers)}}),
+        Endpoint('GET', '/teachers/search/', lambda number: {'url': '/teachers/search/', 'json': {'secondName': str(randomizer.randint(1, teachers))}}),
+        Endpoint('GET', '/students/obtain/', lambda number: {'url': '/students/obtain/', 'params': {'after': randomizer.randrange(students)}}),
+        Endpoint('GET', '/students/search/', lambda number: {'url': '/students/search/', 'params': {'limit': 20},
+                    'json': {'firstName': randomizer.choice(FIRST_NAMES), 'secondName': randomizer.choice(LAST_NAMES)}}),
+        Endpoint('GET', '/students/{student_id}/schedule', lambda number: {'url': f'/students/{randomizer.randint(1, students)}/schedule'}),
+        Endpoint('GET', '/students/export/', lambda number: {'url': '/students/export/', 'params': {'since': max(0, students - 1000)}}, share=0.1),
+        Endpoint('GET', '/classes/obtain/', lambda number: {'url': '/classes/obtain/', 'params': {'after': randomizer.randrange(len(classes))}}),
+        Endpoint('GET', '/classes/search/', lambda number: {'url': '/classes/search/', 'params': {'group_no': randomizer.choice(classes)[2]}}),
+        Endpoint('GET', '/classes/availability/', lambda number: {'url': '/classes/availability/',
+                    'params': {'careerId': randomizer.randint(1, careers), 'semester': randomizer.randint(1, 10), 'open_only': True}}),
+        Endpoint('GET', '/classes/export/', lambda number: {'url': '/classes/export/'}, share=0.1),
+        Endpoint('GET', '/classes/enrollments/export/', lambda number: {'url': '/classes/enrollments/export/',
+                    'params': {'since': max(0, school['enrollments'] - 1000)}}, share=0.1),
+        Endpoint('POST', '/classes/validate/', lambda number: {'url': '/classes/validate/', 'json': [{'hour': randomizer.choice(SLOTS),
+                    'groupNo': randomizer.randint(100, 999), 'idTeacher': randomizer.randint(1, teachers), 'idSubject': randomizer.randint(1, subjects)}]}),
+        Endpoint('POST', '/classes/timetable/', lambda number: {'url': '/classes/timetable/',
+                    'json': {'careerId': randomizer.randint(1, careers), 'slots': SLOTS, 'time_budget': 1}}, share=0.05),
+        Endpoint('GET', '/reports/gpa_percentiles/', lambda number: {'url': '/reports/gpa_percentiles/'}),
+        Endpoint('GET', '/reports/birth_years/', lambda number: {'url': '/reports/birth_years/', 'params': {'careerId': randomizer.randint(1, careers)}}),
+        Endpoint('GET', '/reports/at_risk/', lambda number: {'url': '/reports/at_risk/', 'params': {'semester': randomizer.randint(1, 10)}}),
+        Endpoint('GET', '/admin/cache/', lambda number: {'url': '/admin/cache/'}),
+        #endregion
+        #region creates and modifications
+        Endpoint('POST', '/careers/create/', lambda number: {'url': '/careers/create/', 'json': {'name': f'Load career {number}'}},
+                    status=201, record=keep('careers')),
+        Endpoint('PUT', '/careers/modify/', lambda number: {'url': '/careers/modify/',
+                    'params': {'career_id': created['careers'][number], 'new_name': f'Renamed career {number}'}}, status=201, pool=created['careers']),
+        Endpoint('POST', '/subjects/create', lambda number: {'url': '/subjects/create',
+                    'json': {'name': f'Load subject {number}', 'semester': 1 + number % 10, 'careerId': 1}}, status=201, record=keep('subjects')),
+        Endpoint('PUT', '/subjects/modify/', lambda number: {'url': '/subjects/modify/',
+                    'json': {'id': created['subjects'][number], 'name': f'Renamed subject {number}'}}, status=201, pool=created['subjects']),
+        Endpoint('POST', '/teachers/create/', lambda number: {'url': '/teachers/create/',
+                    'json': {'employeeId': 900000 + number, 'firstName': 'Load', 'secondName': f'Teacher {number}'}}, status=201, record=keep('teachers')),
+        Endpoint('PUT', '/teachers/modify/', lambda number: {'url': '/teachers/modify/',
+                    'json': {'id': created['teachers'][number], 'secondName': f'Renamed {number}'}}, status=201, pool=created['teachers']),
+        Endpoint('POST', '/classes/create/', lambda number: {'url': '/classes/create/', 'json': {'hour': unique_hour(number),
+                    'groupNo': free_groups[number], 'idTeacher': randomizer.randint(1, teachers), 'idSubject': randomizer.randint(1, subjects)}},
+                    status=201, record=keep('classes'), pool=free_groups),
+        Endpoint('PUT', '/classes/modify/', lambda number: {'url': '/classes/modify/',
+                    'json': {'id': created['classes'][number], 'idSubject': randomizer.randint(1, subjects)}}, status=201, pool=created['classes']),
+        Endpoint('POST', '/students/create/', lambda number: {'url': '/students/create/', 'json': new_student(number)},
+                    status=201, record=keep('students')),
+        Endpoint('POST', '/students/create/bulk', lambda number: {'url': '/students/create/bulk',
+                    'json': [new_student(1000000 + number * 10 + item) for item in range(10)]}, status=201, record=record_bulk),
+        Endpoint('PUT', '/students/modify/', lambda number: {'url': '/students/modify/',
+                    'json': {'id': randomizer.randint(1, students), 'gpa': randomizer.randint(1, 100)}}, status=201),
+        Endpoint('POST', '/student_classes/create/', lambda number: {'url': '/student_classes/create/', **enrollment(number)},
+                    status=201, record=record_enrollment, pool=created['students']),
+        Endpoint('POST', '/student_classes/create/bulk', lambda number: {'url': '/student_classes/create/bulk',
+                    'params': {'student_id': created['students'][-1 - number]}, 'json': bulk_classes()}, status=201, pool=created['students']),
+        Endpoint('POST', '/imports/school/', lambda number: {'url': '/imports/school/',
+                    'files': {'careers': ('careers.csv', f'name\nImported career {number}\n'.encode())}}, status=201, share=0.1),
+        #endregion
+        #region deletes
+        Endpoint('DELETE', '/student_classes/erase/', lambda number: {'url': '/student_classes/erase/', **enrollment(number)},
+                    status=201, pool=created['enrollments']),
+        Endpoint('DELETE', '/students/erase/', lambda number: {'url': '/students/erase/', 'params': {'student_id': created['students'][number]}},
+                    status=201, pool=created['students']),
+        Endpoint('DELETE', '/classes/erase/', lambda number: {'url': '/classes/erase/', 'params': {'class_id': created['classes'][number]}},
+                    status=201, pool=created['classes']),
+        Endpoint('DELETE', '/subjects/erase/', lambda number: {'url': '/subjects/erase/', 'params': {'subject_id': created['subjects'][number]}},
+                    status=201, pool=created['subjects']),
+        Endpoint('DELETE', '/teachers/erase/', lambda number: {'url': '/teachers/erase/', 'params': {'teacher_id': created['teachers'][number]}},
+                    status=201, pool=created['teachers']),
+        Endpoint('DELETE', '/careers/erase/', lambda number: {'url': '/careers/erase/', 'params': {'career_id': created['careers'][number]}},
+                    status=201, pool=created['careers']),
+        Endpoint('DELETE', '/admin/cache/', lambda number: {'url': '/admin/cache/'}, status=201),
+        #endregion
+    ]
+
+async def measure(client, endpoint : Endpoint, requests : int, concurrency : int) -> dict:
+    latencies = []
+    queries = []
+    statuses = collections.Counter()
+    numbers = iter(range(endpoint.requests(requests)))
+
+    async def worker():
+        #The workers share the iterator, so every request number is sent once
+        for number in numbers:
+            arguments = endpoint.request(number)
+            start = time.perf_counter()
+            response = await client.request(endpoint.method, **arguments)
+            latencies.append(time.perf_counter() - start)
+            queries.append(int(response.headers['x-db-queries']))
+            statuses[response.status_code] += 1
+            if response.status_code == endpoint.status and endpoint.record:
+                endpoint.record(number, response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {'requests': len(latencies), 'errors': len(latencies) - statuses[endpoint.status],
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'latency_ms': {'mean': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+                            **{name: 1000 * percentile(latencies, fraction) if latencies else 0.0
+                                for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))}},
+            'queries': {'mean': sum(queries) / len(queries) if queries else 0.0, 'max': max(queries, default=0)}}
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'load.db')
+        #The settings are read on import, so the database path goes before sql.*
+        os.environ['SCHOOL_DB_PATH'] = path
+        os.environ['SCHOOL_DEBUG_QUERIES'] = '1'
+        from sql.generator import generate_school
+        from sql.definition import engine
+        start = time.perf_counter()
+        school = generate_school(engine, careers=args.careers, subjects_per_semester=args.subjects_per_semester, sections=args.sections,
+                                    teachers=args.teachers, students=args.students, enrollments=args.enrollments, seed=args.seed)
+        print(f'school generated in {time.perf_counter() - start:.1f}s: {school}')
+        with engine.connect() as connection:
+            classes = [tuple(row) for row in connection.exec_driver_sql('SELECT id, hour, groupNo FROM Classes ORDER BY id')]
+
+        async with app_client(path) as client:
+            if args.no_cache:
+                from cache import response_cache
+                from schedules import schedule_cache
+                response_cache.size = schedule_cache.size = 0
+            results = {}
+            for endpoint in endpoints(school, classes, random.Random(args.seed)):
+                results[endpoint.name] = result = await measure(client, endpoint, args.requests, args.concurrency)
+                latency = result['latency_ms']
+                print(f'{endpoint.name:40}{result["requests"]:6}{result["errors"]:6}{result["throughput"]:10.1f}/s'
+                        f'{latency["p50"]:9.2f}{latency["p90"]:9.2f}{latency["p99"]:9.2f}{latency["max"]:9.2f} ms{result["queries"]["max"]:6}')
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'config': vars(args), 'school': school,
+            'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'machine': platform.machine()},
+            'endpoints': results}
+
+def compare(report : dict, baseline : dict):
+    print(f'\n{"compared with " + baseline["date"]:40}{"throughput":>14}{"p50":>10}{"p99":>10}')
+    for name, result in report['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None or not old['throughput'] or not old['latency_ms']['p50'] or not old['latency_ms']['p99']:
+            continue
+        print(f'{name:40}{result["throughput"] / old["throughput"]:13.2f}x'
+                f'{result["latency_ms"]["p50"] / old["latency_ms"]["p50"]:9.2f}x{result["latency_ms"]["p99"] / old["latency_ms"]["p99"]:9.2f}x')
+
+def over_budget(report : dict) -> list:
+    """Endpoints whose requests ran more statements than their budget"""
+    from queries import QUERY_BUDGETS
+    return [(name, result['queries']['max'], QUERY_BUDGETS[name]) for name, result in report['endpoints'].items()
+            if name in QUERY_BUDGETS and result['queries']['max'] > QUERY_BUDGETS[name]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--careers', type=int, default=4)
+    parser.add_argument('--subjects-per-semester', type=int, default=4)
+    parser.add_argument('--sections', type=int, default=1, help='Classes of every subject')
+    parser.add_argument('--teachers', type=int, default=60)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--enrollments', type=int, default=4, help='Classes of every student')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8, help='Clients sending requests at the same time')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the response and schedule caches')
+    parser.add_argument('--output', default='load_results.json', help='JSON file where the results are saved')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--query-budgets', action='store_true', help='Exit with an error if an endpoint runs more statements than its budget')
+    args = parser.parse_args()
+
+    print(f'{"endpoint":40}{"reqs":>6}{"errs":>6}{"throughput":>12}{"p50":>9}{"p90":>9}{"p99":>9}{"max":>9}{"sql":>9}')
+    report = asyncio.run(run(args))
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f'results saved in {args.output}')
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(report, json.load(baseline))
+    if args.query_budgets:
+        offenders = over_budget(report)
+        for name, queries, budget in offenders:
+            print(f'{name} ran {queries} queries, its budget is {budget}')
+        if offenders:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
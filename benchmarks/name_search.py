@@ -0,0 +1,72 @@
+"""Student name search: FTS5 index vs the old leading-wildcard ilike scan
+
+Usage: python -m benchmarks.name_search [--sizes 10000 100000 1000000] [--queries 50]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, select, insert
+from sql.definition import Base, Student, Career
+from sql.search import create_search_tables, students_search, names_expression, matches
+
+FIRST_NAMES = ['Horacio', 'Ana', 'Maria', 'Jose', 'Luis', 'Carmen', 'Jorge', 'Lucia', 'Pedro', 'Sofia', 'Miguel', 'Elena',
+                'Diego', 'Paula', 'Javier', 'Laura', 'Andres', 'Marta', 'Raul', 'Irene']
+SECOND_NAMES = ['Gomez', 'Lopez', 'Martinez', 'Sanchez', 'Perez', 'Garcia', 'Rodriguez', 'Fernandez', 'Torres', 'Ramirez',
+                'Flores', 'Rivera', 'Morales', 'Ortiz', 'Castillo', 'Vargas', 'Mendoza', 'Herrera', 'Medina', 'Aguilar']
+
+def prepare_database(path : str, rows : int, seed : int = 7):
+    randomizer = random.Random(seed)
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Career), [{'id': 1, 'name': 'Benchmark'}])
+        for start in range(0, rows, 50000):
+            connection.execute(insert(Student), [{
+                #A numeric suffix makes most names unique, like real student lists
+                'firstName': f'{randomizer.choice(FIRST_NAMES)}{i % 997}', 'secondName': randomizer.choice(SECOND_NAMES),
+                'studentId': 10000 + i, 'birthday': date(2000, 1, 1), 'semester': 1, 'gpa': 80, 'careerId': 1
+            } for i in range(start, min(rows, start + 50000))])
+        create_search_tables(connection)
+    return engine
+
+def time_queries(engine, statements : list) -> list:
+    timings = []
+    with engine.connect() as connection:
+        for statement in statements:
+            start = time.perf_counter()
+            connection.execute(statement).all()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    randomizer = random.Random(11)
+    searches = [(f'{randomizer.choice(FIRST_NAMES)}{randomizer.randrange(997)}', randomizer.choice(SECOND_NAMES)[:3])
+                for _ in range(args.queries)]
+    ilike = [select(Student).filter(Student.firstName.ilike(f'%{first}%'), Student.secondName.ilike(f'%{second}%')).limit(args.limit)
+                for first, second in searches]
+    fts = [select(Student).join(students_search, students_search.c.rowid == Student.id).
+                filter(matches(students_search, names_expression(first, second))).
+                    order_by(students_search.c.rank, Student.id).limit(args.limit)
+                for first, second in searches]
+
+    with tempfile.TemporaryDirectory() as folder:
+        for size in args.sizes:
+            engine = prepare_database(os.path.join(folder, f'students_{size}.db'), size)
+            for label, statements in (('ilike', ilike), ('fts5', fts)):
+                timings = time_queries(engine, statements)
+                print(f'{size:>9} rows {label:>6}: median {statistics.median(timings) * 1000:8.3f}ms  '
+                        f'max {max(timings) * 1000:8.3f}ms')
+            engine.dispose()
+
+if __name__ == '__main__':
+    main()
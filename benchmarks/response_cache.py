@@ -0,0 +1,61 @@
+"""Requests per second of the read endpoints with the response cache on and off
+
+The same mix of /obtain/ and /search/ requests runs twice over the app in-process, first with the
+cache disabled and then with it enabled (after one warm-up pass).
+
+Usage: python -m benchmarks.response_cache [--students 20000] [--requests 3000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from benchmarks.app_client import app_client
+from benchmarks.bulk_students import student
+
+async def run(students : int, requests : int, batch : int):
+    with tempfile.TemporaryDirectory() as folder:
+        async with app_client(os.path.join(folder, 'bench.db')) as client:
+            from cache import response_cache
+            for name in ('Benchmark', 'Aviation', 'Law', 'Medicine'):
+                await client.post('/careers/create/', json={'name': name})
+            for number in range(40):
+                await client.post('/teachers/create/', json={'employeeId': 1000 + number, 'firstName': f'Name{number}', 'secondName': 'Teacher'})
+            for offset in range(0, students, batch):
+                await client.post('/students/create/bulk', json=[student(number) for number in range(offset, min(students, offset + batch))])
+
+            randomizer = random.Random(9)
+            #A few dozen distinct pages, like dashboards polling the first pages of every list
+            paths = [('/careers/obtain/', None), ('/teachers/obtain/', None), ('/teachers/obtain/?limit=10', None)] + \
+                    [(f'/students/obtain/?limit=100&after={100 * page}', None) for page in range(20)] + \
+                    [('/students/search/?limit=20', {'firstName': f'Name{number}'}) for number in range(1, 20)]
+            mix = [randomizer.choice(paths) for _ in range(requests)]
+
+            async def run_mix() -> float:
+                start = time.perf_counter()
+                for path, body in mix:
+                    response = await client.request('GET', path, json=body)
+                    assert response.status_code == 200, response.text
+                return requests / (time.perf_counter() - start)
+
+            size = response_cache.size
+            response_cache.size = 0
+            uncached = await run_mix()
+            response_cache.size = size
+            await run_mix()
+            cached = await run_mix()
+            print(f'uncached: {uncached:10.1f} requests/s')
+            print(f'cached:   {cached:10.1f} requests/s  ({cached / uncached:.1f}x)')
+            print(f'stats:    {response_cache.summary()}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--batch', type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.students, args.requests, args.batch))
+
+if __name__ == '__main__':
+    main()
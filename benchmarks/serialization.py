@@ -0,0 +1,87 @@
+"""Time to turn a list of students into a JSON body, the old path against the current one
+
+old: ORM objects, model_to_dict, Student_DB and Page models, jsonable_encoder and json.dumps
+new: column rows as dicts straight from the select, encoded with orjson
+
+Both paths read the same rows from a throwaway database; the query, the payload and the encoding
+are timed separately and the best of the repetitions is reported.
+
+Usage: python -m benchmarks.serialization [--rows 100000] [--repeat 3]
+"""
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+
+def old_model_to_dict(model) -> dict:
+    #The previous utils.model_to_dict, on a copy so the benchmark doesn't depend on it mutating the object
+    model_dict = dict(model.__dict__)
+    del model_dict['_sa_instance_state']
+    return model_dict
+
+def run(rows : int, repeat : int):
+    with tempfile.TemporaryDirectory() as folder:
+        #The settings are read on import, so the database path goes first
+        os.environ['SCHOOL_DB_PATH'] = os.path.join(folder, 'bench.db')
+        import orjson
+        from fastapi.encoders import jsonable_encoder
+        from sqlalchemy import insert, select
+        from sqlalchemy.orm import Session
+        from schemes import Page, Student_DB
+        from sql.definition import Career, Student, engine
+        from sql.migrations import migrate
+
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(insert(Career.__table__), [{'name': 'Benchmark'}])
+            connection.execute(insert(Student.__table__), [{'firstName': f'Name{number}', 'secondName': f'Last{number}',
+                                'studentId': 10000 + number, 'birthday': datetime.date(2002, 4, 11),
+                                'semester': 1 + number % 10, 'gpa': number % 100, 'careerId': 1} for number in range(rows)])
+
+        def old_path(session : Session) -> tuple:
+            start = time.perf_counter()
+            result = session.execute(select(Student)).scalars().all()
+            queried = time.perf_counter()
+            page = Page[Student_DB](items = [Student_DB(**old_model_to_dict(row)) for row in result], next = None)
+            built = time.perf_counter()
+            body = json.dumps(jsonable_encoder(page)).encode()
+            return body, queried - start, built - queried, time.perf_counter() - built
+
+        def new_path(session : Session) -> tuple:
+            start = time.perf_counter()
+            result = [dict(row) for row in session.execute(select(Student.__table__)).mappings()]
+            queried = time.perf_counter()
+            page = {'items': result, 'next': None}
+            built = time.perf_counter()
+            body = orjson.dumps(page)
+            return body, queried - start, built - queried, time.perf_counter() - built
+
+        timings = {}
+        for name, path in (('old', old_path), ('new', new_path)):
+            best = None
+            for _ in range(repeat):
+                with Session(engine) as session:
+                    body, *times = path(session)
+                best = times if best is None or sum(times) < sum(best) else best
+            timings[name] = (best, body)
+        engine.dispose()
+
+    assert json.loads(timings['old'][1]) == json.loads(timings['new'][1]), 'Both paths must produce the same document'
+    print(f'{rows} students, {len(timings["new"][1]) / 2**20:.1f} MiB of JSON')
+    print(f'{"":5}{"query":>10}{"payload":>10}{"encode":>10}{"total":>10}')
+    for name, (times, _) in timings.items():
+        print(f'{name:5}' + ''.join(f'{seconds * 1000:8.0f}ms' for seconds in times) + f'{sum(times) * 1000:8.0f}ms')
+    old_total, new_total = sum(timings['old'][0]), sum(timings['new'][0])
+    print(f'speedup: {old_total / new_total:.1f}x')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='Students in the list')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each path, the best one is reported')
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Memory and latency of the student reports: ORM objects against the column store
+
+The students are loaded twice from the same database, as ORM objects with .all() and into the
+column store, and the three reports (GPA percentiles per career and semester, students per birth
+year, students below a GPA threshold) are computed over both. The store runs the reports in plain
+Python and, when NumPy is installed, vectorized. The memory is the peak traced by tracemalloc while
+loading, measured in a separate pass because tracing slows the loads down.
+
+Usage: python -m benchmarks.student_store [--students 1000000] [--database school.db]
+"""
+import argparse
+import gc
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+THRESHOLD = 60
+PERCENTILES = (10, 25, 50, 75, 90)
+
+def orm_reports(students : list):
+    groups = defaultdict(list)
+    for student in students:
+        groups[(student.careerId, student.semester)].append(student.gpa)
+    for gpas in groups.values():
+        gpas.sort()
+        for percentile in PERCENTILES:
+            rank = percentile / 100 * (len(gpas) - 1)
+            gpas[math.floor(rank)] + (gpas[math.ceil(rank)] - gpas[math.floor(rank)]) * (rank - math.floor(rank))
+    Counter(student.birthday.year for student in students)
+    sorted((student.gpa, student.id) for student in students if student.gpa < THRESHOLD)[:100]
+
+def store_reports(store):
+    store.gpa_percentiles(PERCENTILES)
+    store.birth_year_counts()
+    store.at_risk(THRESHOLD)
+
+def timed(function, *arguments) -> tuple:
+    start = time.perf_counter()
+    result = function(*arguments)
+    return result, time.perf_counter() - start
+
+def traced(function, *arguments) -> int:
+    """Peak of the memory allocated by the function, what it returns is kept alive until the end"""
+    gc.collect()
+    tracemalloc.start()
+    result = function(*arguments)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+def run(args):
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+    from sql.definition import Student, engine
+    from student_store import Student_Store, numpy
+
+    def load_orm():
+        with Session(engine) as session:
+            return session.execute(select(Student)).scalars().all()
+
+    def load_store():
+        store = Student_Store()
+        with engine.connect() as connection:
+            store.load(connection)
+        return store
+
+    students, orm_load = timed(load_orm)
+    _, orm_report = timed(orm_reports, students)
+    del students
+    store, store_load = timed(load_store)
+    rows = [('ORM .all()', orm_load, orm_report)]
+    store.vectorized = False
+    rows.append(('store, Python', store_load, timed(store_reports, store)[1]))
+    if numpy is not None:
+        store.vectorized = True
+        rows.append(('store, NumPy', store_load, timed(store_reports, store)[1]))
+    print(f'{len(store)} students, the store columns take {store.nbytes() / 2 ** 20:.1f} MB')
+    del store
+
+    memory = {'ORM .all()': traced(load_orm), 'store': traced(load_store)}
+    print(f'{"":16}{"load":>10}{"reports":>10}{"peak memory":>14}')
+    for name, load, report in rows:
+        print(f'{name:16}{load:9.2f}s{report * 1000:8.1f}ms{memory["store" if name.startswith("store") else name] / 2 ** 20:11.1f} MB')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=1000000, help='Students of the generated school')
+    parser.add_argument('--database', help='Use this database instead of generating one')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    if args.database:
+        os.environ['SCHOOL_DB_PATH'] = args.database
+        run(args)
+        return
+    with tempfile.TemporaryDirectory() as folder:
+        #The settings are read on import, so the database path goes before sql.*
+        os.environ['SCHOOL_DB_PATH'] = os.path.join(folder, 'students.db')
+        from sql.definition import engine
+        from sql.generator import generate_school
+        generate_school(engine, students=args.students, enrollments=0, seed=args.seed)
+        run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Timetable generator on synthetic schools
+
+A school has --semesters semesters with --subjects subjects each, and as many groups of students as
+needed to reach the number of classes. The teachers are just enough to fill --load of their hours.
+
+Usage: python -m benchmarks.timetable [--sizes 500 2000 5000 20000] [--slots 30] [--load 0.85] [--budget 10]
+"""
+import argparse
+import math
+import random
+from timetable import generate_timetable
+
+def synthetic_school(size : int, semesters : int, subjects : int, slots : int, load : float, busy_share : float, seed : int = 3):
+    randomizer = random.Random(seed)
+    groups = math.ceil(size / (semesters * subjects))
+    classes = [((semester, subject, group), (semester, group)) for group in range(groups)
+                for semester in range(semesters) for subject in range(subjects)][:size]
+    hours = [f'{8 + slot % 6:02d}:00 {day}' for day in ('MON', 'TUE', 'WED', 'THU', 'FRI') for slot in range(6)][:slots]
+    teachers = list(range(1, math.ceil(size / (len(hours) * load)) + 1))
+    #Some hours of every teacher are already taken by classes of other careers
+    busy = [(teacher, hour) for teacher in teachers for hour in hours if randomizer.random() < busy_share]
+    return classes, hours, teachers, busy
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 5000, 20000])
+    parser.add_argument('--semesters', type=int, default=10)
+    parser.add_argument('--subjects', type=int, default=6)
+    parser.add_argument('--slots', type=int, default=30)
+    parser.add_argument('--load', type=float, default=0.85, help='Share of the free teacher hours the classes need')
+    parser.add_argument('--busy', type=float, default=0.1, help='Share of the teacher hours already taken')
+    parser.add_argument('--budget', type=float, default=10, help='Time budget in seconds')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        classes, slots, teachers, busy = synthetic_school(size, args.semesters, args.subjects, args.slots, args.load * (1 - args.busy), args.busy)
+        result = generate_timetable(classes, slots, teachers, busy, args.budget)
+        placed = result['placed']
+        #Every timetable is checked, the generator must never return a clash
+        assert len({(teacher, slot) for slot, teacher in placed.values()}) == len(placed)
+        assert len({(key[0], key[2], slot) for key, (slot, _) in placed.items()}) == len(placed)
+        assert not set(busy) & {(teacher, slot) for slot, teacher in placed.values()}
+        print(f'{size:>6} classes, {len(teachers):>5} teachers: {len(placed):>6} placed, {len(result["unplaced"]):>4} unplaced '
+                f'in {result["elapsed"] * 1000:9.1f}ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Read-through cache of the rendered responses of the read endpoints
+
+Every cached endpoint declares the tables it reads. An entry is keyed by the endpoint and its
+validated parameters and remembers the version of those tables when it was filled; the write
+handlers bump the version of the tables they change after the commit, so an entry is served only
+while none of its tables changed. Entries also expire after the TTL, which bounds how stale a
+response can be after a write made outside this process (e.g. the command line importer).
+
+The same versions give the strong ETags of the list endpoints that clients poll: the ETag is known
+before running the query, so a matching If-None-Match is answered with a 304 straight away. The
+versions start again when the process starts, so the ETags carry an epoch that changes on every
+start and every time the cache is cleared by hand.
+"""
+from collections import OrderedDict
+from fastapi.encoders import jsonable_encoder
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Union
+from settings import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+import functools
+import inspect
+import json
+import orjson
+import secrets
+import time
+
+#Tables whose rows are deleted by the ON DELETE CASCADE of a table
+CASCADES = {
+    'Careers': ('Students', 'Subjects'),
+    'Subjects': ('Classes',),
+    'Teachers': ('Classes',),
+    'Classes': ('StudentClasses',),
+    'Students': ('StudentClasses',),
+}
+
+def table_name(table) -> str:
+    return table if isinstance(table, str) else table.__tablename__
+
+class Table_Versions:
+    def __init__(self):
+        self.versions = {}
+        self.epoch = secrets.token_hex(4)
+
+    def get(self, tables : tuple) -> tuple:
+        return tuple(self.versions.get(table, 0) for table in tables)
+
+    def bump(self, *tables, cascade : bool = False):
+        """Marks the tables as changed, with cascade=True the tables a delete cascades to as well"""
+        pending = [table_name(table) for table in tables]
+        while pending:
+            table = pending.pop()
+            self.versions[table] = self.versions.get(table, 0) + 1
+            if cascade:
+                pending.extend(CASCADES.get(table, ()))
+
+    def etag(self, tables : tuple) -> str:
+        return '"' + self.epoch + '-' + '.'.join(str(version) for version in self.get(tables)) + '"'
+
+    def new_epoch(self):
+        """Invalidates every ETag handed out, for writes the versions didn't see"""
+        self.epoch = secrets.token_hex(4)
+
+class Response_Cache:
+    def __init__(self, size : int, ttl : float):
+        self.size = size
+        self.ttl = ttl
+        #key -> (tables, their versions, expiration time, body)
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'expired': 0, 'evictions': 0}
+
+    def get(self, key : tuple) -> Union[bytes,None]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        tables, versions, expires, body = entry
+        stale = versions != table_versions.get(tables)
+        if stale or expires < time.monotonic():
+            self.stats['stale' if stale else 'expired'] += 1
+            self.stats['misses'] += 1
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return body
+
+    def put(self, key : tuple, tables : tuple, versions : tuple, body : bytes):
+        #A write that committed while the response was computed makes it stale already
+        if self.size <= 0 or versions != table_versions.get(tables):
+            return
+        self.entries[key] = (tables, versions, time.monotonic() + self.ttl, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def summary(self) -> dict:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {**self.stats, 'entries': len(self.entries), 'size': self.size, 'ttl': self.ttl,
+                'hit_ratio': self.stats['hits'] / lookups if lookups else 0.0}
+
+table_versions = Table_Versions()
+response_cache = Response_Cache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+def request_key(handler, arguments : dict) -> tuple:
+    """The endpoint and its validated parameters (query, path and body), the session is left out"""
+    parameters = {name: jsonable_encoder(value) for name, value in arguments.items() if not isinstance(value, AsyncSession)}
+    return (handler.__module__, handler.__name__, json.dumps(parameters, sort_keys=True, default=str))
+
+def etag_matches(header : Union[str,None], etag : str) -> bool:
+    """If-None-Match may list several ETags, weak ones included, or be *"""
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+def cached(*tables, etag : bool = False):
+    """Caches the JSON response of a read endpoint until one of the tables changes. The handler's
+    errors (HTTPException) aren't cached, and a hit never opens a database connection.
+    With etag=True the responses carry an ETag and If-None-Match gets a 304 without a body"""
+    tables = tuple(table_name(table) for table in tables)
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(cache_request : Request, **arguments):
+            headers = {}
+            if etag:
+                headers['ETag'] = table_versions.etag(tables)
+                if etag_matches(cache_request.headers.get('if-none-match'), headers['ETag']):
+                    return Response(status_code=304, headers=headers)
+            key = request_key(handler, arguments)
+            body = response_cache.get(key)
+            if body is None:
+                versions = table_versions.get(tables)
+                #The handlers return plain rows, models (and anything orjson doesn't know) go through FastAPI's encoder
+                body = orjson.dumps(await handler(**arguments), default=jsonable_encoder)
+                response_cache.put(key, tables, versions, body)
+            return Response(content=body, media_type='application/json', headers=headers)
+        #FastAPI reads the parameters from the signature, the request is added to the handler ones
+        signature = inspect.signature(handler)
+        wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(),
+                                    inspect.Parameter('cache_request', inspect.Parameter.KEYWORD_ONLY, annotation=Request)])
+        return wrapper
+    return decorator
@@ -1,5 +1,13 @@
 from fastapi import FastAPI
-from modules import students, careers, teachers, subjects, classes
+from fastapi.responses import PlainTextResponse
+from modules import students, careers, teachers, subjects, classes, student_classes, imports, admin, reports
+from sql.definition import engine, async_engine
+from sql.migrations import migrate
+from occupancy import occupancy
+from schedules import reload_schedules
+from student_store import student_store
+from metrics import metrics, Metrics_Middleware
+from settings import METRICS_ENABLED, DEBUG_QUERIES
 
 app = FastAPI(
     title = "Student Schedules",
@@ -36,12 +44,39 @@ app = FastAPI(
     }
 )
 
+if METRICS_ENABLED or DEBUG_QUERIES:
+    app.add_middleware(Metrics_Middleware, query_headers=DEBUG_QUERIES)
+
 app.include_router(students.router)
 app.include_router(careers.router)
 app.include_router(teachers.router)
 app.include_router(subjects.router)
 app.include_router(classes.router)
+app.include_router(student_classes.router)
+app.include_router(imports.router)
+app.include_router(admin.router)
+app.include_router(reports.router)
+
+@app.on_event("startup")
+async def prepare_database():
+    async with async_engine.begin() as connection:
+        await connection.run_sync(migrate)
+        await connection.run_sync(occupancy.load)
+        await connection.run_sync(student_store.load)
+    #After the commit of the migrations, it reads them with the synchronous engine
+    await reload_schedules()
+
+@app.on_event("shutdown")
+async def close_connections():
+    await async_engine.dispose()
+    engine.dispose()
 
 @app.get("/")
 async def root():
     return {"message": "Hello World, application is running! Visit /docs to see the documentation"}
+
+if METRICS_ENABLED:
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def get_metrics():
+        """Request counts, errors and latency histograms per route in Prometheus text format"""
+        return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,132 @@
+"""Request metrics in Prometheus text format
+
+A plain ASGI middleware (no BaseHTTPMiddleware, which costs a task and a stream per request) counts
+the requests by method, route template and status, observes their latency in a fixed-bucket
+histogram per route and keeps the number of requests in flight. The route template comes from the
+route FastAPI matched, so /students/12/schedule and /students/13/schedule are the same series and
+paths that match no route share one. The SQL statements of every request are counted too (see
+queries.py): their total and time per route, and a histogram of the statements per request that
+shows the endpoints that query in a loop.
+
+The registry lives in the process like the indexes, with several workers every one has its own.
+"""
+from bisect import bisect_left
+from time import perf_counter
+from queries import Query_Stats, current_queries
+
+#Upper bounds of the latency buckets in seconds, the last bucket (+Inf) is implicit
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+#Upper bounds of the buckets of statements per request
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 50, 100)
+UNMATCHED = 'unmatched'
+
+class Metrics:
+    def __init__(self):
+        #(method, route) -> [requests per latency bucket (not cumulative), seconds,
+        #                    requests per bucket of statements (not cumulative), statements, seconds in the database,
+        #                    {status: requests}]
+        self.routes = {}
+        self.in_flight = 0
+
+    def observe(self, method : str, route : str, status : int, seconds : float, queries : Query_Stats):
+        #One lookup per request, everything about the route is in the same list
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = [[0] * (len(BUCKETS) + 1), 0.0, [0] * (len(QUERY_BUCKETS) + 1), 0, 0.0, {}]
+        stats[0][bisect_left(BUCKETS, seconds)] += 1
+        stats[1] += seconds
+        count = queries.count
+        stats[2][bisect_left(QUERY_BUCKETS, count)] += 1
+        stats[3] += count
+        stats[4] += queries.seconds
+        statuses = stats[5]
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def clear(self):
+        self.routes.clear()
+
+    def render(self) -> str:
+        """Exposition in the Prometheus text format 0.0.4"""
+        lines = ['# HELP school_http_requests_total Requests answered, by method, route template and status',
+                 '# TYPE school_http_requests_total counter']
+        errors = {}
+        requests = sorted((method, route, status, count) for (method, route), stats in self.routes.items() for status, count in stats[5].items())
+        for method, route, status, count in requests:
+            lines.append(f'school_http_requests_total{{method="{method}",route="{label(route)}",status="{status}"}} {count}')
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + count
+        lines += ['# HELP school_http_errors_total Requests answered with a 4xx or 5xx status (560 is a SQLAlchemy error)',
+                  '# TYPE school_http_errors_total counter']
+        lines += [f'school_http_errors_total{{status="{status}"}} {count}' for status, count in sorted(errors.items())]
+        lines += ['# HELP school_http_request_duration_seconds Time to answer a request, by method and route template',
+                  '# TYPE school_http_request_duration_seconds histogram']
+        for (method, route), (buckets, total, _, _, _, _) in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{label(route)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(f'school_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'school_http_request_duration_seconds_sum{{{labels}}} {total}')
+            lines.append(f'school_http_request_duration_seconds_count{{{labels}}} {cumulative}')
+        lines += ['# HELP school_db_queries_per_request SQL statements run by a request, by method and route template',
+                  '# TYPE school_db_queries_per_request histogram']
+        for (method, route), (_, _, buckets, total, _, _) in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{label(route)}"'
+            cumulative = 0
+            for bound, count in zip(QUERY_BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(f'school_db_queries_per_request_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'school_db_queries_per_request_sum{{{labels}}} {total}')
+            lines.append(f'school_db_queries_per_request_count{{{labels}}} {cumulative}')
+        lines += ['# HELP school_db_seconds_total Time spent running SQL statements, by method and route template',
+                  '# TYPE school_db_seconds_total counter']
+        lines += [f'school_db_seconds_total{{method="{method}",route="{label(route)}"}} {seconds}'
+                  for (method, route), (_, _, _, _, seconds, _) in sorted(self.routes.items())]
+        lines += ['# HELP school_http_requests_in_flight Requests being answered right now',
+                  '# TYPE school_http_requests_in_flight gauge',
+                  f'school_http_requests_in_flight {self.in_flight}']
+        return '\n'.join(lines) + '\n'
+
+def label(value : str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metrics = Metrics()
+
+class Metrics_Middleware:
+    """query_headers: add the statements of the request and their time as the X-DB-Queries and
+    Server-Timing headers, for debugging. A streaming response only counts the statements that
+    ran before its first chunk in the headers"""
+    def __init__(self, app, registry : Metrics = metrics, query_headers : bool = False):
+        self.app = app
+        self.registry = registry
+        self.query_headers = query_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        #An exception that escapes the app becomes a 500 in the outer ServerErrorMiddleware
+        status = 500
+        queries = Query_Stats(scope=scope)
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if self.query_headers:
+                    message = {**message, 'headers': [*message.get('headers', ()), (b'x-db-queries', str(queries.count).encode()),
+                                                        (b'server-timing', f'db;dur={queries.seconds * 1000:.3f}'.encode())]}
+            await send(message)
+
+        registry = self.registry
+        registry.in_flight += 1
+        token = current_queries.set(queries)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            current_queries.reset(token)
+            registry.in_flight -= 1
+            #FastAPI leaves the matched route in the scope
+            route = scope.get('route')
+            registry.observe(scope['method'], route.path if route is not None else UNMATCHED, status, perf_counter() - start, queries)
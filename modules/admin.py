@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Query
+from typing import Annotated
+from cache import response_cache, table_versions
+from queries import slow_queries
+
+router = APIRouter(prefix='/admin',tags=['Admin'])
+
+@router.get('/cache/',status_code=200,responses={
+    200:{
+            "description": "Statistics of the response cache",
+            "content": {
+                "application/json": {
+                    "example": {'hits':9120,'misses':310,'stale':41,'expired':12,'evictions':0,'entries':257,'size':2048,'ttl':300.0,
+                                'hit_ratio':0.967,'versions':{'Careers':3,'Students':118}}
+                }
+            }}
+})
+async def cache_stats():
+    """Hits, misses, stale and expired entries, evictions and the current table versions of the response cache"""
+    return {**response_cache.summary(), 'versions': table_versions.versions}
+
+@router.delete('/cache/',status_code=201)
+async def clear_cache():
+    """Drop every cached response and ETag, e.g. after writing to the database from outside the API"""
+    response_cache.clear()
+    table_versions.new_epoch()
+    return {'status_code':201,'message':'The response cache was cleared'}
+
+@router.get('/slow_queries/',status_code=200,responses={
+    200:{
+            "description": "Statement shapes that took the most time over the slow query threshold",
+            "content": {
+                "application/json": {
+                    "example": {'threshold_ms':100.0,'entries':12,'shapes':[{'shape':'SELECT "Students".id FROM "Students" WHERE "Students".gpa < ?',
+                                'count':9,'total_ms':1530.2,'mean_ms':170.0,'max_ms':260.4,'routes':['GET /students/obtain/'],
+                                'slowest':{'statement':'SELECT "Students".id FROM "Students" WHERE "Students".gpa < ?','parameters':[60],
+                                            'duration_ms':260.4,'route':'GET /students/obtain/','plan':['SCAN Students'],'time':'2024-01-12T10:31:02'}}]}
+                }
+            }}
+})
+async def slow_query_stats(limit : Annotated[int,Query(ge=1,le=100,description='Statement shapes returned')] = 20):
+    """The slow statements kept in the log grouped by shape, the ones that took the most time first"""
+    return {'threshold_ms': slow_queries.threshold * 1000, 'entries': len(slow_queries.entries), 'shapes': slow_queries.shapes(limit)}
+
+@router.delete('/slow_queries/',status_code=201)
+async def clear_slow_queries():
+    """Empty the slow query log"""
+    slow_queries.clear()
+    return {'status_code':201,'message':'The slow query log was cleared'}
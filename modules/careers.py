@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Body, HTTPException, Query, Depends
+from fastapi import APIRouter, Body, HTTPException, Query, Path, Depends
 from typing import Annotated, List, Union
-from sqlalchemy.exc import SQLAlchemyError
-from sql.connection import db_connection
-from schemes import Career_Scheme, Career_DB
-from sql.definition import Career, Teacher
-from utils import model_to_dict, Error400, Error404
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sql.connection import async_db_connection
+from schemes import Career_Scheme, Career_DB, Page
+from sql.definition import Career, Teacher, Student, Subject, Class
+from sql.stats import career_stats, stats_report
+from utils import model_to_dict, keyset_page, constraint_message, Error400, Error404
+from settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from cache import cached, table_versions
+from occupancy import reload_occupancy
+from schedules import schedules, schedule_cache, enrolled_students, drop_classes
+from student_store import student_store
 
 router = APIRouter(prefix='/careers',tags=['Career'])
 
@@ -25,23 +33,17 @@ router = APIRouter(prefix='/careers',tags=['Career'])
             }
         }
 })
-async def new_career(career: Annotated[Career_Scheme,Body], session = Depends(db_connection)):
+async def new_career(career: Annotated[Career_Scheme,Body], session : AsyncSession = Depends(async_db_connection)):
     """Creates a new career"""
     try:
-        career_dict = career.dict()
-        career_db = Career(**career_dict)
-        #Comprobe if the career name already exists
-        result = session.query(Career.name).filter_by(name=career_dict['name']).first()
-        if result is not None:
-            raise Error400("Career already exists in database")
-        session.add(career_db)
-        result = session.query(Career.id).filter_by(name=career_dict['name']).first() #Bring back the id from the database
-        if result:
-            session.commit()
-            return {'status_code':201,'message':'Career created successfully!', 'id':result[0]}
-        else:
-            session.rollback()
-            raise Exception("There was an error creating the career")
+        #The unique constraint of the name rejects the duplicates
+        try:
+            career_id = (await session.execute(insert(Career.__table__).values(career.dict()).returning(Career.id))).scalar_one()
+        except IntegrityError as e:
+            raise Error400(constraint_message(e, {'Careers.name': 'Career already exists in database'}))
+        await session.commit()
+        table_versions.bump(Career)
+        return {'status_code':201,'message':'Career created successfully!', 'id':career_id}
     except Error400 as e:
             raise HTTPException(status_code=400, detail={'message':str(e)})
     except SQLAlchemyError as e:
@@ -72,17 +74,19 @@ async def new_career(career: Annotated[Career_Scheme,Body], session = Depends(db
             }
         }}
 })
+@cached(Career)
 async def get_careers(name : Annotated[str | None,Query(max_length=40,example="Aviation")] = None,
                     id : Annotated[int | None,Query(ge=1,example=6)] = None,
-                    session = Depends(db_connection)) :
+                    session : AsyncSession = Depends(async_db_connection)) :
     """Search a signle career by name or id"""
     try:
         if name:
-            result = session.query(Career).filter(Career.name.ilike(f'%{name}%')).first()
+            statement = select(Career).filter(Career.name.ilike(f'%{name}%'))
         elif id:
-            result = session.query(Career).filter_by(id=id).first()
+            statement = select(Career).filter_by(id=id)
         else:
             raise Error400
+        result = (await session.execute(statement)).scalars().first()
         
         if result is None:
             raise Error404
@@ -98,35 +102,81 @@ async def get_careers(name : Annotated[str | None,Query(max_length=40,example="A
     except Exception as e:
         raise HTTPException(status_code=500,detail={'message': 'Function error', 'error':str(e)})
 
-@router.get('/obtain/',status_code=200, response_model = List[Career_DB], responses={
+@router.get('/obtain/',status_code=200, response_model = Page[Career_DB], responses={
      200:{
         "description": "Career items retrieved successfully",
         "content": {
             "application/json": {
-                "example": [
-                    {
-                        "id": 4,
-                        "name": "Robotics"
-                    },
-                    {
-                        "id": 37,
-                        "name": "Electronic engineering"
-                    },
-                    {
-                        "id": 122,
-                        "name": "Aviation"
-                    }
-                ]
+                "example": {
+                    "items": [
+                        {
+                            "id": 4,
+                            "name": "Robotics"
+                        },
+                        {
+                            "id": 37,
+                            "name": "Electronic engineering"
+                        },
+                        {
+                            "id": 122,
+                            "name": "Aviation"
+                        }
+                    ],
+                    "next": 122
+                }
+            }
+        }}
+})
+@cached(Career, etag=True)
+async def get_careers(limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of careers in the page')] = DEFAULT_PAGE_SIZE,
+                        after : Annotated[Union[int,None],Query(ge=0,description='Cursor returned as next by the previous page')] = None,
+                        session : AsyncSession = Depends(async_db_connection)) :
+    """Get the list of careers one page at a time"""
+    try:
+        result, next_cursor = await keyset_page(session, select(Career.__table__), Career.id, after, limit)
+        return {'items': result, 'next': next_cursor}
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560,detail={'message': 'SQLAlchemy error', 'error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500,detail={'message': 'Function error', 'error':str(e)})
+
+@router.get('/{career_id}/stats',status_code=200, responses={
+    200:{
+        "description": "Statistics of the career and of each of its semesters",
+        "content": {
+            "application/json": {
+                "example": {'careerId': 2, 'students': 2500, 'subjects': 40, 'gpaMean': 74.8, 'gpaStddev': 12.1,
+                            'semesters': [{'semester': 1, 'students': 260, 'subjects': 4, 'gpaMean': 75.3, 'gpaStddev': 11.6}]}
+            }
+        }},
+    404:{
+        "description": "Career item not found",
+        "content": {
+            "application/json": {
+                "example": {'detail':{'message':'The career with id 204 does not exist'}}
             }
         }}
 })
-async def get_careers(session = Depends(db_connection)) :
-    """Get list of all careers in existence"""
+@cached(Career, Student, Subject)
+async def career_stats_report(career_id : Annotated[int,Path(ge=1,example=2,description='Id of the career')],
+                                session : AsyncSession = Depends(async_db_connection)):
+    """Students, subjects and mean and standard deviation of the GPA of a career and of each of its semesters.
+    They come from the running sums kept by sql/stats.py, one indexed read whatever the size of the career"""
     try:
-        result = session.query(Career).all()
-        career_dicts = [model_to_dict(row) for row in result]
-        careers = [Career_DB(**c) for c in career_dicts]
-        return careers
+        statement = (select(Career.id, career_stats.c.semester, career_stats.c.students, career_stats.c.gpaSum,
+                            career_stats.c.gpaSquares, career_stats.c.subjects)
+                        .outerjoin(career_stats, career_stats.c.careerId == Career.id).filter(Career.id == career_id)
+                        .order_by(career_stats.c.semester))
+        rows = (await session.execute(statement)).all()
+        if not rows:
+            raise Error404
+        #A career without students nor subjects has no rows of statistics, only the one of the outer join
+        semesters = [row[1:] for row in rows if row.semester is not None]
+        totals = [sum(column) for column in zip(*semesters)][1:] if semesters else [0, 0.0, 0.0, 0]
+        return {'careerId': career_id, **stats_report(*totals),
+                'semesters': [{'semester': semester, **stats_report(*values)} for semester, *values in semesters]}
+    except Error404:
+        raise HTTPException(status_code=404,detail={'message': f'The career with id {career_id} does not exist'})
     except SQLAlchemyError as e:
         raise HTTPException(status_code=560,detail={'message': 'SQLAlchemy error', 'error':str(e)})
     except Exception as e:
@@ -157,18 +207,19 @@ async def get_careers(session = Depends(db_connection)) :
 })
 async def modify_career(career_id : Annotated[int,Query(ge=0,example=14,description="Id of the career to be modified")],
                         new_name: Annotated[str,Query(max_length=40, description="New name of the career")],
-                        session = Depends(db_connection)):
+                        session : AsyncSession = Depends(async_db_connection)):
     """Modify a career by the given id"""
     try:
-        #Get the name before replacing it
-        old_name = session.query(Career.name).filter_by(id=career_id).first()
+        #Get the name before replacing it, RETURNING only sees the new one
+        old_name = (await session.execute(select(Career.name).filter_by(id=career_id))).first()
         if old_name is None:
             raise Error404
-        result = session.query(Career).filter_by(id=career_id).update({Career.name: new_name})
+        result = (await session.execute(update(Career).filter_by(id=career_id).values({Career.name: new_name}))).rowcount
         if result != 1:
-            session.rollback()
-            raise Error400
-        session.commit()
+            #Deleted between both statements
+            raise Error404
+        await session.commit()
+        table_versions.bump(Career)
         return {'status_code': 201,'message': f'Success! Career {old_name[0]} renamed to {new_name}'}
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'There was an error updating the career'})
@@ -204,17 +255,29 @@ async def modify_career(career_id : Annotated[int,Query(ge=0,example=14,descript
             }}
 })
 async def delete_career(career_id : Annotated[int,Query(ge=0,example=203,description="Id of the career to be deleted")],
-                        session = Depends(db_connection)):
+                        session : AsyncSession = Depends(async_db_connection)):
     """Delete a career by the given id"""
     try:
-        career = session.query(Career.name).filter_by(id=career_id).first()
+        career = (await session.execute(select(Career.name).filter_by(id=career_id))).first()
         if career is None:
             raise Error404
-        result = session.query(Career).filter_by(id=career_id).delete()
+        #The cascade deletes the students of the career and the classes of its subjects, with their enrollments
+        class_ids = (await session.execute(select(Class.id).join(Subject, Subject.id == Class.idSubject).filter(Subject.careerId == career_id))).scalars().all()
+        students = await enrolled_students(session, class_ids)
+        career_students = (await session.execute(select(Student.id).filter_by(careerId=career_id))).scalars().all()
+        result = (await session.execute(delete(Career).filter_by(id=career_id))).rowcount
         if result != 1:
-            session.rollback()
+            await session.rollback()
             raise Error400
-        session.commit()
+        await session.commit()
+        table_versions.bump(Career, cascade=True)
+        #The subjects of the career and their classes were deleted by the cascade
+        await reload_occupancy()
+        for student_id in career_students:
+            schedules.forget_student(student_id)
+        await drop_classes(class_ids, students)
+        schedule_cache.clear()
+        student_store.remove_career(career_id)
         return {'status_code': 201,'message': f'Success! Career {career[0]} was deleted successfully'}
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'There was an error deleting the career'})
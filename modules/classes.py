@@ -1,58 +1,188 @@
 from fastapi import APIRouter, Body, HTTPException, Query, Depends
-from sqlalchemy.exc import SQLAlchemyError
-from sql.connection import db_connection
-from sqlalchemy.orm import Session
-from typing import Annotated, List
-from schemes import  Classes_Scheme, Classes_DB, Classes_Auxiliar
-from sql.definition import Class, Teacher, Subject
-from utils import model_to_dict, Error400, Error404
+from fastapi.responses import StreamingResponse, JSONResponse
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sql.connection import async_db_connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, List, Union
+from schemes import  Classes_Scheme, Classes_DB, Classes_Auxiliar, Bulk_Result, Timetable_Request, Page
+from sql.definition import Class, Teacher, Subject, Career, StudentClass
+from sql.seats import FULL_CLASS
+from utils import keyset_page, ndjson_stream, Error400, Error404, HOUR_PATTERN, constraint_message, partial_update
+from settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, EXPORT_CHUNK_SIZE, BULK_MAX_ITEMS, TIMETABLE_TIME_BUDGET
+from cache import cached, table_versions
+from occupancy import occupancy, slot_key
+from schedules import schedules, schedule_cache, refresh_students, hour_minutes
+from timetable import generate_timetable
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 import re
 
 router = APIRouter(prefix='/classes',tags=["Class"])
 
+#Columns of the class responses. The enrolled students change with every enrollment, which doesn't bump the
+#version of Classes, so the cached responses leave them out and /availability/ reports them
+CLASS_COLUMNS = [column for column in Class.__table__.columns if column.name != 'enrolled']
+
 @router.post('/create/',status_code=201)
-async def new_class(class_item : Annotated[Classes_Scheme,Body], session = Depends(db_connection)):
+async def new_class(class_item : Annotated[Classes_Scheme,Body], session : AsyncSession = Depends(async_db_connection)):
     try:
         class_item : Classes_Scheme
-        session : Session
+        session : AsyncSession
 
         #Hour in format hh:mm AM/PM
-        pattern = r'^\d{1,2}:\d{2} [APap][Mm]$'
         class_item.hour =class_item.hour.upper()
-        if not re.match(pattern,class_item.hour):
-            raise Error400("The hour isn't in format hh:mm AM/PM") 
-        #Check if teacher and subject exists
-        teacher = session.query(Teacher.id).filter_by(id = class_item.idTeacher).first()
-        if teacher is None:
-            raise Error400(f'The teacher with the ID {class_item.idTeacher} does not exist in the database')
-        subject = session.query(Subject.id).filter_by(id = class_item.idSubject).first()
-        if subject is None:
-            raise Error400(f'The subject with the ID {class_item.idSubject} does not exist in the database')
-
-        #Check if class group is unique
-        class_group = session.query(Class.groupNo).filter_by(groupNo = class_item.groupNo).first()
-        if class_group:
-            raise Error400('A class with the same group number already exists')
-
+        error = class_error(class_item)
+        if error:
+            raise Error400(error)
         #Check if the teacher is free in the indicated hour
-        teacher_class = session.query(Teacher.firstName,Teacher.secondName,Class.groupNo).\
-            filter(Class.hour == class_item.hour, Class.idTeacher == class_item.idTeacher).\
-                join(Class, Teacher.id == Class.idTeacher).first()
-        if teacher_class is not None:
+        owner = occupancy.slot_owner(class_item.idTeacher, class_item.hour)
+        if owner is not None:
+            #The owner is the class that has the slot, whatever the form its hour was written in
+            teacher_class = (await session.execute(select(Teacher.firstName,Teacher.secondName,Class.groupNo).\
+                filter(Class.id == owner).join(Class, Teacher.id == Class.idTeacher))).first() if isinstance(owner, int) else None
+            if teacher_class is None:
+                raise Error400('The teacher has already assigned to another class at the same hour')
             raise Error400(f"""The teacher {teacher_class[0]} {teacher_class[1]} has already assigned to the class
             number {teacher_class[2]} at the same hour """)
-            
-        class_dict = class_item.dict()
-        class_db = Class(**class_dict)
-        session.add(class_db)
-        record = session.query(Class.id).filter_by(groupNo = class_item.groupNo).first()
-        if record:
-            session.commit()
-            return {'status_code':201,'message':'Class registered successfully!', 'id':record[0]}
-        session.rollback()
-        raise SQLAlchemyError("There was an error registering the class")    
 
+        with occupancy.reservation(class_item.idTeacher, class_item.hour, class_item.groupNo):
+            #The constraints are still the last check for the rows the index can't see yet
+            try:
+                class_id = (await session.execute(insert(Class.__table__).values(class_item.dict()).returning(Class.id))).scalar_one()
+            except IntegrityError as e:
+                raise Error400(constraint_message(e, {'Classes.groupNo': 'A class with the same group number already exists',
+                                                        'FOREIGN KEY': 'The teacher or the subject does not exist in the database'}))
+            await session.commit()
+            table_versions.bump(Class)
+            occupancy.put(class_id, class_item.idTeacher, class_item.hour, class_item.groupNo)
+            schedules.set_class(class_id, class_item.hour)
+            return {'status_code':201,'message':'Class registered successfully!', 'id':class_id}
+
+    except Error400 as e:
+        raise HTTPException(status_code=400, detail = {'message': str(e)})
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
+
+
+def class_error(class_item : Classes_Scheme) -> Union[str,None]:
+    """First rule a new class breaks, checked against the occupancy index, except the teacher's schedule"""
+    if not re.match(HOUR_PATTERN,class_item.hour):
+        return "The hour isn't in format hh:mm AM/PM"
+    #Check if teacher and subject exists
+    if not occupancy.has_teacher(class_item.idTeacher):
+        return f'The teacher with the ID {class_item.idTeacher} does not exist in the database'
+    if not occupancy.has_subject(class_item.idSubject):
+        return f'The subject with the ID {class_item.idSubject} does not exist in the database'
+    #Check if class group is unique
+    if occupancy.group_owner(class_item.groupNo) is not None:
+        return 'A class with the same group number already exists'
+    return None
+
+
+@router.post('/validate/',status_code=200,response_model=List[Bulk_Result],responses={
+    200:{
+            "description": "Every proposed class was checked, each item has the status code /create/ would return",
+            "content": {
+                "application/json": {
+                    "example": [{'index':0,'status_code':201,'message':'The class can be registered','id':None},
+                                {'index':1,'status_code':400,'message':'The teacher with the ID 2003 has already assigned to the class number 340 at the same hour','id':None}]
+                }
+            }},
+    400:{
+        "description": "The list is empty or too big",
+                    "content": {
+                        "application/json": {
+                            "example": {'detail':{'message':'You must send between 1 and 10000 classes'}}
+                        }
+            }
+        }
+})
+async def validate_classes(classes : Annotated[List[Classes_Scheme],Body]):
+    """Check a batch of proposed classes against the registered ones and against each other, nothing is written"""
+    try:
+        if not classes or len(classes) > BULK_MAX_ITEMS:
+            raise Error400(f'You must send between 1 and {BULK_MAX_ITEMS} classes')
+        results = []
+        #Keys taken by the earlier items of the batch
+        batch_slots, batch_groups = {}, {}
+        for index, class_item in enumerate(classes):
+            class_item.hour = class_item.hour.upper()
+            slot = slot_key(class_item.idTeacher, class_item.hour)
+            error = class_error(class_item)
+            if error is None and class_item.groupNo in batch_groups:
+                error = f'The group number is repeated in the item {batch_groups[class_item.groupNo]}'
+            if error is None and occupancy.slot_owner(class_item.idTeacher, class_item.hour) is not None:
+                error = f'The teacher with the ID {class_item.idTeacher} has already assigned to the class number ' \
+                        f'{occupancy.classes[occupancy.slot_owner(class_item.idTeacher, class_item.hour)][2]} at the same hour'
+            if error is None and slot in batch_slots:
+                error = f'The teacher with the ID {class_item.idTeacher} has already assigned to the item {batch_slots[slot]} at the same hour'
+            if error:
+                results.append({'index': index, 'status_code': 400, 'message': error, 'id': None})
+                continue
+            batch_slots[slot] = index
+            batch_groups[class_item.groupNo] = index
+            results.append({'index': index, 'status_code': 201, 'message': 'The class can be registered', 'id': None})
+        return JSONResponse(status_code=200, content=results)
+    except Error400 as e:
+        raise HTTPException(status_code=400, detail = {'message': str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
+
+
+@router.post('/timetable/',status_code=200,responses={
+    200:{
+            "description": "Proposed timetable, nothing is written. The classes that couldn't be placed are listed with the reason",
+            "content": {
+                "application/json": {
+                    "example": {'status_code':200,'complete':False,
+                                'classes':[{'idSubject':13,'semester':1,'group':1,'hour':'07:00 AM','idTeacher':2003}],
+                                'unplaced':[{'idSubject':14,'semester':1,'group':1,'reason':'No teacher is free at the hours left for the semester group'}],
+                                'elapsed':0.8}
+                }
+            }},
+    400:{
+        "description": "The career doesn't exist or an hour isn't valid",
+                    "content": {
+                        "application/json": {
+                            "example": {'detail':{'message':"The hour 7am isn't in format hh:mm AM/PM"}}
+                        }
+            }
+        }
+})
+async def generate_classes_timetable(request : Annotated[Timetable_Request,Body], session : AsyncSession = Depends(async_db_connection)):
+    """Propose an hour and a teacher for one class of every subject of a career and every group of students, without
+    teacher double-booking (the registered classes included) and without clashes inside a semester group"""
+    try:
+        career = (await session.execute(select(Career.id).filter_by(id = request.careerId))).first()
+        if career is None:
+            raise Error400(f'The career with the id {request.careerId} does not exist in the database')
+        #Minute of the day -> hour, the hours written in two forms (9:00 AM and 09:00 AM) are one slot
+        slots = {}
+        for hour in request.slots:
+            hour = hour.upper()
+            if not re.match(HOUR_PATTERN, hour):
+                raise Error400(f"The hour {hour} isn't in format hh:mm AM/PM")
+            slots.setdefault(hour_minutes(hour), hour)
+        teachers = request.teachers if request.teachers else list(occupancy.teachers)
+        for teacher_id in teachers:
+            if not occupancy.has_teacher(teacher_id):
+                raise Error400(f'The teacher with the ID {teacher_id} does not exist in the database')
+
+        subjects = (await session.execute(select(Subject.id, Subject.semester).filter_by(careerId = request.careerId).order_by(Subject.id))).all()
+        semesters = dict(subjects)
+        classes = [((subject_id, group), (semester, group)) for subject_id, semester in subjects for group in range(1, request.groups + 1)]
+        #The index is copied here, the generator runs in the threadpool while other requests keep changing it
+        busy = [(teacher_id, slots[minutes]) for teacher_id, minutes in list(occupancy.slots) if minutes in slots]
+        result = await run_in_threadpool(generate_timetable, classes, list(slots.values()), teachers, busy, request.time_budget or TIMETABLE_TIME_BUDGET)
+        return {'status_code': 200, 'complete': not result['unplaced'],
+                'classes': [{'idSubject': subject_id, 'semester': semesters[subject_id], 'group': group, 'hour': hour, 'idTeacher': teacher_id}
+                            for (subject_id, group), (hour, teacher_id) in sorted(result['placed'].items())],
+                'unplaced': [{'idSubject': subject_id, 'semester': semesters[subject_id], 'group': group, 'reason': reason}
+                            for (subject_id, group), reason in sorted(result['unplaced'].items())],
+                'elapsed': result['elapsed']}
     except Error400 as e:
         raise HTTPException(status_code=400, detail = {'message': str(e)})
     except SQLAlchemyError as e:
@@ -62,15 +192,15 @@ async def new_class(class_item : Annotated[Classes_Scheme,Body], session = Depen
 
 
 @router.get('/search/',status_code=200, response_model=Classes_DB)
+@cached(Class)
 async def get_class(group_no: Annotated[int,Query(default=...,title='Group number',description='Number of the class group',gt=0)],
-                        session = Depends(db_connection)):
+                        session : AsyncSession = Depends(async_db_connection)):
     try:
-        session : Session
-        class_item = session.query(Class).filter_by(groupNo = group_no).first()
+        session : AsyncSession
+        class_item = (await session.execute(select(*CLASS_COLUMNS).filter_by(groupNo = group_no))).mappings().first()
         if not class_item:
             raise Error404
-        class_dict = model_to_dict(class_item)
-        return class_dict
+        return dict(class_item)
     except Error404 as e:
         raise HTTPException(status_code=404,detail={'message':f'The class with the group number #{group_no} does not exists'})
     except SQLAlchemyError as e:
@@ -79,88 +209,168 @@ async def get_class(group_no: Annotated[int,Query(default=...,title='Group numbe
         raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
 
 
-@router.get('/obtain/',status_code=200,response_model=List[Classes_DB])
-async def get_classes(session = Depends(db_connection)):
+@router.get('/obtain/',status_code=200,response_model=Page[Classes_DB])
+@cached(Class)
+async def get_classes(limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of classes in the page')] = DEFAULT_PAGE_SIZE,
+                        after : Annotated[Union[int,None],Query(ge=0,description='Cursor returned as next by the previous page')] = None,
+                        idTeacher : Annotated[Union[int,None],Query(ge=1,description='Only classes of this teacher')] = None,
+                        idSubject : Annotated[Union[int,None],Query(ge=1,description='Only classes of this subject')] = None,
+                        session : AsyncSession = Depends(async_db_connection)):
+    try:
+        session : AsyncSession
+        statement = select(*CLASS_COLUMNS)
+        if idTeacher:
+            statement = statement.filter_by(idTeacher = idTeacher)
+        if idSubject:
+            statement = statement.filter_by(idSubject = idSubject)
+        classes, next_cursor = await keyset_page(session, statement, Class.id, after, limit)
+        return {'items': classes, 'next': next_cursor}
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
+
+
+@router.get('/availability/',status_code=200,responses={
+    200:{
+            "description": "Seats of every class, ordered by id",
+            "content": {
+                "application/json": {
+                    "example": {'seats':35,'classes':[{'id':4,'groupNo':340,'hour':'02:00 PM','idSubject':13,'capacity':40,'enrolled':38,'seats':2},
+                                                      {'id':9,'groupNo':345,'hour':'03:00 PM','idSubject':14,'capacity':40,'enrolled':7,'seats':33}]}
+                }
+            }}
+})
+@cached(Class, Subject, StudentClass)
+async def get_availability(careerId : Annotated[Union[int,None],Query(ge=1,description='Only classes of the subjects of this career')] = None,
+                            semester : Annotated[Union[int,None],Query(ge=1,le=10,description='Only classes of the subjects of this semester')] = None,
+                            idSubject : Annotated[Union[int,None],Query(ge=1,description='Only classes of this subject')] = None,
+                            open_only : Annotated[bool,Query(description='Leave out the full classes')] = False,
+                            session : AsyncSession = Depends(async_db_connection)):
+    """Capacity, enrolled students and free seats of the classes. The counts are kept with the enrollments
+    (see sql/seats.py), so this is a single read of the classes without counting their students"""
     try:
-        session : Session
-        classes = session.query(Class).all()
-        classes_dict = [model_to_dict(class_item) for class_item in classes]
-        return classes_dict
+        session : AsyncSession
+        seats = (Class.capacity - Class.enrolled).label('seats')
+        statement = select(Class.id, Class.groupNo, Class.hour, Class.idSubject, Class.capacity, Class.enrolled, seats)
+        if careerId or semester:
+            statement = statement.join(Subject, Subject.id == Class.idSubject)
+            if careerId:
+                statement = statement.filter(Subject.careerId == careerId)
+            if semester:
+                statement = statement.filter(Subject.semester == semester)
+        if idSubject:
+            statement = statement.filter(Class.idSubject == idSubject)
+        if open_only:
+            statement = statement.filter(Class.enrolled < Class.capacity)
+        #The group numbers go from 100 to 999, so every class fits in one response
+        classes = [dict(row) for row in (await session.execute(statement.order_by(Class.id))).mappings()]
+        return {'seats': sum(class_item['seats'] for class_item in classes), 'classes': classes}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
     except Exception as e:
         raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
 
 
+@router.get('/export/',status_code=200,response_class=StreamingResponse,responses={
+    200:{
+            "description": "Classes as newline-delimited JSON, one class per line",
+            "content": {
+                "application/x-ndjson": {
+                    "example": '{"id": 4, "hour": "02:00 PM", "groupNo": 340, "idTeacher": 2003, "idSubject": 13}\n'
+                }
+            }}
+})
+async def export_classes(since : Annotated[Union[int,None],Query(ge=0,description='Only classes with an id greater than this one')] = None):
+    """Stream every class as newline-delimited JSON, ordered by id"""
+    statement = select(Class.__table__)
+    if since is not None:
+        statement = statement.where(Class.id > since)
+    return StreamingResponse(ndjson_stream(statement.order_by(Class.id), EXPORT_CHUNK_SIZE), media_type='application/x-ndjson')
+
+
+@router.get('/enrollments/export/',status_code=200,response_class=StreamingResponse,responses={
+    200:{
+            "description": "Student enrollments as newline-delimited JSON, one enrollment per line",
+            "content": {
+                "application/x-ndjson": {
+                    "example": '{"id": 81, "idStudent": 23003, "idClass": 4}\n'
+                }
+            }}
+})
+async def export_enrollments(since : Annotated[Union[int,None],Query(ge=0,description='Only enrollments with an id greater than this one')] = None):
+    """Stream every student-class enrollment as newline-delimited JSON, ordered by id"""
+    statement = select(StudentClass.__table__)
+    if since is not None:
+        statement = statement.where(StudentClass.id > since)
+    return StreamingResponse(ndjson_stream(statement.order_by(StudentClass.id), EXPORT_CHUNK_SIZE), media_type='application/x-ndjson')
+
+
 @router.put('/modify/',status_code=201,response_model=Classes_DB)
-async def modify_class( class_item: Annotated[Classes_Auxiliar,Body], session = Depends(db_connection)):
+async def modify_class( class_item: Annotated[Classes_Auxiliar,Body], session : AsyncSession = Depends(async_db_connection)):
     try:
-        session : Session
-        old_record : Class
+        session : AsyncSession
 
-        if not(class_item.groupNo or class_item.hour or class_item.idSubject or class_item.idTeacher):
+        if not(class_item.groupNo or class_item.hour or class_item.idSubject or class_item.idTeacher or class_item.capacity):
             raise Error400('You must specify at least one field that will be modified')
         
-        old_record = session.query(Class).filter_by(id = class_item.id).first()
-        if old_record is None:
+        #Teacher, hour and group of the class before the change, from the occupancy index
+        old_schedule = occupancy.classes.get(class_item.id)
+        if old_schedule is None:
             raise Error404
+        old_teacher, old_hour, old_group = old_schedule
         
         #If the user wants to modify the subject or teacher, we make sure that the ids exists
-        if class_item.idSubject:
-            subject = session.query(Subject.id).filter_by(id = class_item.idSubject).first()
-            if subject is None:
-                raise Error400(f'The subject with the id {class_item.idSubject} does not exists in the database')
-        if class_item.idTeacher:
-            teacher = session.query(Teacher.id).filter_by( id = class_item.idTeacher).first()
-            if teacher is None:
-                raise Error400(f'The teacher with the id {class_item.idTeacher} does not exists in the database')
+        if class_item.idSubject and not occupancy.has_subject(class_item.idSubject):
+            raise Error400(f'The subject with the id {class_item.idSubject} does not exists in the database')
+        if class_item.idTeacher and not occupancy.has_teacher(class_item.idTeacher):
+            raise Error400(f'The teacher with the id {class_item.idTeacher} does not exists in the database')
 
         #Check if the new group number has not been assigned yet
-        if class_item.groupNo:
-            group_class = session.query(Class.id).filter(Class.groupNo == class_item.groupNo, Class.id != class_item.id).first()
-            if group_class:
-                raise Error400(f'The group number #{class_item.groupNo} has already been assigned to another class')
+        if class_item.groupNo and occupancy.group_owner(class_item.groupNo) not in (None, class_item.id):
+            raise Error400(f'The group number #{class_item.groupNo} has already been assigned to another class')
 
         if class_item.hour:
-            pattern = r'^\d{1,2}:\d{2} [APap][Mm]$'
             class_item.hour =class_item.hour.upper()
-            if not re.match(pattern,class_item.hour):
+            if not re.match(HOUR_PATTERN,class_item.hour):
                 raise Error400("The hour isn't in format hh:mm AM/PM") 
 
-        if class_item.idTeacher or class_item.hour:
-            #If the user wants to modify some teacher or schedule of a class, we will use this dictionary 
-            #with the original values, which will change according to user input, this dictionary will help us 
-            #to check if the final teacher and the hour of the record do not collide with another record
-            final_schedule = {'id':old_record.id,
-                                'teacher_id':old_record.idTeacher,
-                                'hour':old_record.hour}
-            if class_item.idTeacher:
-                final_schedule['teacher_id'] = class_item.idTeacher
-            if class_item.hour:
-                final_schedule['hour'] = class_item.hour
-            teacher_class = session.query(Class.id).filter(Class.hour == final_schedule['hour'],\
-                                Class.idTeacher == final_schedule['teacher_id'], Class.id != final_schedule['id']).first()
-            if teacher_class:
-                raise Error400(f'Cannot update the teacher/schedule of the class, the teacher with the id {final_schedule["teacher_id"]}\
-                     is busy in another class at the same time')
-
-        modified_class = session.query(Class).filter_by(id = class_item.id).update({
-            Class.groupNo: class_item.groupNo if class_item.groupNo else old_record.groupNo,
-            Class.hour: class_item.hour if class_item.hour else old_record.hour,
-            Class.idSubject: class_item.idSubject if class_item.id else old_record.idSubject,
-            Class.idTeacher: class_item.idTeacher if class_item.idTeacher else old_record.idTeacher
-        })
-
-        if modified_class != 1:
-            session.rollback()
-            raise Error400("There was an error while updating the record")
-        session.commit()
-          
-        new_record = session.query(Class).filter_by(id = class_item.id).first()
-        new_class = Classes_DB(**model_to_dict(new_record))
-        return new_class
+        #Final teacher, hour and group of the record, they are checked and reserved together
+        final_schedule = {'teacher_id': class_item.idTeacher if class_item.idTeacher else old_teacher,
+                            'hour': class_item.hour if class_item.hour else old_hour,
+                            'group_no': class_item.groupNo if class_item.groupNo else old_group}
+        if occupancy.slot_owner(final_schedule['teacher_id'], final_schedule['hour']) not in (None, class_item.id):
+            raise Error400(f'Cannot update the teacher/schedule of the class, the teacher with the id {final_schedule["teacher_id"]}\
+                 is busy in another class at the same time')
+
+        #The students of the class can't have another class at the new hour
+        students = []
+        if class_item.hour and class_item.hour != old_hour:
+            students = (await session.execute(select(StudentClass.idStudent).filter_by(idClass = class_item.id))).scalars().all()
+            busy = schedules.busy_student(students, class_item.id, class_item.hour)
+            if busy is not None:
+                raise Error400(f'Cannot move the class to {class_item.hour}, the student with the id {busy} has another class at that hour')
+
+        with occupancy.reservation(final_schedule['teacher_id'], final_schedule['hour'], final_schedule['group_no']):
+            try:
+                new_record = (await session.execute(partial_update(Class, class_item.id, class_item))).mappings().first()
+            except IntegrityError as e:
+                raise Error400(constraint_message(e, {FULL_CLASS: 'The capacity is less than the students already enrolled in the class'}))
+            if new_record is None:
+                raise Error404
+            await session.commit()
+            table_versions.bump(Class)
+            occupancy.put(class_item.id, final_schedule['teacher_id'], final_schedule['hour'], final_schedule['group_no'])
+        schedule_cache.invalidate_class(class_item.id)
+        if class_item.hour and class_item.hour != old_hour:
+            #The students of the class have it at another hour now
+            schedules.set_class(class_item.id, class_item.hour)
+            await refresh_students(students)
+        return Classes_DB(**new_record)
     except Error400 as e:
         raise HTTPException(status_code=400, detail = {'message': str(e)})
+    except Error404:
+        raise HTTPException(status_code=404, detail = {'message': 'Record not found in the database'})
     except SQLAlchemyError as e:
         raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
     except Exception as e:
@@ -168,18 +378,25 @@ async def modify_class( class_item: Annotated[Classes_Auxiliar,Body], session =
 
 @router.delete('/erase/',status_code=201,responses={})
 async def delete_class(class_id : Annotated[int,Query(title='Id class',description='Id of the class to be deleted',ge=1,example=1203)],
-                        session = Depends(db_connection)):
+                        session : AsyncSession = Depends(async_db_connection)):
     try:
-        session : Session
-        class_item = session.query(Class).filter_by(id = class_id).first()
+        session : AsyncSession
+        class_item = (await session.execute(select(Class).filter_by(id = class_id))).scalars().first()
         if class_item is None:
             raise Error400
 
-        deleted_class = session.query(Class).filter_by(id = class_id).delete()
+        #The enrollments go away with the class, so the schedules of its students change
+        students = (await session.execute(select(StudentClass.idStudent).filter_by(idClass = class_id))).scalars().all()
+        deleted_class = (await session.execute(delete(Class).filter_by(id = class_id))).rowcount
         if deleted_class != 1:
-            session.rollback()
+            await session.rollback()
             raise Error400
-        session.commit()
+        await session.commit()
+        table_versions.bump(Class, cascade=True)
+        occupancy.remove(class_id)
+        schedules.remove_class(class_id)
+        schedule_cache.invalidate_class(class_id)
+        await refresh_students(students)
         return {'status_code':201,'message':f'Success! The class with the id {class_id} was deleted succesfully'}
     except Error400:
         raise HTTPException(status_code=400,detail={'message':'There was an error deleting the class'})
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import SQLAlchemyError
+from typing import Annotated, Union
+from sql.definition import engine
+from sql.importer import import_school, ORDER, TABLES
+from settings import IMPORT_CHUNK_SIZE, IMPORT_MAX_ERRORS
+from utils import Error400
+from occupancy import reload_occupancy
+from schedules import reload_classes
+from student_store import reload_student_store
+from cache import table_versions
+import codecs
+
+router = APIRouter(prefix='/imports',tags=['Import'])
+
+@router.post('/school/',status_code=201,responses={
+    201:{
+            "description": "Files imported, the rows that couldn't be imported are listed in errors",
+            "content": {
+                "application/json": {
+                    "example": {'status_code':201,
+                                'summary':{'careers':{'processed':12,'inserted':12,'rejected':0},
+                                            'students':{'processed':40210,'inserted':40208,'rejected':2}},
+                                'errors':[{'table':'students','line':913,'error':'A student with the same student id is already registered',
+                                            'row':{"firstName": "Ana", "secondName": "Lopez", "studentId": "19930", "birthday": "2002-04-11", "semester": "1", "gpa": "70", "career": "Aviation"}}],
+                                'errors_truncated':False}
+                }
+            }},
+    400:{
+            "description": "No file was sent",
+            "content": {
+                "application/json": {
+                    "example": {'detail':{'message':'You must send at least one CSV file'}}
+                }
+            }}
+})
+async def import_school_files(careers : Annotated[Union[UploadFile,None],File(description='CSV with the column name')] = None,
+                                subjects : Annotated[Union[UploadFile,None],File(description='CSV with the columns name, semester, career')] = None,
+                                teachers : Annotated[Union[UploadFile,None],File(description='CSV with the columns employeeId, firstName, secondName')] = None,
+                                classes : Annotated[Union[UploadFile,None],File(description='CSV with the columns hour, groupNo, employeeId, subject')] = None,
+                                students : Annotated[Union[UploadFile,None],File(description='CSV with the columns firstName, secondName, studentId, birthday, semester, gpa, career')] = None):
+    """Import a whole school from CSV files, streamed in dependency order and written in chunked transactions"""
+    try:
+        uploads = {'careers': careers, 'subjects': subjects, 'teachers': teachers, 'classes': classes, 'students': students}
+        #The uploads are spooled to disk by Starlette, they are decoded while they are read
+        sources = {table: codecs.getreader('utf-8-sig')(upload.file) for table, upload in uploads.items() if upload is not None}
+        if not sources:
+            raise Error400('You must send at least one CSV file')
+        errors = []
+
+        def on_error(table : str, line : int, message : str, row : dict):
+            #Only the first rejected rows are kept, the summary has the full count
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({'table': table, 'line': line, 'error': message, 'row': row})
+
+        #The importer uses the synchronous engine, so it runs in the threadpool to keep the event loop free
+        summary = await run_in_threadpool(import_school, engine, sources, IMPORT_CHUNK_SIZE, on_error)
+        table_versions.bump(*[TABLES[table][0] for table in summary])
+        await reload_occupancy()
+        #The imports don't write enrollments, only the new classes are added to the schedules
+        if 'classes' in summary:
+            await reload_classes()
+        if 'students' in summary:
+            await reload_student_store()
+        truncated = sum(table['rejected'] for table in summary.values()) > len(errors)
+        return {'status_code': 201, 'summary': summary, 'errors': errors, 'errors_truncated': truncated}
+    except Error400 as e:
+        raise HTTPException(status_code=400, detail = {'message': str(e)})
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Annotated, List, Union
+from student_store import student_store
+
+router = APIRouter(prefix='/reports',tags=['Reports'])
+
+@router.get('/gpa_percentiles/',status_code=200,responses={
+    200:{
+            "description": "GPA percentiles of every career and semester",
+            "content": {
+                "application/json": {
+                    "example": {'students':1200,'groups':[{'careerId':1,'semester':3,'students':1200,
+                                'percentiles':{'10':61.5,'25':70.2,'50':80.0,'75':88.4,'90':94.1}}]}
+                }
+            }},
+    400:{
+            "description": "A percentile out of range",
+            "content": {
+                "application/json": {
+                    "example": {'detail':{'message':'The percentiles must be between 0 and 100'}}
+                }
+            }}
+})
+async def gpa_percentiles(careerId : Annotated[Union[int,None],Query(ge=1,example=2,description='Only the students of this career')] = None,
+                            semester : Annotated[Union[int,None],Query(ge=1,le=10,example=3,description='Only the students of this semester')] = None,
+                            percentiles : Annotated[List[float],Query(description='Percentiles to compute, from 0 to 100')] = [10, 25, 50, 75, 90]):
+    """GPA percentiles of the students of every career and semester, from the in-memory columns of the students"""
+    try:
+        if not all(0 <= percentile <= 100 for percentile in percentiles):
+            raise HTTPException(status_code=400,detail={'message': 'The percentiles must be between 0 and 100'})
+        groups = student_store.gpa_percentiles(percentiles, careerId, semester)
+        return {'students': sum(group['students'] for group in groups), 'groups': groups}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail={'message': 'Function error', 'error':str(e)})
+
+@router.get('/birth_years/',status_code=200,responses={
+    200:{
+            "description": "Students born every year",
+            "content": {
+                "application/json": {
+                    "example": {'students':2400,'years':[{'year':2001,'students':1100},{'year':2002,'students':1300}]}
+                }
+            }}
+})
+async def birth_years(careerId : Annotated[Union[int,None],Query(ge=1,example=2,description='Only the students of this career')] = None):
+    """How many students were born every year"""
+    try:
+        years = student_store.birth_year_counts(careerId)
+        return {'students': sum(year['students'] for year in years), 'years': years}
+    except Exception as e:
+        raise HTTPException(status_code=500,detail={'message': 'Function error', 'error':str(e)})
+
+@router.get('/at_risk/',status_code=200,responses={
+    200:{
+            "description": "Students below the GPA threshold, the lowest first",
+            "content": {
+                "application/json": {
+                    "example": {'threshold':60.0,'students':87,'items':[{'id':1402,'careerId':2,'semester':3,'gpa':41.5}]}
+                }
+            }}
+})
+async def at_risk(threshold : Annotated[float,Query(ge=0,le=100,example=60,description='Students with a GPA below this one')] = 60,
+                    careerId : Annotated[Union[int,None],Query(ge=1,example=2,description='Only the students of this career')] = None,
+                    semester : Annotated[Union[int,None],Query(ge=1,le=10,example=3,description='Only the students of this semester')] = None,
+                    limit : Annotated[int,Query(ge=1,le=10000,description='Students returned, the count covers all of them')] = 100):
+    """Students whose GPA is below the threshold, the lowest GPA first"""
+    try:
+        count, items = student_store.at_risk(threshold, careerId, semester, limit)
+        return {'threshold': threshold, 'students': count, 'items': items}
+    except Exception as e:
+        raise HTTPException(status_code=500,detail={'message': 'Function error', 'error':str(e)})
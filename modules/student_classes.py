@@ -1,23 +1,167 @@
 from fastapi import APIRouter, Body, HTTPException, Query, Depends
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from typing import Annotated, List
-from sql.connection import db_connection
+from sql.connection import async_db_connection
 from sql.definition import Class,StudentClass,Student
-from sqlalchemy.orm.session import Session
+from sql.seats import FULL_CLASS
+from sqlalchemy.ext.asyncio import AsyncSession
 from utils import Error400,Error404
+from settings import BULK_MAX_ITEMS
+from schedules import schedules, schedule_cache, refresh_students
+from cache import table_versions
 
 router = APIRouter(prefix='/student_classes',tags=['Student Classes'])
 
-@router.post('/create/',status_code=200,responses={})
+@router.post('/create/',status_code=201,responses={
+    201:{
+            "description": "Student enrolled in the class",
+            "content": {
+                "application/json": {
+                    "example": {'status_code':201,'message':'Student enrolled successfully!','id':81}
+                }
+            }},
+    400:{
+        "description": "The student or the class don't exist, the class is full or the student has another class at the same hour",
+                    "content": {
+                        "application/json": {
+                            "example": {'detail':{'message':'The student already has the class number 340 at the same hour'}}
+                        }
+            }
+        }
+})
 async def new_student_class(student_id : Annotated[int,Query(default=...,title='Student ID',description='Database id of the student to be enrrolled',ge=1,example=102)],
                             class_id : Annotated[int,Query(default=...,title='Class ID',description='Database id of the class',ge=1,example=947)],
-                            session : Session = Depends(db_connection)):
-    pass
-
-def check_disponibility(student_id : int, class_id : int, session : Session) ->bool:
-    class_schedule : str = session.query(Class.hour).filter(Class.id == class_id).first() 
-    class_at_same_hour = session.query(Class.id).\
-                        filter(Class.hour == class_schedule, Class.id != class_id,
-                                     StudentClass.idStudent == student_id).\
-                        join(StudentClass, Class.id == StudentClass.idStudent).first()
-    return true if class_at_same_hour is not None else false 
\ No newline at end of file
+                            session : AsyncSession = Depends(async_db_connection)):
+    """Enroll a student in a class if they are free at the hour of the class"""
+    try:
+        ids = await enroll(session, student_id, [class_id])
+        return {'status_code':201,'message':'Student enrolled successfully!','id':ids[0]}
+    except Error400 as e:
+        raise HTTPException(status_code=400, detail = {'message': str(e)})
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
+
+
+@router.post('/create/bulk',status_code=201,responses={
+    201:{
+            "description": "Student enrolled in every class",
+            "content": {
+                "application/json": {
+                    "example": {'status_code':201,'message':'Student enrolled successfully in 6 classes!','ids':[81,82,83,84,85,86]}
+                }
+            }},
+    400:{
+        "description": "One of the classes can't be taken, the student isn't enrolled in any of them",
+                    "content": {
+                        "application/json": {
+                            "example": {'detail':{'message':'The class 12 is at the same hour than another class of the list'}}
+                        }
+            }
+        }
+})
+async def new_student_classes(student_id : Annotated[int,Query(default=...,title='Student ID',description='Database id of the student to be enrrolled',ge=1,example=102)],
+                                class_ids : Annotated[List[int],Body(description='Database ids of the classes',example=[4,12,947])],
+                                session : AsyncSession = Depends(async_db_connection)):
+    """Enroll a student in many classes at once, either in all of them or in none"""
+    try:
+        if not class_ids or len(class_ids) > BULK_MAX_ITEMS:
+            raise Error400(f'You must send between 1 and {BULK_MAX_ITEMS} classes')
+        ids = await enroll(session, student_id, class_ids)
+        return {'status_code':201,'message':f'Student enrolled successfully in {len(ids)} classes!','ids':ids}
+    except Error400 as e:
+        raise HTTPException(status_code=400, detail = {'message': str(e)})
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
+
+
+@router.delete('/erase/',status_code=201,responses={
+    201:{
+            "description": "Student removed from the class",
+            "content": {
+                "application/json": {
+                    "example": {'status_code':201,'message':'Success! The student 102 was removed from the class 947'}
+                }
+            }},
+    404:{
+            "description": "The student isn't enrolled in the class",
+            "content": {
+                "application/json": {
+                    "example": {'detail':{'message':'The student 102 is not enrolled in the class 947'}}
+                }
+            }}
+})
+async def delete_student_class(student_id : Annotated[int,Query(default=...,title='Student ID',description='Database id of the student',ge=1,example=102)],
+                                class_id : Annotated[int,Query(default=...,title='Class ID',description='Database id of the class',ge=1,example=947)],
+                                session : AsyncSession = Depends(async_db_connection)):
+    """Remove a student from a class"""
+    try:
+        result = (await session.execute(delete(StudentClass).filter_by(idStudent = student_id, idClass = class_id))).rowcount
+        if result == 0:
+            raise Error404
+        await session.commit()
+        table_versions.bump(StudentClass)
+        await refresh_students([student_id])
+        schedule_cache.invalidate(student_id)
+        return {'status_code':201,'message':f'Success! The student {student_id} was removed from the class {class_id}'}
+    except Error404:
+        raise HTTPException(status_code=404,detail={'message': f'The student {student_id} is not enrolled in the class {class_id}'})
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
+
+
+async def enroll(session : AsyncSession, student_id : int, class_ids : List[int]) -> List[int]:
+    """Writes the enrollments of a student in one transaction, returns their ids. The schedule is
+    checked with the bitset index, only the student existence and the error messages need queries"""
+    student = (await session.execute(select(Student.id).filter_by(id = student_id))).first()
+    if student is None:
+        raise Error400(f'The student with the id {student_id} does not exist in the database')
+    for class_id in class_ids:
+        if not schedules.has_class(class_id):
+            raise Error400(f'The class with the id {class_id} does not exist in the database')
+    colliding = schedules.conflicts(student_id, class_ids)
+    if colliding:
+        raise Error400(await conflict_message(session, student_id, class_ids, colliding[0]))
+
+    with schedules.enrollment(student_id, class_ids):
+        #The triggers of sql/seats.py count the new students of every class and abort if one of them is full
+        try:
+            inserted = await session.execute(insert(StudentClass.__table__).returning(StudentClass.id),
+                                                [{'idStudent': student_id, 'idClass': class_id} for class_id in class_ids])
+            ids = list(inserted.scalars())
+        except IntegrityError as e:
+            if FULL_CLASS not in str(e.orig):
+                raise
+            await session.rollback()
+            raise Error400(await full_message(session, class_ids))
+        await session.commit()
+        table_versions.bump(StudentClass)
+    schedule_cache.invalidate(student_id)
+    return ids
+
+
+async def conflict_message(session : AsyncSession, student_id : int, class_ids : List[int], position : int) -> str:
+    """Explains the conflict of the class at the given position, only runs when the enrollment is rejected"""
+    class_id = class_ids[position]
+    bit = schedules.class_bits[class_id]
+    enrolled = (await session.execute(select(Class.id, Class.groupNo).join(StudentClass, StudentClass.idClass == Class.id).\
+                    filter(StudentClass.idStudent == student_id))).all()
+    for other_id, group_no in enrolled:
+        if other_id == class_id:
+            return f'The student is already enrolled in the class {class_id}'
+        if schedules.class_bits.get(other_id, 0) & bit:
+            return f'The student already has the class number {group_no} at the same hour'
+    return f'The class {class_id} is at the same hour than another class of the list'
+
+
+async def full_message(session : AsyncSession, class_ids : List[int]) -> str:
+    """Names the full class of a rejected enrollment, only runs when the enrollment is rejected"""
+    full = (await session.execute(select(Class.groupNo).filter(Class.id.in_(class_ids), Class.enrolled >= Class.capacity).\
+                order_by(Class.id).limit(1))).scalar()
+    return f'The class number {full} is full' if full is not None else 'The class is full'
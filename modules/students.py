@@ -1,14 +1,22 @@
 
-from fastapi import APIRouter, Depends, Query, Body, HTTPException
-from typing import Annotated, List
-from utils import model_to_dict
-from sqlalchemy import or_
-from sqlalchemy.exc import SQLAlchemyError
-from sql.connection import db_connection
-from schemes import Student_Auxiliar, Student_DB, Student_Scheme
-from sql.definition import Student
-from utils import Error400, Error404
-from datetime import datetime
+from fastapi import APIRouter, Depends, Query, Body, Path, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from typing import Annotated, List, Union
+from utils import keyset_page, offset_page, ndjson_stream, chunks
+from sqlalchemy import or_, select, delete, insert, tuple_
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sql.connection import async_db_connection
+from schemes import Student_Auxiliar, Student_DB, Student_Scheme, Student_Schedule, Page, Bulk_Result
+from sql.definition import Student, Career, StudentClass, Class, Subject, Teacher
+from sql.search import students_search, names_expression, matches
+from utils import insert_unless, partial_update, constraint_message, Error400, Error404
+from datetime import datetime, date
+import orjson
+from settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, EXPORT_CHUNK_SIZE, BULK_MAX_ITEMS
+from cache import cached, table_versions
+from schedules import schedules, schedule_cache, hour_order
+from student_store import student_store
 
 router = APIRouter(prefix="/students",tags=["Student"])
 
@@ -29,31 +37,98 @@ router = APIRouter(prefix="/students",tags=["Student"])
             }
         }
 })
-async def new_student(student :Annotated[Student_Scheme,Body],session = Depends(db_connection)):
+async def new_student(student :Annotated[Student_Scheme,Body],session : AsyncSession = Depends(async_db_connection)):
     """Create a new student"""
     try:
         student : Student_Scheme
-        
-        #Check if student exists
-        result = session.query(Student).filter_by(firstName = student.firstName, secondName = student.secondName).first()
-        if result:
-            raise Error400('A student with the same name is already registered')
-        result = session.query(Student).filter_by(studentId = student.studentId).first()
-        if result:
-            raise Error400('A student with the same student id is already registered')
-        #Parse the date string from request to date
-        birthday = datetime.strptime(student.birthday,'%Y-%m-%d')
-        student.birthday = birthday.date()
         student_dict = student.dict()
-        student_db = Student(**student_dict)
-        session.add(student_db) 
-        result = session.query(Student.id).filter_by(firstName = student.firstName, secondName = student.secondName).first()
+        student_dict['birthday'] = datetime.strptime(student.birthday,'%Y-%m-%d').date()
+        #The names aren't a constraint of the table, the insert is skipped if they are taken;
+        #the constraints reject a repeated student id and a career that doesn't exist
+        try:
+            student_id = (await session.execute(insert_unless(Student, student_dict,
+                            Student.firstName == student.firstName, Student.secondName == student.secondName))).scalar()
+        except IntegrityError as e:
+            raise Error400(constraint_message(e, {'Students.studentId': 'A student with the same student id is already registered',
+                                                    'FOREIGN KEY': f'The career with the id {student.careerId} does not exist in the database'}))
+        if student_id is None:
+            raise Error400('A student with the same name is already registered')
+        await session.commit()
+        table_versions.bump(Student)
+        student_store.put(student_id, student.careerId, student.semester, student.gpa, student_dict['birthday'])
+        return {'status_code':201,'message':'Student registered successfully!', 'id':student_id}
+    except Error400 as e:
+        raise HTTPException(status_code=400, detail = {'message': str(e)})
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560, detail = {'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
+
+@router.post('/create/bulk',status_code=201,response_model=List[Bulk_Result],responses={
+    201:{
+            "description": "Every student was processed, each item has the status code the single endpoint would return",
+            "content": {
+                "application/json": {
+                    "example": [{'index':0,'status_code':201,'message':'Student registered successfully!','id':88},
+                                {'index':1,'status_code':400,'message':'A student with the same student id is already registered','id':None}]
+                }
+            }},
+    400:{
+        "description": "The list is empty or too big",
+                    "content": {
+                        "application/json": {
+                            "example": {'detail':{'message':'You must send between 1 and 10000 students'}}
+                        }
+            }
+        }
+})
+async def new_students(students : Annotated[List[Student_Scheme],Body], session : AsyncSession = Depends(async_db_connection)):
+    """Create many students at once, the valid ones are inserted in a single transaction"""
+    try:
+        if not students or len(students) > BULK_MAX_ITEMS:
+            raise Error400(f'You must send between 1 and {BULK_MAX_ITEMS} students')
 
-        if result:
-            session.commit()
-            return {'status_code':201,'message':'Student registered successfully!', 'id':result[0]}
-        session.rollback()
-        raise Exception("There was an error registering the student")       
+        #Duplicates are checked with one query per chunk of the batch instead of two queries per student
+        names = list({(student.firstName, student.secondName) for student in students})
+        student_ids = list({student.studentId for student in students})
+        career_ids = list({student.careerId for student in students})
+        taken_names, taken_ids, careers = set(), set(), set()
+        for chunk in chunks(names):
+            rows = await session.execute(select(Student.firstName, Student.secondName).where(tuple_(Student.firstName, Student.secondName).in_(chunk)))
+            taken_names.update(tuple(row) for row in rows)
+        for chunk in chunks(student_ids):
+            taken_ids.update((await session.execute(select(Student.studentId).where(Student.studentId.in_(chunk)))).scalars())
+        for chunk in chunks(career_ids):
+            careers.update((await session.execute(select(Career.id).where(Career.id.in_(chunk)))).scalars())
+
+        results = {}
+        new_rows = []
+        for index, student in enumerate(students):
+            name = (student.firstName, student.secondName)
+            if name in taken_names:
+                results[index] = {'index': index, 'status_code': 400, 'message': 'A student with the same name is already registered', 'id': None}
+            elif student.studentId in taken_ids:
+                results[index] = {'index': index, 'status_code': 400, 'message': 'A student with the same student id is already registered', 'id': None}
+            elif student.careerId not in careers:
+                results[index] = {'index': index, 'status_code': 400, 'message': f'The career with the id {student.careerId} does not exist in the database', 'id': None}
+            else:
+                #Later items of the batch with the same name or student id are duplicates of this one
+                taken_names.add(name)
+                taken_ids.add(student.studentId)
+                student_dict = student.dict()
+                student_dict['birthday'] = datetime.strptime(student.birthday,'%Y-%m-%d').date()
+                new_rows.append((index, student_dict))
+
+        if new_rows:
+            inserted = await session.execute(insert(Student.__table__).returning(Student.id, Student.studentId), [row for _, row in new_rows])
+            new_ids = {student_id: id for id, student_id in inserted}
+            await session.commit()
+            table_versions.bump(Student)
+            for index, row in new_rows:
+                results[index] = {'index': index, 'status_code': 201, 'message': 'Student registered successfully!', 'id': new_ids[row['studentId']]}
+                student_store.put(new_ids[row['studentId']], row['careerId'], row['semester'], row['gpa'], row['birthday'])
+        #The results are built here, returning the response directly skips validating thousands of them again
+        return JSONResponse(status_code=201, content=[results[index] for index in range(len(students))])
     except Error400 as e:
         raise HTTPException(status_code=400, detail = {'message': str(e)})
     except SQLAlchemyError as e:
@@ -61,7 +136,7 @@ async def new_student(student :Annotated[Student_Scheme,Body],session = Depends(
     except Exception as e:
         raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
   
-@router.get('/search/',status_code=200,response_model=Student_DB, responses={
+@router.get('/search/',status_code=200,response_model=Page[Student_DB], responses={
     400:{
             "description": "Bad request",
             "content": {
@@ -77,28 +152,34 @@ async def new_student(student :Annotated[Student_Scheme,Body],session = Depends(
                 }
             }}
 })
-async def get_student(student : Annotated[Student_Auxiliar,Body], session = Depends(db_connection)):
-    """Search one student in the database"""
+@cached(Student)
+async def get_student(student : Annotated[Student_Auxiliar,Body],
+                        limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of students in the page')] = DEFAULT_PAGE_SIZE,
+                        offset : Annotated[int,Query(ge=0,description='Cursor returned as next by the previous page')] = 0,
+                        session : AsyncSession = Depends(async_db_connection)):
+    """Search students by their names (best matches first) or by their ids"""
     try:
         student : Student_Auxiliar
-        if student.firstName and student.secondName:
-            result = session.query(Student).filter(Student.firstName.ilike(f'%{student.firstName}%'),
-                                            Student.secondName.ilike(f'%{student.secondName}')).first()
-        elif student.firstName or student.secondName:
-            result = session.query(Student).filter(or_(Student.firstName.ilike(f'%{student.firstName}%'),
-                                            Student.secondName.ilike(f'%{student.secondName}'))).first()
+        if student.firstName or student.secondName:
+            #Every word of the names is matched as a prefix in the full-text index
+            expression = names_expression(student.firstName, student.secondName)
+            if not expression:
+                raise Error404
+            statement = select(Student.__table__).join(students_search, students_search.c.rowid == Student.id).\
+                filter(matches(students_search, expression)).\
+                    order_by(students_search.c.rank, Student.id)
         elif student.studentId:
-            result = session.query(Student).filter_by(studentId = student.studentId).first()
+            statement = select(Student.__table__).filter_by(studentId = student.studentId)
         elif student.id:
-            result = session.query(Student).filter_by(id = student.id).first()
+            statement = select(Student.__table__).filter_by(id = student.id)
         else:
             raise Error400
+        results, next_cursor = await offset_page(session, statement, offset, limit)
         
-        if result is None:
+        if not results and offset == 0:
             raise Error404
 
-        student_db = Student_DB(**model_to_dict(result))
-        return student_db
+        return {'items': results, 'next': next_cursor}
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'You must provide either name(s) or id for the student to be returned'})
     except Error404:
@@ -108,18 +189,91 @@ async def get_student(student : Annotated[Student_Auxiliar,Body], session = Depe
     except Exception as e:
         raise HTTPException(status_code=560,detail={'message': 'Function error', 'error':str(e)})
 
-@router.get('/obtain/',status_code=200, response_model=List[Student_DB])
-async def get_students(session=Depends(db_connection)):
-    """Get a full list of students"""
+@router.get('/obtain/',status_code=200, response_model=Page[Student_DB])
+@cached(Student)
+async def get_students(limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of students in the page')] = DEFAULT_PAGE_SIZE,
+                        after : Annotated[Union[int,None],Query(ge=0,description='Cursor returned as next by the previous page')] = None,
+                        careerId : Annotated[Union[int,None],Query(ge=1,description='Only students of this career')] = None,
+                        semester : Annotated[Union[int,None],Query(ge=1,le=10,description='Only students of this semester')] = None,
+                        session : AsyncSession = Depends(async_db_connection)):
+    """Get the list of students one page at a time"""
     try:
-        results = session.query(Student).all()
-        students_dict = [model_to_dict(row) for row in results]
-        students = [Student_DB(**students_dict)]
-        return students
+        statement = select(Student.__table__)
+        if careerId:
+            statement = statement.filter_by(careerId = careerId)
+        if semester:
+            statement = statement.filter_by(semester = semester)
+        results, next_cursor = await keyset_page(session, statement, Student.id, after, limit)
+        return {'items': results, 'next': next_cursor}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500,detail={'message': 'SQLAlchemy error','error':str(e)})
     except Exception as e:
         raise HTTPException(status_code=560,detail={'message': 'Function error', 'error':str(e)})
+
+@router.get('/{student_id}/schedule',status_code=200,response_model=Student_Schedule,responses={
+    200:{
+            "description": "Classes of the student with their hour, subject and teacher",
+            "content": {
+                "application/json": {
+                    "example": {'idStudent':23003,'classes':[{'idClass':4,'groupNo':340,'hour':'02:00 PM','idSubject':13,
+                                'subject':'Water Physics','idTeacher':2003,'teacher':'George Mendel'}]}
+                }
+            }},
+    404:{
+            "description": "Student not found in database",
+            "content": {
+                "application/json": {
+                    "example": {'detail':{'message':'The student with id 23003 does not exist'}}
+                }
+            }}
+})
+async def get_student_schedule(student_id : Annotated[int,Path(ge=1,description='Database id of the student',example=23003)],
+                                session : AsyncSession = Depends(async_db_connection)):
+    """Get the weekly schedule of a student from a single query, the rendered schedule is cached until
+    the enrollments of the student or their classes change"""
+    try:
+        body = schedule_cache.get(student_id)
+        if body is None:
+            version = schedule_cache.version
+            #The outer joins keep one row for a student without classes, and no rows for a missing student
+            rows = (await session.execute(select(Student.id, Class.id, Class.groupNo, Class.hour, Subject.id, Subject.name,
+                                                    Teacher.id, Teacher.firstName, Teacher.secondName).\
+                        outerjoin(StudentClass, StudentClass.idStudent == Student.id).\
+                        outerjoin(Class, Class.id == StudentClass.idClass).\
+                        outerjoin(Subject, Subject.id == Class.idSubject).\
+                        outerjoin(Teacher, Teacher.id == Class.idTeacher).\
+                        filter(Student.id == student_id))).all()
+            if not rows:
+                raise Error404
+            classes = [{'idClass': class_id, 'groupNo': group_no, 'hour': hour, 'idSubject': subject_id, 'subject': subject,
+                        'idTeacher': teacher_id, 'teacher': f'{first_name} {second_name}'}
+                        for _, class_id, group_no, hour, subject_id, subject, teacher_id, first_name, second_name in rows if class_id is not None]
+            classes.sort(key=lambda class_item: hour_order(class_item['hour']))
+            body = orjson.dumps({'idStudent': student_id, 'classes': classes})
+            schedule_cache.put(student_id, [class_item['idClass'] for class_item in classes], body, version)
+        return Response(content=body, media_type='application/json')
+    except Error404:
+        raise HTTPException(status_code=404,detail={'message': f'The student with id {student_id} does not exist'})
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=560,detail={'message': 'SQLAlchemy error','error':str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500,detail={'message': 'Function error', 'error':str(e)})
+
+@router.get('/export/',status_code=200,response_class=StreamingResponse,responses={
+    200:{
+            "description": "Students as newline-delimited JSON, one student per line",
+            "content": {
+                "application/x-ndjson": {
+                    "example": '{"id": 1, "firstName": "Horacio", "secondName": "Gomez", "studentId": 19930, "birthday": "2002-04-11", "semester": 2, "gpa": 77.8, "careerId": 2}\n'
+                }
+            }}
+})
+async def export_students(since : Annotated[Union[int,None],Query(ge=0,description='Only students with an id greater than this one')] = None):
+    """Stream every student as newline-delimited JSON, ordered by id"""
+    statement = select(Student.__table__)
+    if since is not None:
+        statement = statement.where(Student.id > since)
+    return StreamingResponse(ndjson_stream(statement.order_by(Student.id), EXPORT_CHUNK_SIZE), media_type='application/x-ndjson')
     
 @router.put('/modify/',status_code=201, response_model=Student_DB,responses={
     400:{
@@ -137,34 +291,26 @@ async def get_students(session=Depends(db_connection)):
                 }
             }}
 })
-async def modify_student(student : Annotated[Student_Auxiliar,Body], session = Depends(db_connection)):
+async def modify_student(student : Annotated[Student_Auxiliar,Body], session : AsyncSession = Depends(async_db_connection)):
     """Modify the fields of one student"""
     try:
         student: Student_Auxiliar
-        old_record : Student
         if not(student.birthday or student.careerId or student.firstName or student.secondName or student.gpa or student.semester or student.studentId):
             raise Error400("You must specify at least one field that will be modified")
 
-        old_record = session.query(Student).filter_by(id = student.id).first()
-        if old_record is None:
+        #Only the given fields are written, the new row comes back from the same statement;
+        #the constraints reject a repeated student id and a career that doesn't exist
+        try:
+            new_record = (await session.execute(partial_update(Student, student.id, student))).mappings().first()
+        except IntegrityError as e:
+            raise Error400(constraint_message(e, {'Students.studentId': 'A student with the same student id is already registered',
+                                                    'FOREIGN KEY': f'The career with the id {student.careerId} does not exist in the database'}))
+        if new_record is None:
             raise Error404
-
-        result = session.query(Student).filter_by(id = student.id).update({
-            Student.birthday: student.birthday if student.birthday else old_record.birthday,
-            Student.careerId: student.careerId if student.careerId else old_record.careerId,
-            Student.firstName: student.firstName if student.firstName else old_record.firstName,
-            Student.secondName: student.secondName if student.secondName else old_record.secondName,
-            Student.gpa: student.gpa if student.gpa else old_record.gpa,
-            Student.semester: student.semester if student.semester else old_record.semester,
-            Student.studentId: student.studentId if student.studentId else old_record.studentId
-        })
-        if result != 1:
-            session.rollback()
-            raise Error400("There was an error while updating the record")
-        session.commit()
-        new_record = session.query(Student).filter_by(id = student.id).first()
-        new_student = Student_DB(**model_to_dict(new_record))
-        return new_student
+        await session.commit()
+        table_versions.bump(Student)
+        student_store.put(new_record['id'], new_record['careerId'], new_record['semester'], new_record['gpa'], new_record['birthday'])
+        return Student_DB(**new_record)
     except Error400 as e:
         raise HTTPException(status_code=400,detail={'message': str(e)})
     except Error404:
@@ -198,23 +344,27 @@ async def modify_student(student : Annotated[Student_Auxiliar,Body], session = D
             }}
 })
 async def delete_student(student_id: Annotated[int,Query(ge=0,example=204,description="Id of the student to be deleted")],
-                            session = Depends(db_connection)):
+                            session : AsyncSession = Depends(async_db_connection)):
     """Deletes one student from the database by their id"""
     try:
-        student = session.query(Student.firstName,Student.secondName).filter_by(id = student_id).first()
+        student = (await session.execute(select(Student.firstName,Student.secondName).filter_by(id = student_id))).first()
         if student is None:
             raise Error404 
-        result = session.query(Student).filter_by(id = student_id).delete()
+        result = (await session.execute(delete(Student).filter_by(id = student_id))).rowcount
         if result != 1:
-            session.rollback()
+            await session.rollback()
             raise Error400 
-        session.commit()
+        await session.commit()
+        table_versions.bump(Student, cascade=True)
+        schedules.forget_student(student_id)
+        schedule_cache.invalidate(student_id)
+        student_store.remove(student_id)
         return {'status_code':201,'message':f'Success! The student {student[0]} {student[1]} was deleted succesfully'}
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'There was an error deleting the student'})
     except Error404:
         raise HTTPException(status_code=404,detail={'message': f'The student with id {student_id} does not exist'})
-    except SQLAlchemyError() as e:
+    except SQLAlchemyError as e:
         raise HTTPException(status_code=560,detail={'message': 'SQLAlchemy error','error':str(e)})
     except Exception as e:
         raise HTTPException(status_code=500,detail={'message': 'Function error', 'error':str(e)})
@@ -1,11 +1,17 @@
 from fastapi import APIRouter, Body, HTTPException, Query, Depends
 from typing import Annotated, List, Union
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
-from sql.connection import db_connection
-from schemes import  Subject_Scheme, Subject_DB, Subject_Auxiliar
-from sql.definition import Subject, Career
-from utils import model_to_dict, Error400, Error404
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sql.connection import async_db_connection
+from schemes import  Subject_Scheme, Subject_DB, Subject_Auxiliar, Page
+from sql.definition import Subject, Class
+from sql.search import subjects_search, match_expression, matches
+from utils import keyset_page, offset_page, constraint_message, partial_update, Error400, Error404
+from settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from cache import cached, table_versions
+from occupancy import occupancy, reload_occupancy
+from schedules import schedule_cache, enrolled_students, drop_classes
 
 router = APIRouter(prefix='/subjects',tags=['Subject'])
 
@@ -25,26 +31,19 @@ router = APIRouter(prefix='/subjects',tags=['Subject'])
                         }
             }}
 })
-async def new_subject(subject: Annotated[Subject_Scheme,Body],session = Depends(db_connection)):
+async def new_subject(subject: Annotated[Subject_Scheme,Body],session : AsyncSession = Depends(async_db_connection)):
     """Crates a new subject"""
     try:
-        #Check if carrer with the id exists and the subject name is unique
-        result= session.query(Career.id).filter_by(id = subject.careerId).first()
-        if not result:
-            raise Error400(f'The career with the id {subject.careerId} does not exist in the database')
-        result = session.query(Subject.id).filter_by( name = subject.name).first()
-        if result:
-            raise Error400('A subject with the same name is already registered')
-        subject_dict = subject.dict()
-        subject_db = Subject(**subject_dict)
-        session.add(subject_db)
-
-        result = session.query(Subject.id).filter_by(name = subject.name).first()
-        if result:
-            session.commit()
-            return {'status_code':201,'message':'Subject registered successfully!', 'id':result[0]}
-        session.rollback()
-        raise Exception("There was an error registering the subject")    
+        #The foreign key rejects a career that doesn't exist and the unique constraint a repeated name
+        try:
+            subject_id = (await session.execute(insert(Subject.__table__).values(subject.dict()).returning(Subject.id))).scalar_one()
+        except IntegrityError as e:
+            raise Error400(constraint_message(e, {'FOREIGN KEY': f'The career with the id {subject.careerId} does not exist in the database',
+                                                    'Subjects.name': 'A subject with the same name is already registered'}))
+        await session.commit()
+        table_versions.bump(Subject)
+        occupancy.add_subject(subject_id)
+        return {'status_code':201,'message':'Subject registered successfully!', 'id':subject_id}
 
     except Error400 as e:
         raise HTTPException(status_code=400, detail = {'message': str(e)})
@@ -54,7 +53,7 @@ async def new_subject(subject: Annotated[Subject_Scheme,Body],session = Depends(
         raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
 
 
-@router.get('/search/',status_code=200,response_model=Subject_DB,responses={
+@router.get('/search/',status_code=200,response_model=Page[Subject_DB],responses={
     400:{
             "description": "Bad request",
             "content": {
@@ -70,19 +69,29 @@ async def new_subject(subject: Annotated[Subject_Scheme,Body],session = Depends(
                 }
         }}
 })
-async def search_subject(subject: Annotated[Subject_Auxiliar,Body], session = Depends(db_connection)):
-    """Search one subject by their name or id in the database"""
+@cached(Subject)
+async def search_subject(subject: Annotated[Subject_Auxiliar,Body],
+                        limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of subjects in the page')] = DEFAULT_PAGE_SIZE,
+                        offset : Annotated[int,Query(ge=0,description='Cursor returned as next by the previous page')] = 0,
+                        session : AsyncSession = Depends(async_db_connection)):
+    """Search subjects by their id or by their name (best matches first)"""
     try:
         subject: Subject_Auxiliar
         if subject.id:
-            result = session.query(Subject).filter_by(id = subject.id).first()
+            statement = select(Subject.__table__).filter_by(id = subject.id)
         elif subject.name:
-            result = session.query(Subject).filter(Subject.name.ilike(f'%{subject.name}%')).first()
+            expression = match_expression(subject.name)
+            if not expression:
+                raise Error404()
+            statement = select(Subject.__table__).join(subjects_search, subjects_search.c.rowid == Subject.id).\
+                filter(matches(subjects_search, expression)).\
+                    order_by(subjects_search.c.rank, Subject.id)
         else:
             raise Error400()
+        results, next_cursor = await offset_page(session, statement, offset, limit)
 
-        if result:
-            return result
+        if results or offset > 0:
+            return {'items': results, 'next': next_cursor}
         raise Error404()
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'You must provide either name or id for the subject to be returned'})
@@ -94,40 +103,52 @@ async def search_subject(subject: Annotated[Subject_Auxiliar,Body], session = De
         raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
 
 
-@router.get('/obtain/',status_code=200,response_model=List[Subject_DB], responses={
+@router.get('/obtain/',status_code=200,response_model=Page[Subject_DB], responses={
      200:{
         "description": "Subject items retrieved successfully",
         "content": {
             "application/json": {
-                "example":[
-                {
-                    "id": 91,
-                    "name": "Introduction to Mongo DB",
-                    "semester": 4,
-                    "careerId": 12
-                },
-                {
-                    "id": 538,
-                    "name": "Nuclear physics",
-                    "semester": 8,
-                    "careerId": 24
-                },
-                {
-                    "id": 122,
-                    "name": "Calculus III",
-                    "semester": 3,
-                    "careerId": 1
-               }
-            ]
+                "example":{
+                "items": [
+                    {
+                        "id": 91,
+                        "name": "Introduction to Mongo DB",
+                        "semester": 4,
+                        "careerId": 12
+                    },
+                    {
+                        "id": 122,
+                        "name": "Calculus III",
+                        "semester": 3,
+                        "careerId": 1
+                    },
+                    {
+                        "id": 538,
+                        "name": "Nuclear physics",
+                        "semester": 8,
+                        "careerId": 24
+                   }
+                ],
+                "next": 538
+            }
             }
         }}
 })
-async def get_subjects(session = Depends(db_connection)):
-    """Get a full list of subjects"""
+@cached(Subject, etag=True)
+async def get_subjects(limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of subjects in the page')] = DEFAULT_PAGE_SIZE,
+                        after : Annotated[Union[int,None],Query(ge=0,description='Cursor returned as next by the previous page')] = None,
+                        careerId : Annotated[Union[int,None],Query(ge=1,description='Only subjects of this career')] = None,
+                        semester : Annotated[Union[int,None],Query(ge=1,le=10,description='Only subjects of this semester')] = None,
+                        session : AsyncSession = Depends(async_db_connection)):
+    """Get the list of subjects one page at a time"""
     try:
-        results = session.query(Subject).all()
-        subjects_dict = [model_to_dict(row) for row in results]
-        return subjects_dict
+        statement = select(Subject.__table__)
+        if careerId:
+            statement = statement.filter_by(careerId = careerId)
+        if semester:
+            statement = statement.filter_by(semester = semester)
+        results, next_cursor = await keyset_page(session, statement, Subject.id, after, limit)
+        return {'items': results, 'next': next_cursor}
  
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500,detail={'message': 'SQLAlchemy error','error':str(e)})
@@ -151,35 +172,24 @@ async def get_subjects(session = Depends(db_connection)):
                 }
             }}
 })
-async def modify_subject(subject: Annotated[Subject_Auxiliar,Body],session : Session= Depends(db_connection)):
+async def modify_subject(subject: Annotated[Subject_Auxiliar,Body],session : AsyncSession = Depends(async_db_connection)):
     """Modify the fields of one subject"""
     try:
         subject: Subject_Auxiliar
-        old_subject: Subject
         if not(subject.careerId or subject.name or subject.semester):
             raise Error400("You must specify at least one field that will be modified")
-        #Validate that career exists
-        if subject.careerId:
-            result = session.query(Career.id).filter_by(id = subject.careerId).first()
-            if result is None:
-                raise Error400(f"The career with the ID {subject.careerId} does not exists in the database")
-        
-        old_subject = session.query(Subject).filter_by(id = subject.id).first()
-        if old_subject is None:
+        #The foreign key validates that the career exists
+        try:
+            new_record = (await session.execute(partial_update(Subject, subject.id, subject))).mappings().first()
+        except IntegrityError as e:
+            raise Error400(constraint_message(e, {'FOREIGN KEY': f"The career with the ID {subject.careerId} does not exists in the database"}))
+        if new_record is None:
             raise Error404
-
-        result = session.query(Subject).filter_by(id = subject.id).update({
-            Subject.careerId : subject.careerId if subject.careerId else old_subject.careerId,
-            Subject.name : subject.name if subject.name else old_subject.name,
-            Subject.semester : subject.semester if subject.semester else old_subject.semester
-        })
-        if result != 1:
-            session.rollback()
-            raise Error400("There was an error while updating the record")
-     
-        new_record = session.query(Subject).filter_by(id = subject.id).first()
-        new_subject = Subject_DB(**model_to_dict(new_record))
-        return new_subject    
+        await session.commit()
+        table_versions.bump(Subject)
+        #The names of the subjects are part of the cached schedules
+        schedule_cache.clear()
+        return Subject_DB(**new_record)
     except Error400 as e:
         raise HTTPException(status_code=400,detail={'message': str(e)})
     except Error404:
@@ -214,18 +224,26 @@ async def modify_subject(subject: Annotated[Subject_Auxiliar,Body],session : Ses
             }}
 })
 async def delete_subject(subject_id : Annotated[int,Query(default=...,ge=1,title='Subject ID',description='Id of the subject to be deleted',example=208)],
-                        session = Depends(db_connection)):
+                        session : AsyncSession = Depends(async_db_connection)):
     """Deletes one subject by their id"""
     try:
-        session: Session
-        subject = session.query(Subject.name).filter_by(id = subject_id).first()
+        session: AsyncSession
+        subject = (await session.execute(select(Subject.name).filter_by(id = subject_id))).first()
         if subject is None:
             raise Error404
-        result = session.query(Subject).filter_by(id = subject_id).delete()
+        #The classes of the subject and their enrollments go away with the cascade
+        class_ids = (await session.execute(select(Class.id).filter_by(idSubject = subject_id))).scalars().all()
+        students = await enrolled_students(session, class_ids)
+        result = (await session.execute(delete(Subject).filter_by(id = subject_id))).rowcount
         if result != 1:
-            session.rollback()
+            await session.rollback()
             raise Error400 
-        session.commit()
+        await session.commit()
+        table_versions.bump(Subject, cascade=True)
+        #The classes of the subject were deleted by the cascade
+        await reload_occupancy()
+        await drop_classes(class_ids, students)
+        schedule_cache.clear()
         return {'status_code':201,'message':f'Success! The subject {subject[0]} was deleted succesfully'}
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'There was an error deleting the subject'})
@@ -1,11 +1,17 @@
 from fastapi import APIRouter, Body, HTTPException, Query, Depends
-from sqlalchemy import exc,or_
+from sqlalchemy import exc,or_, select, delete
 from typing import Annotated, List, Union
-from sqlalchemy.exc import SQLAlchemyError
-from sql.connection import db_connection
-from schemes import Teacher_DB, Teacher_Scheme, Teacher_Auxiliar
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sql.connection import async_db_connection
+from schemes import Teacher_DB, Teacher_Scheme, Teacher_Auxiliar, Page
 from sql.definition import Teacher
-from utils import model_to_dict, Error400, Error404
+from sql.search import teachers_search, names_expression, matches
+from utils import keyset_page, offset_page, insert_unless, constraint_message, partial_update, Error400, Error404
+from settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from cache import cached, table_versions
+from occupancy import occupancy
+from schedules import schedule_cache, enrolled_students, drop_classes
 
 router = APIRouter(prefix='/teachers',tags=['Teacher'])
 
@@ -26,30 +32,22 @@ router = APIRouter(prefix='/teachers',tags=['Teacher'])
             }
         }
 })
-async def new_teacher(teacher : Annotated[Teacher_Scheme,Body], session = Depends(db_connection)):
+async def new_teacher(teacher : Annotated[Teacher_Scheme,Body], session : AsyncSession = Depends(async_db_connection)):
     """Create a new teacher"""
     try:
-        #Check if teacher already exists by their names and check if employee ID is unique
-        result = session.query(Teacher).filter(Teacher.firstName == teacher.firstName,
-        Teacher.secondName == teacher.secondName).first()
-        if result:
+        #The names aren't a constraint of the table, the insert is skipped if they are taken;
+        #the unique constraint of the employee ID rejects the duplicates
+        try:
+            teacher_id = (await session.execute(insert_unless(Teacher, teacher.dict(),
+                            Teacher.firstName == teacher.firstName, Teacher.secondName == teacher.secondName))).scalar()
+        except IntegrityError as e:
+            raise Error400(constraint_message(e, {'Teachers.employeeId': "The given employee ID it's already assigned"}))
+        if teacher_id is None:
             raise Error400("A teacher with the same name is already registered")
-        result = session.query(Teacher).filter_by(employeeId = teacher.employeeId).first()
-        if result:
-            raise Error400("The given employee ID it's already assigned")
-
-        teacher_dict = teacher.dict()
-        teacher_db = Teacher(**teacher_dict)
-        session.add(teacher_db)
-        result = session.query(Teacher.id).filter(Teacher.firstName == teacher.firstName,
-        Teacher.secondName == teacher.secondName).first()
-
-        if result:
-            session.commit()
-            return {'status_code':201,'message':'Teacher registered successfully!', 'id':result[0]}
-        else:
-            session.rollback()
-            raise Exception("There was an error registering the teacher")
+        await session.commit()
+        table_versions.bump(Teacher)
+        occupancy.add_teacher(teacher_id)
+        return {'status_code':201,'message':'Teacher registered successfully!', 'id':teacher_id}
 
     except Error400 as e:
         raise HTTPException(status_code=400, detail = {'message': str(e)})
@@ -58,12 +56,12 @@ async def new_teacher(teacher : Annotated[Teacher_Scheme,Body], session = Depend
     except Exception as e:
         raise HTTPException(status_code=500, detail = {'message': 'Function error','error':str(e)})
 
-@router.get('/search/',status_code=200, response_model=Teacher_DB, responses={
+@router.get('/search/',status_code=200, response_model=Page[Teacher_DB], responses={
     200:{
-            "description": "Teacher item retrieved",
+            "description": "Teacher items retrieved, best matches first",
             "content": {
                 "application/json": {
-                    "example": {'employeeId':2030, 'firstName': 'Marco', 'secondName': 'D-Rossi', 'id':1}
+                    "example": {'items': [{'employeeId':2030, 'firstName': 'Marco', 'secondName': 'D-Rossi', 'id':1}], 'next': None}
                 }
             }},
     400:{
@@ -81,28 +79,33 @@ async def new_teacher(teacher : Annotated[Teacher_Scheme,Body], session = Depend
                 }
             }}
 })
+@cached(Teacher)
 async def get_teacher(teacher : Annotated[Teacher_Auxiliar,Body],
-                        sesion = Depends(db_connection)):
-    """Get one teacher from the database based on the given search parameters"""
+                        limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of teachers in the page')] = DEFAULT_PAGE_SIZE,
+                        offset : Annotated[int,Query(ge=0,description='Cursor returned as next by the previous page')] = 0,
+                        sesion : AsyncSession = Depends(async_db_connection)):
+    """Search teachers by their names (best matches first) or by their ids"""
     try:
-        if teacher.firstName and teacher.secondName:
-            result = sesion.query(Teacher).filter(Teacher.firstName.ilike(f'%{teacher.firstName}%'),
-                    Teacher.secondName.ilike(f'%{teacher.secondName}%')).first()
-        elif teacher.firstName or teacher.secondName:
-            result = sesion.query(Teacher).filter(or_(Teacher.firstName.ilike(f'%{teacher.firstName}%'),
-                    Teacher.secondName.ilike(f'%{teacher.secondName}%'))).first()
+        if teacher.firstName or teacher.secondName:
+            #Every word of the names is matched as a prefix in the full-text index
+            expression = names_expression(teacher.firstName, teacher.secondName)
+            if not expression:
+                raise Error404
+            statement = select(Teacher.__table__).join(teachers_search, teachers_search.c.rowid == Teacher.id).\
+                filter(matches(teachers_search, expression)).\
+                    order_by(teachers_search.c.rank, Teacher.id)
         elif teacher.employeeId:
-            result = sesion.query(Teacher).filter_by(employeeId = teacher.employeeId).first()
+            statement = select(Teacher.__table__).filter_by(employeeId = teacher.employeeId)
         elif teacher.id:
-            result = sesion.query(Teacher).filter(Teacher.id == teacher.id).first()
+            statement = select(Teacher.__table__).filter(Teacher.id == teacher.id)
         else:
             raise Error400
+        results, next_cursor = await offset_page(sesion, statement, offset, limit)
         
-        if result is None:
+        if not results and offset == 0:
             raise Error404
 
-        teacher_db = Teacher_DB(**model_to_dict(result))
-        return teacher_db
+        return {'items': results, 'next': next_cursor}
 
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'You must provide either name(s) or id for the teacher to be returned'})
@@ -113,41 +116,45 @@ async def get_teacher(teacher : Annotated[Teacher_Auxiliar,Body],
     except Exception as e:
         raise HTTPException(status_code=560,detail={'message': 'Function error', 'error':str(e)})
         
-@router.get('/obtain/',status_code=200, response_model=List[Teacher_DB], responses={
+@router.get('/obtain/',status_code=200, response_model=Page[Teacher_DB], responses={
     200:{
             "description": "Teacher items retrieved successfully",
             "content": {
                 "application/json": {
-                    "example":[
-                                {
-                                    "employeeId": 2390,
-                                    "firstName": "Dillan",
-                                    "secondName": "Smith",
-                                    "id": 1
-                                },
-                                {
-                                    "employeeId": 3511,
-                                    "firstName": "Bob",
-                                    "secondName": "Ishigami",
-                                    "id": 30
-                                },
-                                {
-                                    "employeeId": 1005,
-                                    "firstName": "Roberto",
-                                    "secondName": "Fuentes",
-                                    "id": 4
-                                }
-                            ]
+                    "example":{
+                                "items": [
+                                    {
+                                        "employeeId": 2390,
+                                        "firstName": "Dillan",
+                                        "secondName": "Smith",
+                                        "id": 1
+                                    },
+                                    {
+                                        "employeeId": 1005,
+                                        "firstName": "Roberto",
+                                        "secondName": "Fuentes",
+                                        "id": 4
+                                    },
+                                    {
+                                        "employeeId": 3511,
+                                        "firstName": "Bob",
+                                        "secondName": "Ishigami",
+                                        "id": 30
+                                    }
+                                ],
+                                "next": None
+                            }
                 }
             }}
 })
-async def get_teachers(session = Depends(db_connection)):
-    """Get the full list of all the teachers"""
+@cached(Teacher, etag=True)
+async def get_teachers(limit : Annotated[int,Query(ge=1,le=MAX_PAGE_SIZE,description='Maximum number of teachers in the page')] = DEFAULT_PAGE_SIZE,
+                        after : Annotated[Union[int,None],Query(ge=0,description='Cursor returned as next by the previous page')] = None,
+                        session : AsyncSession = Depends(async_db_connection)):
+    """Get the list of teachers one page at a time"""
     try:
-        result = session.query(Teacher).all()
-        teacher_dicts = [model_to_dict(row) for row in result]
-        teachers = [Teacher_DB(**t) for t in teacher_dicts]
-        return teachers
+        result, next_cursor = await keyset_page(session, select(Teacher.__table__), Teacher.id, after, limit)
+        return {'items': result, 'next': next_cursor}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=560,detail={'message': 'SQLAlchemy error','error':str(e)})
     except Exception as e:
@@ -176,29 +183,24 @@ async def get_teachers(session = Depends(db_connection)):
                 }
             }}
 })
-async def modify_teacher(teacher: Annotated[Teacher_Auxiliar,Body],session = Depends(db_connection)):
+async def modify_teacher(teacher: Annotated[Teacher_Auxiliar,Body],session : AsyncSession = Depends(async_db_connection)):
     """Modify a teacher's information"""
     try:
         if not(teacher.employeeId or teacher.firstName or teacher.secondName):
             raise Error400("You most specify at least one field that will be modified")
         
-        #We use the id to serach the teacher, the other fields will be used to update the information
-        old_record = session.query(Teacher).filter_by(id=teacher.id).first()
-        if old_record is None:
+        #We use the id to serach the teacher, the other fields given will be used to update the information
+        try:
+            new_record = (await session.execute(partial_update(Teacher, teacher.id, teacher))).mappings().first()
+        except IntegrityError as e:
+            raise Error400(constraint_message(e, {'Teachers.employeeId': "The given employee ID it's already assigned"}))
+        if new_record is None:
             raise Error404
-
-        result = session.query(Teacher).filter_by(id=teacher.id).update({
-            Teacher.employeeId: teacher.employeeId if teacher.employeeId else old_record.employeeId,
-            Teacher.firstName: teacher.firstName  if teacher.firstName else old_record.firstName,
-            Teacher.secondName: teacher.secondName if teacher.secondName else old_record.secondName,
-        })
-        if result != 1:
-            session.rollback()
-            raise Error400("There was an error while updating the record")
-        session.commit()
-        new_record = session.query(Teacher).filter_by(id=teacher.id).first()
-        new_teacher = Teacher_DB(**model_to_dict(new_record))
-        return new_teacher
+        await session.commit()
+        table_versions.bump(Teacher)
+        #The names of the teachers are part of the cached schedules
+        schedule_cache.clear()
+        return Teacher_DB(**new_record)
     except Error400 as e:
         raise HTTPException(status_code=400,detail={'message': str(e)})
     except Error404:
@@ -232,17 +234,24 @@ async def modify_teacher(teacher: Annotated[Teacher_Auxiliar,Body],session = Dep
             }}
 })
 async def delete_teacher(teacher_id: Annotated[int,Query(ge=0,example=12,description='Id of the teacher to be deleted')],
-                        session=Depends(db_connection)):
+                        session : AsyncSession = Depends(async_db_connection)):
     """Delete a teacher from the database by their id"""
     try:
-        teacher = session.query(Teacher.firstName,Teacher.secondName).filter_by(id=teacher_id).first()
+        teacher = (await session.execute(select(Teacher.firstName,Teacher.secondName).filter_by(id=teacher_id))).first()
         if teacher is None:
             raise Error404
-        result = session.query(Teacher).filter_by(id=teacher_id).delete()
+        #The classes of the teacher and their enrollments go away with the cascade
+        class_ids = [class_id for class_id, (class_teacher, _, _) in occupancy.classes.items() if class_teacher == teacher_id]
+        students = await enrolled_students(session, class_ids)
+        result = (await session.execute(delete(Teacher).filter_by(id=teacher_id))).rowcount
         if result != 1:
-            session.rollback()
+            await session.rollback()
             raise Error400
-        session.commit()
+        await session.commit()
+        table_versions.bump(Teacher, cascade=True)
+        occupancy.remove_teacher(teacher_id)
+        await drop_classes(class_ids, students)
+        schedule_cache.clear()
         return {'status_code': 201,'message': f'Success! Teacher {teacher[0]} {teacher[1]} was deleted successfully'}
     except Error400:
         raise HTTPException(status_code=400,detail={'message': 'There was an error deleting the teacher'})
@@ -0,0 +1,114 @@
+"""In-memory index of the teachers' schedules
+
+The class writes used to run one query per rule (teacher exists, subject exists, group number is free,
+teacher is free at that hour). The index keeps those keys in dictionaries so every rule is a lookup:
+it's loaded at startup, the routers update it after every commit, and the writes that cascade
+(deleting a career, importing files) reload it.
+
+The index lives in the process, so the API must run with a single worker process; the database
+constraints are still the last check for anything written behind its back.
+"""
+from contextlib import contextmanager
+from typing import Iterator, Union
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from sql.definition import Class, Teacher, Subject, async_engine
+from schedules import hour_minutes
+
+def slot_key(teacher_id : int, hour : str) -> tuple:
+    """Key of a teacher's slot, by minute of the day like the schedules index, so 9:00 AM and 09:00 AM are one slot"""
+    return (teacher_id, hour_minutes(hour))
+
+class Occupancy_Index:
+    def __init__(self):
+        #(idTeacher, minute of the day) -> class id
+        self.slots = {}
+        #groupNo -> class id
+        self.groups = {}
+        #class id -> (idTeacher, hour, groupNo)
+        self.classes = {}
+        self.teachers = set()
+        self.subjects = set()
+
+    def load(self, connection : Connection):
+        """Replaces the content of the index with the database one, works with run_sync()"""
+        classes = {id: (teacher, hour, group) for id, teacher, hour, group in
+                    connection.execute(select(Class.id, Class.idTeacher, Class.hour, Class.groupNo))}
+        self.teachers = set(connection.execute(select(Teacher.id)).scalars())
+        self.subjects = set(connection.execute(select(Subject.id)).scalars())
+        self.slots = {slot_key(teacher, hour): id for id, (teacher, hour, _) in classes.items()}
+        self.groups = {group: id for id, (_, _, group) in classes.items()}
+        self.classes = classes
+
+    #region lookups
+    def has_teacher(self, teacher_id : int) -> bool:
+        return teacher_id in self.teachers
+
+    def has_subject(self, subject_id : int) -> bool:
+        return subject_id in self.subjects
+
+    def group_owner(self, group_no : int) -> Union[int,object,None]:
+        """Id of the class with the group number, None if it's free"""
+        return self.groups.get(group_no)
+
+    def slot_owner(self, teacher_id : int, hour : str) -> Union[int,object,None]:
+        """Id of the class the teacher gives at that hour, None if the teacher is free"""
+        return self.slots.get(slot_key(teacher_id, hour))
+    #endregion
+
+    #region writes
+    def put(self, class_id : Union[int,object], teacher_id : int, hour : str, group_no : int):
+        """Adds a class or moves it to its new teacher, hour and group"""
+        self.remove(class_id)
+        self.classes[class_id] = (teacher_id, hour, group_no)
+        self.slots[slot_key(teacher_id, hour)] = class_id
+        self.groups[group_no] = class_id
+
+    def remove(self, class_id : Union[int,object]):
+        entry = self.classes.pop(class_id, None)
+        if entry is None:
+            return
+        teacher_id, hour, group_no = entry
+        #The keys may already belong to another class (or to the real id of a reservation)
+        if self.slots.get(slot_key(teacher_id, hour)) == class_id:
+            del self.slots[slot_key(teacher_id, hour)]
+        if self.groups.get(group_no) == class_id:
+            del self.groups[group_no]
+
+    @contextmanager
+    def reservation(self, teacher_id : int, hour : str, group_no : int) -> Iterator[object]:
+        """Holds the slot and the group number while a write is awaiting the database, so two
+        concurrent requests can't both pass the checks for the same keys. The reservation is
+        dropped at the end, after a successful commit the caller puts the real id"""
+        token = object()
+        #A class that is being modified may already own the keys, they go back to it if the write fails
+        previous = ((self.slots, slot_key(teacher_id, hour), self.slots.get(slot_key(teacher_id, hour))),
+                    (self.groups, group_no, self.groups.get(group_no)))
+        self.put(token, teacher_id, hour, group_no)
+        try:
+            yield token
+        finally:
+            self.remove(token)
+            for keys, key, owner in previous:
+                if owner is not None and key not in keys and owner in self.classes:
+                    keys[key] = owner
+
+    def add_teacher(self, teacher_id : int):
+        self.teachers.add(teacher_id)
+
+    def add_subject(self, subject_id : int):
+        self.subjects.add(subject_id)
+
+    def remove_teacher(self, teacher_id : int):
+        """The database cascade deletes the classes of the teacher, the index does the same"""
+        self.teachers.discard(teacher_id)
+        for class_id in [id for id, (teacher, _, _) in self.classes.items() if teacher == teacher_id]:
+            self.remove(class_id)
+    #endregion
+
+occupancy = Occupancy_Index()
+
+async def reload_occupancy():
+    """Reloads the index after writes that the routers can't follow one by one (cascades, imports)"""
+    async with async_engine.connect() as connection:
+        await connection.run_sync(occupancy.load)
@@ -0,0 +1,191 @@
+"""Counts the SQL statements of every request
+
+Engine events time every statement sent to SQLite by both engines and add it to the statistics of
+the request that is running, kept in a context variable so concurrent requests don't mix (the
+context follows the request into the async driver and into the threadpool). The metrics middleware
+opens the statistics of every request, feeds them to /metrics and, with SCHOOL_DEBUG_QUERIES,
+returns them in the X-DB-Queries and Server-Timing headers.
+
+QUERY_BUDGETS is the most statements every endpoint may run. benchmarks/load.py --query-budgets
+fails when an endpoint goes over its budget, and query_budget() does the same around any code.
+
+The statements slower than SCHOOL_SLOW_QUERY_MS are logged with their parameters, the route of the
+request and their EXPLAIN QUERY PLAN, and kept in a ring buffer that GET /admin/slow_queries/ shows
+grouped by statement shape (the statement with its IN lists and literals folded).
+"""
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from time import perf_counter
+from typing import Iterator, Union
+from sqlalchemy import event
+from sql.definition import engine, async_engine
+from settings import SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE
+import logging
+import re
+
+logger = logging.getLogger('school.slow_queries')
+
+class Query_Stats:
+    __slots__ = ('count', 'seconds', 'statements', 'scope')
+
+    def __init__(self, keep_statements : bool = False, scope : Union[dict,None] = None):
+        self.count = 0
+        self.seconds = 0.0
+        #Only kept when the statements must be shown, e.g. by a failed budget
+        self.statements = [] if keep_statements else None
+        #ASGI scope of the request, the slow query log takes the route from it
+        self.scope = scope
+
+    def route(self) -> Union[str,None]:
+        route = self.scope.get('route') if self.scope is not None else None
+        return f"{self.scope['method']} {route.path}" if route is not None else None
+
+def statement_shape(statement : str) -> str:
+    """The statement without what changes between calls: the size of the IN lists and of the
+    multi-row VALUES, literals and whitespace"""
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'\b\d+(?:\.\d+)?\b', '?', shape)
+    shape = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', shape)
+    shape = re.sub(r'(\(\?, \.\.\.\))(?:\s*,\s*\(\?, \.\.\.\))+', r'\1, ...', shape)
+    return ' '.join(shape.split())
+
+def loggable(parameters) -> list:
+    """Bound parameters as JSON values, only the first rows of an executemany and the first values of a long list"""
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return [loggable(row) for row in parameters[:3]]
+    if isinstance(parameters, dict):
+        return {key: loggable(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [loggable(value) for value in parameters[:50]]
+    return parameters if isinstance(parameters, (int, float, str, type(None))) else str(parameters)
+
+class Slow_Query_Log:
+    def __init__(self, threshold_ms : float, size : int):
+        self.threshold = threshold_ms / 1000
+        self.entries = deque(maxlen=size)
+
+    def record(self, connection, statement : str, parameters, executemany : bool, seconds : float, stats : Union[Query_Stats,None]):
+        entry = {'statement': statement, 'parameters': loggable(parameters), 'duration_ms': seconds * 1000,
+                 'route': stats.route() if stats is not None else None, 'plan': query_plan(connection, statement, parameters, executemany),
+                 'time': datetime.now().isoformat(timespec='seconds')}
+        self.entries.append(entry)
+        logger.warning('Slow query (%.1f ms) in %s: %s %s', entry['duration_ms'], entry['route'] or 'no request', statement, entry['parameters'])
+
+    def shapes(self, limit : int) -> list:
+        """The statement shapes that took the most time in total, with their slowest entry"""
+        shapes = {}
+        for entry in self.entries:
+            shape = shapes.setdefault(statement_shape(entry['statement']), {'count': 0, 'total_ms': 0.0, 'routes': set(), 'slowest': entry})
+            shape['count'] += 1
+            shape['total_ms'] += entry['duration_ms']
+            shape['routes'].add(entry['route'])
+            if entry['duration_ms'] > shape['slowest']['duration_ms']:
+                shape['slowest'] = entry
+        worst = sorted(shapes.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:limit]
+        return [{'shape': text, 'count': shape['count'], 'total_ms': shape['total_ms'], 'mean_ms': shape['total_ms'] / shape['count'],
+                 'max_ms': shape['slowest']['duration_ms'], 'routes': sorted(shape['routes'], key=str), 'slowest': shape['slowest']}
+                for text, shape in worst]
+
+    def clear(self):
+        self.entries.clear()
+
+def query_plan(connection, statement : str, parameters, executemany : bool) -> list:
+    """EXPLAIN QUERY PLAN of the statement on its own connection, through a new DBAPI cursor so the
+    cursor of the statement keeps its rows and the engine events don't see it"""
+    if not re.match(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', statement, re.IGNORECASE):
+        return []
+    try:
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters[0] if executemany else parameters)
+            return [row[3] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f'The plan could not be read: {e}']
+
+slow_queries = Slow_Query_Log(SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE)
+
+current_queries : ContextVar[Union[Query_Stats,None]] = ContextVar('current_queries', default=None)
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_start', []).append(perf_counter())
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    seconds = perf_counter() - connection.info['query_start'].pop()
+    stats = current_queries.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+        if stats.statements is not None:
+            stats.statements.append(statement)
+    if seconds >= slow_queries.threshold:
+        slow_queries.record(connection, statement, parameters, executemany, seconds, stats)
+
+for target in (engine, async_engine.sync_engine):
+    event.listen(target, 'before_cursor_execute', before_cursor_execute)
+    event.listen(target, 'after_cursor_execute', after_cursor_execute)
+
+@contextmanager
+def track_queries(keep_statements : bool = False) -> Iterator[Query_Stats]:
+    """Counts the statements run inside the block (in this task and the ones it starts)"""
+    stats = Query_Stats(keep_statements)
+    token = current_queries.set(stats)
+    try:
+        yield stats
+    finally:
+        current_queries.reset(token)
+
+@contextmanager
+def query_budget(limit : int, name : str = 'The block') -> Iterator[Query_Stats]:
+    """Fails with AssertionError if the block runs more than limit statements, for tests"""
+    with track_queries(keep_statements=True) as stats:
+        yield stats
+    if stats.count > limit:
+        raise AssertionError(f'{name} ran {stats.count} queries, its budget is {limit}:\n' + '\n'.join(stats.statements))
+
+#Most statements an endpoint may run (route as "METHOD path template"), the endpoints that write
+#a list (bulk creates, imports, exports) depend on its size and aren't listed. The deletes that
+#cascade over classes read and recompute their students 500 at a time, their budgets count one batch
+QUERY_BUDGETS = {
+    'GET /': 0,
+    'GET /careers/obtain/': 1,
+    'GET /careers/search/': 1,
+    'GET /careers/{career_id}/stats': 1,
+    'GET /subjects/obtain/': 1,
+    'GET /subjects/search/': 1,
+    'GET /teachers/obtain/': 1,
+    'GET /teachers/search/': 1,
+    'GET /students/obtain/': 1,
+    'GET /students/search/': 1,
+    'GET /students/{student_id}/schedule': 1,
+    'GET /classes/obtain/': 1,
+    'GET /classes/search/': 1,
+    'GET /classes/availability/': 1,
+    'POST /classes/validate/': 0,
+    'POST /classes/timetable/': 2,
+    'GET /reports/gpa_percentiles/': 0,
+    'GET /reports/birth_years/': 0,
+    'GET /reports/at_risk/': 0,
+    'GET /admin/cache/': 0,
+    'POST /careers/create/': 1,
+    'PUT /careers/modify/': 2,
+    'POST /subjects/create': 1,
+    'PUT /subjects/modify/': 1,
+    'POST /teachers/create/': 1,
+    'PUT /teachers/modify/': 1,
+    'POST /classes/create/': 1,
+    'PUT /classes/modify/': 1,
+    'POST /students/create/': 1,
+    'PUT /students/modify/': 1,
+    'POST /student_classes/create/': 2,
+    'DELETE /student_classes/erase/': 2,
+    'DELETE /students/erase/': 2,
+    'DELETE /classes/erase/': 3,
+    'DELETE /subjects/erase/': 8,
+    'DELETE /teachers/erase/': 4,
+    'DELETE /careers/erase/': 9,
+    'DELETE /admin/cache/': 0,
+}
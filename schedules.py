@@ -0,0 +1,222 @@
+"""In-memory weekly schedule of every student as a bitset
+
+Every distinct class hour gets one bit, a student's schedule is the OR of the bits of their classes, so
+"is the student free for these classes" is an AND per class instead of a join per class. The masks
+are plain Python ints (a school has a few dozen distinct hours, so they fit in one machine word).
+
+Like the occupancy index, it's loaded at startup and updated by the routers after every commit; the
+deletes that cascade over enrollments drop the deleted classes and recompute only the students that
+were enrolled in them.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Union
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sql.definition import Class, StudentClass, engine, async_engine
+from utils import chunks
+from settings import SCHEDULE_CACHE_SIZE
+import asyncio
+import re
+
+def hour_minutes(hour : str) -> Union[int,str]:
+    """Minute of the day of an hh:mm AM/PM hour, so 9:00 AM and 09:00 AM are the same slot.
+    Hours stored before the format was enforced are used as they are"""
+    match = re.match(r'^(\d{1,2}):(\d{2}) ([AP])M$', hour.upper())
+    if not match:
+        return hour
+    hours, minutes, half = match.groups()
+    return (int(hours) % 12 + (12 if half == 'P' else 0)) * 60 + int(minutes)
+
+def hour_order(hour : str) -> tuple:
+    """Sort key that puts the hours in the order of the day, the unparsed ones last"""
+    minutes = hour_minutes(hour)
+    return (0, minutes, '') if isinstance(minutes, int) else (1, 0, hour)
+
+class Schedule_Index:
+    def __init__(self):
+        #minute of the day -> bit of the slot
+        self.slot_bits = {}
+        #class id -> bit of its hour
+        self.class_bits = {}
+        #student id -> OR of the bits of their classes, students without classes aren't stored
+        self.students = {}
+
+    def bit(self, hour : str) -> int:
+        slot = hour_minutes(hour)
+        if slot not in self.slot_bits:
+            self.slot_bits[slot] = 1 << len(self.slot_bits)
+        return self.slot_bits[slot]
+
+    def load(self, connection : Connection):
+        """Replaces the content of the index with the database one. The rows are fetched with .all(),
+        iterating a result row by row is quadratic on aiosqlite (every fetchone pops the head of a list).
+        Everything is built aside and swapped at the end, so it can run in a worker thread"""
+        slot_bits, class_bits = {}, {}
+        for id, hour in connection.execute(select(Class.id, Class.hour)).all():
+            class_bits[id] = slot_bits.setdefault(hour_minutes(hour), 1 << len(slot_bits))
+        students = {}
+        for student_id, class_id in connection.execute(select(StudentClass.idStudent, StudentClass.idClass)).all():
+            students[student_id] = students.get(student_id, 0) | class_bits.get(class_id, 0)
+        self.slot_bits, self.class_bits, self.students = slot_bits, class_bits, students
+
+    def load_classes(self, connection : Connection):
+        """Adds the classes the index doesn't know (e.g. imported ones), the students are left as they are"""
+        for id, hour in connection.execute(select(Class.id, Class.hour)).all():
+            if id not in self.class_bits:
+                self.set_class(id, hour)
+
+    def refresh(self, connection : Connection, student_ids : Iterable[int]):
+        """Recomputes the masks of some students from their enrollments, works with run_sync()"""
+        student_ids = list(student_ids)
+        for student_id in student_ids:
+            self.students.pop(student_id, None)
+        for chunk in chunks(student_ids):
+            rows = connection.execute(select(StudentClass.idStudent, StudentClass.idClass).where(StudentClass.idStudent.in_(chunk))).all()
+            for student_id, class_id in rows:
+                self.students[student_id] = self.students.get(student_id, 0) | self.class_bits.get(class_id, 0)
+
+    #region lookups
+    def has_class(self, class_id : int) -> bool:
+        return class_id in self.class_bits
+
+    def mask(self, student_id : int) -> int:
+        return self.students.get(student_id, 0)
+
+    def conflicts(self, student_id : int, class_ids : List[int]) -> list:
+        """Positions of the classes that collide with the schedule of the student or with an earlier class of the list"""
+        taken = self.mask(student_id)
+        colliding = []
+        for position, class_id in enumerate(class_ids):
+            bit = self.class_bits[class_id]
+            if taken & bit:
+                colliding.append(position)
+            taken |= bit
+        return colliding
+
+    def busy_student(self, student_ids : Iterable[int], class_id : int, hour : str) -> Union[int,None]:
+        """First of the students of a class that has another class at the hour, before the class moves there"""
+        bit = self.slot_bits.get(hour_minutes(hour), 0)
+        if bit == self.class_bits.get(class_id, 0):
+            return None
+        for student_id in student_ids:
+            if self.mask(student_id) & bit:
+                return student_id
+        return None
+    #endregion
+
+    #region writes
+    @contextmanager
+    def enrollment(self, student_id : int, class_ids : Iterable[int]) -> Iterator[int]:
+        """Takes the slots of the classes while the enrollment is written, they are given back if the
+        write fails. The caller must have checked that there are no conflicts"""
+        bits = 0
+        for class_id in class_ids:
+            bits |= self.class_bits[class_id]
+        self.students[student_id] = self.mask(student_id) | bits
+        try:
+            yield bits
+        except BaseException:
+            self.students[student_id] = self.mask(student_id) & ~bits
+            raise
+
+    def set_class(self, class_id : int, hour : str):
+        self.class_bits[class_id] = self.bit(hour)
+
+    def remove_class(self, class_id : int):
+        self.class_bits.pop(class_id, None)
+
+    def remove_classes(self, class_ids : Iterable[int]):
+        for class_id in class_ids:
+            self.class_bits.pop(class_id, None)
+
+    def forget_student(self, student_id : int):
+        self.students.pop(student_id, None)
+    #endregion
+
+class Schedule_Cache:
+    """Rendered /students/{id}/schedule responses, the least recently used ones are dropped first.
+    The routers invalidate a student when their enrollments change, the students of a class when the
+    class changes, and everything when a teacher, subject or career changes"""
+    def __init__(self, size : int):
+        self.size = size
+        #student id -> (class ids, response body)
+        self.entries = OrderedDict()
+        #class id -> cached students that have it
+        self.class_students = {}
+        #Bumped by every invalidation, a response computed before an invalidation is not stored
+        self.version = 0
+
+    def get(self, student_id : int) -> Union[bytes,None]:
+        entry = self.entries.get(student_id)
+        if entry is None:
+            return None
+        self.entries.move_to_end(student_id)
+        return entry[1]
+
+    def put(self, student_id : int, class_ids : List[int], body : bytes, version : int):
+        if version != self.version or self.size <= 0:
+            return
+        self.invalidate(student_id, bump=False)
+        self.entries[student_id] = (class_ids, body)
+        for class_id in class_ids:
+            self.class_students.setdefault(class_id, set()).add(student_id)
+        while len(self.entries) > self.size:
+            self.invalidate(next(iter(self.entries)), bump=False)
+
+    def invalidate(self, student_id : int, bump : bool = True):
+        if bump:
+            self.version += 1
+        entry = self.entries.pop(student_id, None)
+        if entry is None:
+            return
+        for class_id in entry[0]:
+            students = self.class_students.get(class_id)
+            if students is not None:
+                students.discard(student_id)
+                if not students:
+                    del self.class_students[class_id]
+
+    def invalidate_class(self, class_id : int):
+        self.version += 1
+        for student_id in list(self.class_students.get(class_id, ())):
+            self.invalidate(student_id, bump=False)
+
+    def clear(self):
+        self.version += 1
+        self.entries.clear()
+        self.class_students.clear()
+
+schedules = Schedule_Index()
+schedule_cache = Schedule_Cache(SCHEDULE_CACHE_SIZE)
+
+async def reload_schedules():
+    """Rebuilds the whole index, at startup. It runs with the synchronous engine in a worker thread, so the
+    event loop keeps serving while the enrollments are read"""
+    def load():
+        with engine.connect() as connection:
+            schedules.load(connection)
+    await asyncio.to_thread(load)
+
+async def reload_classes():
+    """Adds the classes written outside the routers (imports) to the index"""
+    async with async_engine.connect() as connection:
+        await connection.run_sync(schedules.load_classes)
+
+async def enrolled_students(session : AsyncSession, class_ids : List[int]) -> List[int]:
+    """Students enrolled in the classes, read before a delete that cascades over their enrollments"""
+    students = set()
+    for chunk in chunks(class_ids):
+        students.update((await session.execute(select(StudentClass.idStudent).where(StudentClass.idClass.in_(chunk)))).scalars().all())
+    return list(students)
+
+async def drop_classes(class_ids : List[int], student_ids : List[int]):
+    """Follows a delete that cascaded over the classes: forgets them and recomputes the students that had them"""
+    schedules.remove_classes(class_ids)
+    await refresh_students(student_ids)
+
+async def refresh_students(student_ids : Iterable[int]):
+    """Recomputes some students after their enrollments changed"""
+    async with async_engine.connect() as connection:
+        await connection.run_sync(schedules.refresh, student_ids)
@@ -1,6 +1,27 @@
 from pydantic import BaseModel, Field
+from pydantic.generics import GenericModel
 from datetime import date
-from typing import Union
+from typing import Union, List, Generic, TypeVar
+from settings import CLASS_CAPACITY
+
+T = TypeVar('T')
+
+#region pagination
+class Page(GenericModel, Generic[T]):
+    """A page of records from a list endpoint"""
+    items: List[T] = Field(default=...,title='Records of the page')
+    next: Union[int,None] = Field(default=None,title='Cursor of the next page',
+                                    description='Send it as the after parameter to get the next page, null on the last page')
+#endregion
+
+#region bulk
+class Bulk_Result(BaseModel):
+    """Outcome of one item of a bulk request"""
+    index: int = Field(default=...,title='Position of the item in the request')
+    status_code: int = Field(default=...,title='Same status code the single item endpoint would return')
+    message: str = Field(default=...,title='Success or error message')
+    id: Union[int,None] = Field(default=None,title='Database ID of the created record')
+#endregion
 
 #region student
 class Student_Scheme(BaseModel):
@@ -135,6 +156,7 @@ class Classes_Scheme(BaseModel):
     groupNo: int = Field(default=...,title='Number of the group class',ge=100,le=999)
     idTeacher: int = Field(default=...,title='Database ID of the teacher')
     idSubject: int = Field(default=...,title='Database ID of the subject')
+    capacity: int = Field(default=CLASS_CAPACITY,title='Seats of the class',ge=1)
 
     class Config:
         schema_extra ={
@@ -142,7 +164,8 @@ class Classes_Scheme(BaseModel):
                 "hour": "14:00:00",
                 "groupNo": 340,
                 "idTeacher": 2003,
-                "idSubject": 13
+                "idSubject": 13,
+                "capacity": 40
             }
         }
 
@@ -157,6 +180,7 @@ class Classes_Auxiliar(BaseModel):
     groupNo: Union[int,None] = Field(default=None,title='Number of the group class',ge=100,le=999)
     idTeacher: Union[int,None] = Field(default=None,title='Database ID of the teacher',gt=0)
     idSubject: Union[int,None] = Field(default=None,title='Database ID of the subject',gt=0)
+    capacity: Union[int,None] = Field(default=None,title='Seats of the class, not less than its enrolled students',ge=1)
 
     class Config:
         schema_extra ={
@@ -169,6 +193,43 @@ class Classes_Auxiliar(BaseModel):
         }
 #endregion
 
+#region schedule
+class Schedule_Class(BaseModel):
+    """One class of a student schedule, with the names of its subject and teacher"""
+    idClass: int = Field(title='Database ID of the class')
+    groupNo: int = Field(title='Number of the group class')
+    hour: str = Field(title='Schedule of the class')
+    idSubject: int = Field(title='Database ID of the subject')
+    subject: str = Field(title='Name of the subject')
+    idTeacher: int = Field(title='Database ID of the teacher')
+    teacher: str = Field(title='Full name of the teacher')
+
+class Student_Schedule(BaseModel):
+    """Classes of a student ordered by hour"""
+    idStudent: int = Field(title='Database ID of the student')
+    classes: List[Schedule_Class] = Field(title='Classes of the student')
+#endregion
+
+#region timetable
+class Timetable_Request(BaseModel):
+    """Input of the timetable generator"""
+    careerId: int = Field(default=...,title='Database ID of the career whose subjects get a class')
+    slots: List[str] = Field(default=...,title='Hours the classes can take, in format hh:mm AM/PM',min_items=1,max_items=200)
+    teachers: Union[List[int],None] = Field(default=None,title='Database IDs of the teachers that can give the classes, all of them if it is empty')
+    groups: int = Field(default=1,title='Groups of students of every semester, each one takes every subject of its semester',ge=1,le=50)
+    time_budget: Union[float,None] = Field(default=None,title='Seconds the generator can run',gt=0,le=60)
+
+    class Config:
+        schema_extra ={
+            "example": {
+                "careerId": 2,
+                "slots": ["07:00 AM", "08:00 AM", "09:00 AM", "10:00 AM", "11:00 AM", "12:00 PM"],
+                "teachers": [2003, 2004, 2005],
+                "groups": 2
+            }
+        }
+#endregion
+
 class StudentClasses_Scheme(BaseModel):
     """Student-Classes input model"""
     idStudent: int = Field(default=...,title='Student ID',description='Database ID of the student')
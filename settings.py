@@ -0,0 +1,62 @@
+import os
+
+def env_flag(name : str, default : bool = False) -> bool:
+    """Reads a boolean environment variable, accepts 1/true/yes/on"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+#region database
+#Path of the SQLite file, relative to the working directory unless it's absolute
+DATABASE_PATH = os.getenv('SCHOOL_DB_PATH', 'sql/school.db')
+#Log every SQL statement, only useful while debugging because it's expensive
+SQL_ECHO = env_flag('SCHOOL_SQL_ECHO')
+#Connections kept open by the engines
+POOL_SIZE = int(os.getenv('SCHOOL_DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.getenv('SCHOOL_DB_MAX_OVERFLOW', '10'))
+
+#Pragmas applied to every new SQLite connection, each one can be overridden with SCHOOL_SQLITE_<NAME>
+SQLITE_PRAGMAS = {
+    #WAL lets readers keep reading while a writer commits
+    'journal_mode': os.getenv('SCHOOL_SQLITE_JOURNAL_MODE', 'WAL'),
+    #NORMAL is durable under WAL except for the last transactions on power loss
+    'synchronous': os.getenv('SCHOOL_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    #Negative values are KiB, so this is a 64 MB page cache per connection
+    'cache_size': int(os.getenv('SCHOOL_SQLITE_CACHE_SIZE', '-64000')),
+    'mmap_size': int(os.getenv('SCHOOL_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    #Milliseconds a connection waits for a lock before failing with "database is locked"
+    'busy_timeout': int(os.getenv('SCHOOL_SQLITE_BUSY_TIMEOUT', '5000')),
+    'foreign_keys': os.getenv('SCHOOL_SQLITE_FOREIGN_KEYS', 'ON'),
+}
+#endregion
+
+#region api
+#Page size of the list endpoints when the client doesn't send a limit, and the biggest one allowed
+DEFAULT_PAGE_SIZE = int(os.getenv('SCHOOL_DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.getenv('SCHOOL_MAX_PAGE_SIZE', '1000'))
+#Rows fetched from the cursor and sent per chunk by the /export/ endpoints
+EXPORT_CHUNK_SIZE = int(os.getenv('SCHOOL_EXPORT_CHUNK_SIZE', '1000'))
+#Biggest list accepted by the /create/bulk endpoints
+BULK_MAX_ITEMS = int(os.getenv('SCHOOL_BULK_MAX_ITEMS', '10000'))
+#Seats of the classes created without a capacity, also given to the existing ones by the migration that added it
+CLASS_CAPACITY = int(os.getenv('SCHOOL_CLASS_CAPACITY', '40'))
+#Rows written per transaction by the CSV importer
+IMPORT_CHUNK_SIZE = int(os.getenv('SCHOOL_IMPORT_CHUNK_SIZE', '1000'))
+#Rejected rows returned by the import endpoint, the command line importer writes all of them to a file
+IMPORT_MAX_ERRORS = int(os.getenv('SCHOOL_IMPORT_MAX_ERRORS', '1000'))
+#Seconds the timetable generator runs when the request doesn't send a budget
+TIMETABLE_TIME_BUDGET = float(os.getenv('SCHOOL_TIMETABLE_TIME_BUDGET', '2'))
+#Student schedules kept rendered in memory by /students/{id}/schedule, 0 disables the cache
+SCHEDULE_CACHE_SIZE = int(os.getenv('SCHOOL_SCHEDULE_CACHE_SIZE', '10000'))
+#Responses of the /obtain/ and /search/ endpoints kept in memory, and seconds each one lives, 0 disables the cache
+RESPONSE_CACHE_SIZE = int(os.getenv('SCHOOL_RESPONSE_CACHE_SIZE', '2048'))
+RESPONSE_CACHE_TTL = float(os.getenv('SCHOOL_RESPONSE_CACHE_TTL', '300'))
+#Count the requests and their latency per route, exposed on /metrics
+METRICS_ENABLED = env_flag('SCHOOL_METRICS', True)
+#Return the SQL statements of every request and their time in the X-DB-Queries and Server-Timing headers
+DEBUG_QUERIES = env_flag('SCHOOL_DEBUG_QUERIES')
+#Statements slower than these milliseconds are logged with their plan, and how many of them are kept for /admin/slow_queries/
+SLOW_QUERY_MS = float(os.getenv('SCHOOL_SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG_SIZE = int(os.getenv('SCHOOL_SLOW_QUERY_LOG_SIZE', '500'))
+#endregion
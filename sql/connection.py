@@ -1,10 +1,20 @@
 from sqlalchemy.orm import sessionmaker
-from sql.definition import engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from sql.definition import engine, async_engine
+
+#Process-wide session factories, built once when the module is imported
+SessionLocal = sessionmaker(bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
 
 def db_connection():
+    """Synchronous session, kept as a fallback for scripts and code that can't await"""
+    session = SessionLocal()
     try:
-        Session = sessionmaker(bind=engine)
-        session = Session()
         yield session
     finally:
-        session.close() 
\ No newline at end of file
+        session.close()
+
+async def async_db_connection():
+    """Asynchronous session used by the routers"""
+    async with AsyncSessionLocal() as session:
+        yield session
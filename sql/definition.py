@@ -1,11 +1,28 @@
-from sqlalchemy import create_engine, Column, String, Integer, Date, Float, ForeignKey, CheckConstraint
+from sqlalchemy import create_engine, Column, String, Integer, Date, Float, ForeignKey, CheckConstraint, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from settings import DATABASE_PATH, SQL_ECHO, POOL_SIZE, MAX_OVERFLOW, SQLITE_PRAGMAS, CLASS_CAPACITY
 
 Base = declarative_base()
 
-engine = create_engine('sqlite:///sql/school.db', echo=True)
+engine = create_engine(f'sqlite:///{DATABASE_PATH}', echo=SQL_ECHO, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
+#Async engine over the same database file, used by the routers so the queries don't block the event loop.
+#aiosqlite defaults to NullPool (one new connection and thread per request), so we pool it explicitly
+async_engine = create_async_engine(f'sqlite+aiosqlite:///{DATABASE_PATH}', echo=SQL_ECHO, poolclass=AsyncAdaptedQueuePool,
+                                    pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Applies the configured pragmas once per new connection"""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+event.listen(engine, 'connect', set_sqlite_pragmas)
+event.listen(async_engine.sync_engine, 'connect', set_sqlite_pragmas)
 
 class Student(Base):
     __tablename__ = 'Students'
@@ -19,12 +36,10 @@ class Student(Base):
     careerId = Column(Integer,ForeignKey('Careers.id', ondelete='CASCADE', onupdate='CASCADE'),nullable=False)
     __table_args__ = (
         CheckConstraint(studentId >= 10000, name='studentId_format'),
-    )
-    __table_args__ = (
         CheckConstraint(semester.between(1,10), name='number_semesters'),
-    )
-    __table_args__ = (
-        CheckConstraint(semester.between(1,100), name='gpa_range'),
+        CheckConstraint(gpa.between(0,100), name='gpa_range'),
+        Index('ix_students_names', 'firstName', 'secondName'),
+        Index('ix_students_career', 'careerId', 'semester'),
     )
 
 class Subject(Base):
@@ -35,6 +50,7 @@ class Subject(Base):
     careerId = Column(Integer,ForeignKey('Careers.id', ondelete='CASCADE', onupdate='CASCADE'), nullable = False)
     __table_args__ = (
         CheckConstraint(semester.between(1,10), name='number_semesters'),
+        Index('ix_subjects_career', 'careerId', 'semester'),
     )
 
 class Teacher(Base):
@@ -45,6 +61,7 @@ class Teacher(Base):
     secondName = Column(String(50), nullable = False)
     __table_args__ = (
         CheckConstraint(employeeId >= 1000, name='employeeId_format'),
+        Index('ix_teachers_names', 'firstName', 'secondName'),
     )
 
 class Career(Base):
@@ -59,6 +76,11 @@ class StudentClass(Base):
     id = Column(Integer, primary_key=True)
     idStudent = Column(Integer,ForeignKey('Students.id', ondelete='CASCADE', onupdate='CASCADE'),nullable = False)
     idClass = Column(Integer,ForeignKey('Classes.id', ondelete='CASCADE', onupdate='CASCADE') ,nullable = False)
+    __table_args__ = (
+        Index('ix_student_classes_student', 'idStudent', 'idClass'),
+        #Lets the cascade of a class delete find its enrollments without a scan
+        Index('ix_student_classes_class', 'idClass'),
+    )
 
 class Class(Base):
     __tablename__ = 'Classes'
@@ -67,8 +89,13 @@ class Class(Base):
     groupNo = Column(Integer, nullable = False, unique = True)
     idTeacher = Column(Integer,ForeignKey('Teachers.id', ondelete='CASCADE', onupdate='CASCADE'),nullable = False)
     idSubject = Column(Integer,ForeignKey('Subjects.id', ondelete='CASCADE', onupdate='CASCADE'),nullable = False)
-    
+    capacity = Column(Integer, nullable = False, server_default = str(CLASS_CAPACITY))
+    #Students enrolled, kept by the triggers of sql/seats.py, never written by the API
+    enrolled = Column(Integer, nullable = False, server_default = '0')
+    __table_args__ = (
+        Index('ix_classes_teacher_hour', 'idTeacher', 'hour'),
+        Index('ix_classes_subject', 'idSubject'),
+    )
 
 #Base.metadata.drop_all(engine)
 #Base.metadata.create_all(engine)
-#event.listen(engine, 'connect', lambda c, _: c.execute('pragma foreign_keys=on'))
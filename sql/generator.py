@@ -0,0 +1,143 @@
+"""Fills an empty database with a synthetic school
+
+Every size is configurable and the same seed always gives the same school. The rows follow the
+rules the API enforces, not only the constraints of the tables: unique names and ids, group numbers
+between 100 and 999, hours in format hh:mm AM/PM, no teacher with two classes at the same hour
+(the classes are placed with the timetable generator, one semester group per career and semester)
+and students enrolled only in classes of their career and semester that don't share an hour.
+
+The tables are written with plain inserts in one transaction, so even a million students take seconds.
+
+Usage: SCHOOL_DB_PATH=/tmp/big.db python -m sql.generator [--students 100000] [--seed 7] [...]
+"""
+from sqlalchemy import select, insert
+from sqlalchemy.engine import Engine
+from datetime import date, timedelta
+from typing import Union
+from sql.definition import Career, Subject, Teacher, Class, Student, StudentClass
+from sql.migrations import migrate
+from timetable import generate_timetable
+from utils import chunks
+import argparse
+import collections
+import json
+import math
+import random
+import sys
+
+FIRST_NAMES = ['Horacio', 'Ana', 'Luis', 'Maria', 'George', 'Sofia', 'Diego', 'Valeria', 'Carlos', 'Lucia', 'Jorge', 'Elena',
+                'Pedro', 'Camila', 'Miguel', 'Isabel', 'Andres', 'Paula', 'Ricardo', 'Daniela', 'Tomas', 'Fernanda', 'Raul', 'Julia']
+LAST_NAMES = ['Gomez', 'Lopez', 'Mendel', 'Fuentes', 'Smith', 'Ishigami', 'Garcia', 'Martinez', 'Hernandez', 'Ruiz', 'Torres',
+                'Flores', 'Rivera', 'Morales', 'Ortiz', 'Castillo', 'Romero', 'Vargas', 'Reyes', 'Navarro', 'Silva', 'Rojas']
+FIELDS = ['Aviation', 'Law', 'Medicine', 'Architecture', 'Biology', 'Chemistry', 'Economics', 'Physics', 'Nursing',
+            'Philosophy', 'Mathematics', 'Psychology', 'Agronomy', 'Music', 'History', 'Geology']
+#Every hour from 07:00 AM to 08:00 PM
+SLOTS = [f'{(hour - 1) % 12 + 1:02d}:00 {"AM" if hour < 12 else "PM"}' for hour in range(7, 21)]
+FIRST_GROUP, LAST_GROUP = 100, 999
+
+def career_names(careers : int) -> list:
+    return [FIELDS[number % len(FIELDS)] + (f' {number // len(FIELDS) + 1}' if number >= len(FIELDS) else '') for number in range(careers)]
+
+def generate_school(engine : Engine, careers : int = 4, semesters : int = 10, subjects_per_semester : int = 4,
+                    sections : int = 1, teachers : int = 60, students : int = 10000, enrollments : int = 4,
+                    seed : int = 7, chunk_size : int = 10000, capacity : Union[int,None] = None) -> dict:
+    """Writes the school into an empty database, returns the rows written per table.
+    sections: classes of every subject. enrollments: classes per student (at most one per subject
+    of their semester). capacity: seats of every class, by default half again the students expected
+    in a class (from the sections the timetable placed) plus 10, enough for the random draw and for
+    some more enrollments. The students are only drawn into classes with free seats"""
+    if not 1 <= semesters <= 10:
+        raise ValueError('A career has between 1 and 10 semesters')
+    if careers * semesters * subjects_per_semester * sections > LAST_GROUP - FIRST_GROUP + 1:
+        raise ValueError(f'The group numbers only allow {LAST_GROUP - FIRST_GROUP + 1} classes')
+    randomizer = random.Random(seed)
+    report = {}
+    with engine.begin() as connection:
+        migrate(connection)
+        if connection.execute(select(Career.id).limit(1)).first() is not None:
+            raise ValueError('The database already has careers, the generator only fills an empty one')
+
+        career_ids = connection.execute(insert(Career.__table__).returning(Career.id),
+                                        [{'name': name} for name in career_names(careers)]).scalars().all()
+        subject_rows = [{'name': f'{career_name} {semester}-{number + 1}', 'semester': semester, 'careerId': career_id}
+                        for career_id, career_name in zip(career_ids, career_names(careers))
+                        for semester in range(1, semesters + 1) for number in range(subjects_per_semester)]
+        subject_ids = connection.execute(insert(Subject.__table__).returning(Subject.id), subject_rows).scalars().all()
+        teacher_ids = connection.execute(insert(Teacher.__table__).returning(Teacher.id),
+                                        [{'employeeId': 1000 + number, 'firstName': randomizer.choice(FIRST_NAMES),
+                                          'secondName': f'{randomizer.choice(LAST_NAMES)} {number + 1}'} for number in range(teachers)]).scalars().all()
+
+        #Every (career, semester) is one group of students, so its classes can't share an hour
+        to_place = [((subject_id, section), (row['careerId'], row['semester']))
+                    for subject_id, row in zip(subject_ids, subject_rows) for section in range(sections)]
+        timetable = generate_timetable(to_place, SLOTS, teacher_ids, time_budget=60)
+        semester_of = {subject_id: (row['careerId'], row['semester']) for subject_id, row in zip(subject_ids, subject_rows)}
+        #The students only draw the subjects and sections the timetable placed, the seats follow them
+        placed_sections = collections.Counter(subject_id for subject_id, _ in timetable['placed'])
+        offered_subjects = collections.Counter(semester_of[subject_id] for subject_id in placed_sections)
+
+        def class_capacity(subject_id : int) -> int:
+            if capacity is not None:
+                return capacity
+            subjects = offered_subjects[semester_of[subject_id]]
+            expected = students / (careers * semesters) * min(enrollments, subjects) / subjects / placed_sections[subject_id]
+            return math.ceil(expected * 1.5) + 10
+
+        class_rows = [{'hour': hour, 'groupNo': FIRST_GROUP + number, 'idTeacher': teacher, 'idSubject': subject_id, 'capacity': class_capacity(subject_id)}
+                        for number, ((subject_id, _), (hour, teacher)) in enumerate(sorted(timetable['placed'].items()))]
+        class_ids = connection.execute(insert(Class.__table__).returning(Class.id), class_rows).scalars().all() if class_rows else []
+
+        #(career, semester) -> {subject id: [class ids of its sections]}, and the free seats of every class
+        offer = {}
+        seats = {}
+        for class_id, row in zip(class_ids, class_rows):
+            offer.setdefault(semester_of[row['idSubject']], {}).setdefault(row['idSubject'], []).append(class_id)
+            seats[class_id] = row['capacity']
+
+        first_birthday, birthdays = date(1995, 1, 1), (date(2006, 12, 31) - date(1995, 1, 1)).days
+        enrolled = 0
+        for numbers in chunks(range(students), chunk_size):
+            student_rows = []
+            for number in numbers:
+                student_rows.append({'firstName': randomizer.choice(FIRST_NAMES), 'secondName': f'{randomizer.choice(LAST_NAMES)} {number + 1}',
+                                    'studentId': 10000 + number, 'birthday': first_birthday + timedelta(days=randomizer.randrange(birthdays)),
+                                    'semester': randomizer.randint(1, semesters), 'gpa': round(randomizer.uniform(0, 100), 1),
+                                    'careerId': randomizer.choice(career_ids)})
+            student_ids = connection.execute(insert(Student.__table__).returning(Student.id), student_rows).scalars().all()
+            enrollment_rows = []
+            for student_id, row in zip(student_ids, student_rows):
+                #Only the sections with free seats, so a small capacity leaves the students with fewer classes
+                subjects = {subject_id: open_sections for subject_id, sections in offer.get((row['careerId'], row['semester']), {}).items()
+                            if (open_sections := [class_id for class_id in sections if seats[class_id]])}
+                for subject_id in randomizer.sample(sorted(subjects), min(enrollments, len(subjects))):
+                    class_id = randomizer.choice(subjects[subject_id])
+                    seats[class_id] -= 1
+                    enrollment_rows.append({'idStudent': student_id, 'idClass': class_id})
+            if enrollment_rows:
+                connection.execute(insert(StudentClass.__table__), enrollment_rows)
+            enrolled += len(enrollment_rows)
+
+        report = {'careers': len(career_ids), 'subjects': len(subject_ids), 'teachers': len(teacher_ids), 'classes': len(class_ids),
+                    'unplaced_classes': len(timetable['unplaced']), 'students': students, 'enrollments': enrolled, 'seed': seed}
+    return report
+
+if __name__ == '__main__':
+    from sql.definition import engine
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--careers', type=int, default=4)
+    parser.add_argument('--semesters', type=int, default=10)
+    parser.add_argument('--subjects-per-semester', type=int, default=4)
+    parser.add_argument('--sections', type=int, default=1, help='Classes of every subject')
+    parser.add_argument('--teachers', type=int, default=60)
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--enrollments', type=int, default=4, help='Classes of every student')
+    parser.add_argument('--capacity', type=int, help='Seats of every class')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    try:
+        report = generate_school(engine, args.careers, args.semesters, args.subjects_per_semester, args.sections,
+                                    args.teachers, args.students, args.enrollments, args.seed, capacity=args.capacity)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,231 @@
+"""Imports a whole school from CSV files
+
+The files are read as streams, one chunk of rows at a time, in dependency order (careers, subjects,
+teachers, classes, students). The foreign keys are resolved by natural key (career and subject names,
+teacher employeeId) with in-memory maps, every row is validated with the models of schemes.py and
+every chunk is written in its own transaction. Rejected rows go to an error CSV with the reason.
+
+Expected columns:
+    careers:  name
+    subjects: name, semester, career
+    teachers: employeeId, firstName, secondName
+    classes:  hour, groupNo, employeeId, subject, capacity (optional, SCHOOL_CLASS_CAPACITY when it's missing or empty)
+    students: firstName, secondName, studentId, birthday, semester, gpa, career
+
+Usage: python -m sql.importer --careers careers.csv --students students.csv [...] [--errors errors.csv]
+"""
+from sqlalchemy import select, insert, tuple_
+from sqlalchemy.engine import Connection, Engine
+from pydantic import ValidationError
+from datetime import date
+from typing import Callable, Iterator, TextIO, Union
+from schemes import Career_Scheme, Subject_Scheme, Teacher_Scheme, Classes_Scheme, Student_Scheme
+from sql.definition import Career, Subject, Teacher, Class, Student
+from occupancy import slot_key
+from utils import chunks, HOUR_PATTERN
+import argparse
+import csv
+import json
+import re
+import sys
+
+ORDER = ('careers', 'subjects', 'teachers', 'classes', 'students')
+
+class RowError(Exception):
+    pass
+
+class Import_Maps:
+    """Natural key -> database id of the records the next files reference"""
+    def __init__(self, connection : Connection):
+        self.careers = dict(connection.execute(select(Career.name, Career.id)).all())
+        self.subjects = dict(connection.execute(select(Subject.name, Subject.id)).all())
+        self.teachers = dict(connection.execute(select(Teacher.employeeId, Teacher.id)).all())
+
+    def career(self, name : str) -> int:
+        if name not in self.careers:
+            raise RowError(f'The career {name} does not exist in the database')
+        return self.careers[name]
+
+    def subject(self, name : str) -> int:
+        if name not in self.subjects:
+            raise RowError(f'The subject {name} does not exist in the database')
+        return self.subjects[name]
+
+    def teacher(self, employee_id : str) -> int:
+        if not employee_id.isdigit() or int(employee_id) not in self.teachers:
+            raise RowError(f'The teacher with the employee ID {employee_id} does not exist in the database')
+        return self.teachers[int(employee_id)]
+
+#region row builders
+#Each builder turns one CSV row into the values of one insert, or raises RowError/ValidationError
+def build_career(row : dict, maps : Import_Maps) -> dict:
+    return Career_Scheme(name = row['name']).dict()
+
+def build_subject(row : dict, maps : Import_Maps) -> dict:
+    return Subject_Scheme(name = row['name'], semester = row['semester'], careerId = maps.career(row['career'])).dict()
+
+def build_teacher(row : dict, maps : Import_Maps) -> dict:
+    return Teacher_Scheme(employeeId = row['employeeId'], firstName = row['firstName'], secondName = row['secondName']).dict()
+
+def build_class(row : dict, maps : Import_Maps) -> dict:
+    class_item = Classes_Scheme(hour = row['hour'].upper(), groupNo = row['groupNo'],
+                                idTeacher = maps.teacher(row['employeeId']), idSubject = maps.subject(row['subject']),
+                                **({'capacity': row['capacity']} if row.get('capacity') else {}))
+    if not re.match(HOUR_PATTERN, class_item.hour):
+        raise RowError("The hour isn't in format hh:mm AM/PM")
+    return class_item.dict()
+
+def build_student(row : dict, maps : Import_Maps) -> dict:
+    student = Student_Scheme(firstName = row['firstName'], secondName = row['secondName'], studentId = row['studentId'],
+                                birthday = row['birthday'], semester = row['semester'], gpa = row['gpa'],
+                                careerId = maps.career(row['career']))
+    student_dict = student.dict()
+    student_dict['birthday'] = date.fromisoformat(student.birthday)
+    return student_dict
+#endregion
+
+#region duplicate checks
+#Each check receives the valid rows of a chunk and returns the ones that can be inserted,
+#with one query per unique key for the whole chunk (the previous chunks are already in the database)
+def existing(connection : Connection, columns : tuple, values : list) -> set:
+    found = set()
+    key = columns[0] if len(columns) == 1 else tuple_(*columns)
+    for chunk in chunks(list(set(values))):
+        rows = connection.execute(select(*columns).where(key.in_(chunk))).all()
+        found.update(row[0] if len(columns) == 1 else tuple(row) for row in rows)
+    return found
+
+def unique_rows(rows : list, checks : list, reject : Callable) -> list:
+    """checks: (key function, values already taken, error message)"""
+    accepted = []
+    for line, raw, values in rows:
+        for key, taken, message in checks:
+            if key(values) in taken:
+                reject(line, raw, message)
+                break
+        else:
+            for key, taken, _ in checks:
+                taken.add(key(values))
+            accepted.append((line, raw, values))
+    return accepted
+
+def check_careers(connection : Connection, rows : list, maps : Import_Maps, reject : Callable) -> list:
+    return unique_rows(rows, [(lambda v: v['name'], set(maps.careers), 'Career already exists in database')], reject)
+
+def check_subjects(connection : Connection, rows : list, maps : Import_Maps, reject : Callable) -> list:
+    return unique_rows(rows, [(lambda v: v['name'], set(maps.subjects), 'A subject with the same name is already registered')], reject)
+
+def check_teachers(connection : Connection, rows : list, maps : Import_Maps, reject : Callable) -> list:
+    names = existing(connection, (Teacher.firstName, Teacher.secondName), [(v['firstName'], v['secondName']) for _, _, v in rows])
+    return unique_rows(rows, [
+        (lambda v: (v['firstName'], v['secondName']), names, 'A teacher with the same name is already registered'),
+        (lambda v: v['employeeId'], set(maps.teachers), "The given employee ID it's already assigned"),
+    ], reject)
+
+def check_classes(connection : Connection, rows : list, maps : Import_Maps, reject : Callable) -> list:
+    groups = existing(connection, (Class.groupNo,), [v['groupNo'] for _, _, v in rows])
+    #The slots of the teachers are compared by minute of the day, 9:00 AM and 09:00 AM are the same hour
+    schedules = set()
+    for teachers in chunks(list({v['idTeacher'] for _, _, v in rows})):
+        schedules.update(slot_key(teacher, hour) for teacher, hour in
+                            connection.execute(select(Class.idTeacher, Class.hour).where(Class.idTeacher.in_(teachers))).all())
+    return unique_rows(rows, [
+        (lambda v: v['groupNo'], groups, 'A class with the same group number already exists'),
+        (lambda v: slot_key(v['idTeacher'], v['hour']), schedules, 'The teacher has already assigned to another class at the same hour'),
+    ], reject)
+
+def check_students(connection : Connection, rows : list, maps : Import_Maps, reject : Callable) -> list:
+    names = existing(connection, (Student.firstName, Student.secondName), [(v['firstName'], v['secondName']) for _, _, v in rows])
+    student_ids = existing(connection, (Student.studentId,), [v['studentId'] for _, _, v in rows])
+    return unique_rows(rows, [
+        (lambda v: (v['firstName'], v['secondName']), names, 'A student with the same name is already registered'),
+        (lambda v: v['studentId'], student_ids, 'A student with the same student id is already registered'),
+    ], reject)
+#endregion
+
+#table: (model, row builder, duplicate check, (natural key column, map to update) or None)
+TABLES = {
+    'careers': (Career, build_career, check_careers, ('name', 'careers')),
+    'subjects': (Subject, build_subject, check_subjects, ('name', 'subjects')),
+    'teachers': (Teacher, build_teacher, check_teachers, ('employeeId', 'teachers')),
+    'classes': (Class, build_class, check_classes, None),
+    'students': (Student, build_student, check_students, None),
+}
+
+def read_chunks(source : TextIO, chunk_size : int) -> Iterator[list]:
+    """Yields lists of (line number, row) without ever holding more than one chunk of the file"""
+    chunk = []
+    #Line 1 is the header
+    for line, row in enumerate(csv.DictReader(source), start=2):
+        chunk.append((line, row))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_school(engine : Engine, sources : dict, chunk_size : int = 1000, on_error : Union[Callable,None] = None,
+                    progress : Union[Callable,None] = None) -> dict:
+    """Imports the given CSV streams (table name -> text stream) in dependency order.
+    Returns {table: {'processed', 'inserted', 'rejected'}}, on_error(table, line, message, row) is called
+    for every rejected row and progress(table, summary) after every chunk"""
+    report = {}
+    with engine.connect() as connection:
+        maps = Import_Maps(connection)
+        for table in ORDER:
+            if table not in sources:
+                continue
+            model, build, check, key = TABLES[table]
+            summary = report[table] = {'processed': 0, 'inserted': 0, 'rejected': 0}
+
+            def reject(line : int, raw : dict, message : str):
+                summary['rejected'] += 1
+                if on_error:
+                    on_error(table, line, message, raw)
+
+            for chunk in read_chunks(sources[table], chunk_size):
+                summary['processed'] += len(chunk)
+                rows = []
+                for line, raw in chunk:
+                    try:
+                        rows.append((line, raw, build(raw, maps)))
+                    except ValidationError as e:
+                        reject(line, raw, '; '.join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+                    except (RowError, KeyError) as e:
+                        reject(line, raw, str(e) if isinstance(e, RowError) else f'Missing column {e}')
+                rows = check(connection, rows, maps, reject)
+                if rows:
+                    returning = [model.id] + ([getattr(model, key[0])] if key else [])
+                    inserted = connection.execute(insert(model.__table__).returning(*returning), [values for _, _, values in rows]).all()
+                    connection.commit()
+                    summary['inserted'] += len(rows)
+                    if key:
+                        getattr(maps, key[1]).update((natural_key, id) for id, natural_key in inserted)
+                if progress:
+                    progress(table, summary)
+    return report
+
+if __name__ == '__main__':
+    from sql.definition import engine
+    from settings import IMPORT_CHUNK_SIZE
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for table in ORDER:
+        parser.add_argument(f'--{table}', help=f'CSV file with the {table}')
+    parser.add_argument('--errors', default='import_errors.csv', help='CSV file where the rejected rows are written')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    files = {table: open(getattr(args, table), newline='', encoding='utf-8') for table in ORDER if getattr(args, table)}
+    try:
+        with open(args.errors, 'w', newline='', encoding='utf-8') as errors:
+            error_writer = csv.writer(errors)
+            error_writer.writerow(['table', 'line', 'error', 'row'])
+            report = import_school(engine, files, args.chunk_size,
+                                    on_error = lambda table, line, message, raw: error_writer.writerow([table, line, message, json.dumps(raw)]),
+                                    progress = lambda table, summary: print(f'{table}: {summary}', file=sys.stderr))
+    finally:
+        for file in files.values():
+            file.close()
+    print(json.dumps(report, indent=2))
+    if any(summary['rejected'] for summary in report.values()):
+        print(f'Rejected rows were written to {args.errors}')
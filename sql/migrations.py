@@ -0,0 +1,116 @@
+"""Schema migrations for an existing school.db
+
+The schema version is stored in PRAGMA user_version, every migration runs once, in order, inside
+its own transaction, so a database that already has data is upgraded in place.
+
+Usage: python -m sql.migrations [--check-plans]
+"""
+from sqlalchemy import select, and_
+from sqlalchemy.engine import Connection
+from sql.definition import Base, Student, Teacher, Subject, Class, StudentClass
+from sql.search import create_search_tables, narrow_update_triggers
+from sql.stats import create_career_stats, career_stats
+from sql.seats import create_class_seats
+import sys
+
+def create_base_tables(connection : Connection):
+    """Tables of sql/definition.py, only the missing ones are created"""
+    Base.metadata.create_all(connection, checkfirst=True)
+
+def create_indexes(connection : Connection):
+    """Secondary indexes declared in the models"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+#Text of the error of the gpa_range check, so the routers see the same error in every database
+GPA_RANGE = 'CHECK constraint failed: gpa_range'
+GPA_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS "Students_gpa_insert" BEFORE INSERT ON "Students"
+        WHEN new.gpa NOT BETWEEN 0 AND 100 BEGIN SELECT RAISE(ABORT, '{GPA_RANGE}'); END''',
+    f'''CREATE TRIGGER IF NOT EXISTS "Students_gpa_update" BEFORE UPDATE OF gpa ON "Students"
+        WHEN new.gpa NOT BETWEEN 0 AND 100 BEGIN SELECT RAISE(ABORT, '{GPA_RANGE}'); END''',
+]
+
+def check_gpa_range(connection : Connection):
+    """The Students tables created before version 6 have the gpa_range check over the semester. SQLite only
+    changes a check by rebuilding the table (and its cascades), so triggers check their GPAs instead"""
+    table = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'Students'").scalar()
+    if 'gpa BETWEEN' not in table:
+        for statement in GPA_TRIGGERS:
+            connection.exec_driver_sql(statement)
+
+#(version, description, step), append new migrations at the end and never reorder them
+MIGRATIONS = [
+    (1, 'Base tables', create_base_tables),
+    (2, 'Full-text search tables', create_search_tables),
+    (3, 'Secondary indexes for the hot lookup columns', create_indexes),
+    (4, 'Running statistics of every career and semester', create_career_stats),
+    (5, 'Capacity and enrolled students of the classes', create_class_seats),
+    (6, 'Range of the GPA of the students', check_gpa_range),
+    (7, 'Search tables reindexed only when the names change', narrow_update_triggers),
+]
+
+def schema_version(connection : Connection) -> int:
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+def migrate(connection : Connection) -> list:
+    """Applies the pending migrations, returns the versions that were applied"""
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= schema_version(connection):
+            continue
+        with connection.begin_nested():
+            step(connection)
+            connection.exec_driver_sql(f'PRAGMA user_version = {version}')
+        applied.append(version)
+    return applied
+
+#Lookups the routers run on every request, none of them may fall back to a full table scan
+HOT_QUERIES = {
+    'student by names': select(Student.id).filter_by(firstName = 'Horacio', secondName = 'Gomez'),
+    'student by student id': select(Student.id).filter_by(studentId = 19930),
+    'students by career': select(Student).filter_by(careerId = 2).order_by(Student.id).limit(100),
+    'students by career and semester': select(Student).filter_by(careerId = 2, semester = 3).order_by(Student.id).limit(100),
+    'teacher by names': select(Teacher.id).filter_by(firstName = 'George', secondName = 'Mendel'),
+    'teacher by employee id': select(Teacher.id).filter_by(employeeId = 2004),
+    'subjects by career': select(Subject).filter_by(careerId = 2).order_by(Subject.id).limit(100),
+    'class by group': select(Class.id).filter_by(groupNo = 340),
+    'teacher busy at hour': select(Class.id).filter_by(idTeacher = 1, hour = '02:00 PM'),
+    'classes by subject': select(Class).filter_by(idSubject = 13).order_by(Class.id).limit(100),
+    'enrollment of student in class': select(StudentClass.id).filter_by(idStudent = 23003, idClass = 4),
+    'stats of career': select(career_stats).filter_by(careerId = 2),
+    'seats of career and semester': select(Class.id, Class.capacity, Class.enrolled).join(Subject, Subject.id == Class.idSubject).\
+        filter(Subject.careerId == 2, Subject.semester == 3),
+    'classes of student': select(Class.hour).join(StudentClass, and_(StudentClass.idClass == Class.id, StudentClass.idStudent == 23003)),
+}
+
+def query_plan(connection : Connection, statement) -> list:
+    """EXPLAIN QUERY PLAN of a statement, one detail string per step"""
+    compiled = statement.compile(connection, compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}')]
+
+def check_query_plans(connection : Connection) -> dict:
+    """Returns the hot queries whose plan scans a whole table, with their plans"""
+    full_scans = {}
+    for name, statement in HOT_QUERIES.items():
+        plan = query_plan(connection, statement)
+        #"SCAN table" reads every row, "SEARCH table USING INDEX" is what we want
+        if any(step.startswith('SCAN ') and 'VIRTUAL TABLE' not in step for step in plan):
+            full_scans[name] = plan
+    return full_scans
+
+if __name__ == '__main__':
+    from sql.definition import engine
+    with engine.begin() as connection:
+        applied = migrate(connection)
+        print(f'Applied migrations: {applied}' if applied else 'The database is up to date')
+        print(f'Schema version: {schema_version(connection)}')
+    if '--check-plans' in sys.argv:
+        with engine.connect() as connection:
+            full_scans = check_query_plans(connection)
+        for name, plan in full_scans.items():
+            print(f'Full scan in "{name}": {plan}')
+        if full_scans:
+            sys.exit(1)
+        print(f'All {len(HOT_QUERIES)} hot queries use an index')
@@ -0,0 +1,80 @@
+from sqlalchemy import Table, Column, Integer, String, Float, MetaData, literal_column, inspect
+from sqlalchemy.engine import Connection
+import re
+
+#FTS5 shadow tables live in their own metadata so Base.metadata.create_all() doesn't try to create them as plain tables
+search_metadata = MetaData()
+
+#Search table -> (source table, indexed columns)
+SEARCH_TABLES = {
+    'StudentsSearch': ('Students', ('firstName', 'secondName')),
+    'TeachersSearch': ('Teachers', ('firstName', 'secondName')),
+    'SubjectsSearch': ('Subjects', ('name',)),
+}
+
+def search_table(name : str) -> Table:
+    """SQLAlchemy view of a search table, rowid is the id of the source record"""
+    columns = SEARCH_TABLES[name][1]
+    return Table(name, search_metadata,
+                    Column('rowid', Integer, primary_key=True),
+                    Column('rank', Float),
+                    *[Column(column, String) for column in columns])
+
+students_search = search_table('StudentsSearch')
+teachers_search = search_table('TeachersSearch')
+subjects_search = search_table('SubjectsSearch')
+
+def search_table_ddl(name : str) -> list:
+    """Statements that create an external content FTS5 table over the source table and the
+    triggers that keep it in sync on every insert, update and delete (cascades included)"""
+    source, columns = SEARCH_TABLES[name]
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    new_values = ', '.join(f'new."{column}"' for column in columns)
+    old_values = ', '.join(f'old."{column}"' for column in columns)
+    delete_old = f'INSERT INTO "{name}"("{name}", rowid, {column_list}) VALUES (\'delete\', old.id, {old_values});'
+    insert_new = f'INSERT INTO "{name}"(rowid, {column_list}) VALUES (new.id, {new_values});'
+    return [
+        f'''CREATE VIRTUAL TABLE IF NOT EXISTS "{name}" USING fts5({column_list}, content='{source}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+        f'CREATE TRIGGER IF NOT EXISTS "{name}_insert" AFTER INSERT ON "{source}" BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS "{name}_delete" AFTER DELETE ON "{source}" BEGIN {delete_old} END',
+        #Only the updates of the indexed columns reindex the record, e.g. a new GPA leaves the search table alone
+        f'CREATE TRIGGER IF NOT EXISTS "{name}_update" AFTER UPDATE OF {column_list} ON "{source}" BEGIN {delete_old} {insert_new} END',
+    ]
+
+def create_search_tables(connection : Connection):
+    """Creates the missing search tables and fills them from the source tables, it's safe to run on every start"""
+    existing = set(inspect(connection).get_table_names())
+    for name in SEARCH_TABLES:
+        for statement in search_table_ddl(name):
+            connection.exec_driver_sql(statement)
+        if name not in existing:
+            connection.exec_driver_sql(f'INSERT INTO "{name}"("{name}") VALUES (\'rebuild\')')
+
+def narrow_update_triggers(connection : Connection):
+    """The search tables created before version 7 reindexed a record on every update of its source row,
+    their update triggers are dropped and created again over the indexed columns only"""
+    for name in SEARCH_TABLES:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS "{name}_update"')
+        for statement in search_table_ddl(name):
+            connection.exec_driver_sql(statement)
+
+def match_expression(text : str, columns : tuple = ()) -> str:
+    """Turns user input into an FTS5 query where every word is a prefix that must appear,
+    the words are quoted so FTS5 operators typed by the user are searched as plain text"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ''
+    query = ' '.join(f'"{word}"*' for word in words)
+    if columns:
+        return '{' + ' '.join(columns) + '} : (' + query + ')'
+    return query
+
+def matches(search : Table, query : str):
+    """WHERE clause of a full-text search over the given search table"""
+    return literal_column(f'"{search.name}"').op('MATCH')(query)
+
+def names_expression(first_name : str | None, second_name : str | None) -> str:
+    """FTS5 query for the first and/or second name of a person, each one searched in its own column"""
+    parts = [match_expression(value, (column,)) for column, value in (('firstName', first_name), ('secondName', second_name)) if value]
+    return ' AND '.join(part for part in parts if part)
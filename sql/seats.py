@@ -0,0 +1,37 @@
+"""Seats of the classes
+
+Every class has a capacity and the count of its enrolled students (Classes.enrolled). The count is
+kept by triggers on StudentClasses in the same transaction as the enrollments and the drops (the
+cascades of a student or class delete included), and a trigger on Classes aborts the write that would
+leave a class with more students than seats. So a full group is rejected by the insert of the
+enrollment itself, without counting its students, and lowering the capacity below the enrolled
+students fails the same way.
+"""
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from settings import CLASS_CAPACITY
+
+#Text of the error raised by the triggers, the routers match it in the IntegrityError
+FULL_CLASS = 'Classes.capacity exceeded'
+
+SEATS_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS "Classes_capacity" BEFORE UPDATE OF enrolled, capacity ON "Classes"
+        WHEN new.enrolled > new.capacity BEGIN SELECT RAISE(ABORT, '{FULL_CLASS}'); END''',
+    'CREATE TRIGGER IF NOT EXISTS "Classes_enroll" AFTER INSERT ON "StudentClasses" BEGIN UPDATE "Classes" SET enrolled = enrolled + 1 WHERE id = new."idClass"; END',
+    'CREATE TRIGGER IF NOT EXISTS "Classes_drop" AFTER DELETE ON "StudentClasses" BEGIN UPDATE "Classes" SET enrolled = enrolled - 1 WHERE id = old."idClass"; END',
+    '''CREATE TRIGGER IF NOT EXISTS "Classes_move" AFTER UPDATE OF "idClass" ON "StudentClasses" BEGIN
+        UPDATE "Classes" SET enrolled = enrolled - 1 WHERE id = old."idClass"; UPDATE "Classes" SET enrolled = enrolled + 1 WHERE id = new."idClass"; END''',
+]
+
+def create_class_seats(connection : Connection):
+    """Adds the columns to the existing Classes table, counts the enrollments of every class and creates the triggers.
+    A class that already has more students than CLASS_CAPACITY gets exactly the seats it uses"""
+    columns = {column['name'] for column in inspect(connection).get_columns('Classes')}
+    if 'capacity' not in columns:
+        connection.exec_driver_sql(f'ALTER TABLE "Classes" ADD COLUMN capacity INTEGER NOT NULL DEFAULT {CLASS_CAPACITY}')
+    if 'enrolled' not in columns:
+        connection.exec_driver_sql('ALTER TABLE "Classes" ADD COLUMN enrolled INTEGER NOT NULL DEFAULT 0')
+    connection.exec_driver_sql('UPDATE "Classes" SET enrolled = (SELECT count(*) FROM "StudentClasses" WHERE "idClass" = "Classes".id)')
+    connection.exec_driver_sql('UPDATE "Classes" SET capacity = enrolled WHERE enrolled > capacity')
+    for statement in SEATS_TRIGGERS:
+        connection.exec_driver_sql(statement)
@@ -0,0 +1,127 @@
+"""Running statistics of every career and semester
+
+CareerStats keeps, per (career, semester), the students, the sum and the sum of squares of their GPAs
+and the subjects, so the mean and standard deviation of the GPA are read from one row instead of
+grouping the Students table. Like the search tables, it's kept current by triggers on Students and
+Subjects in the same transaction as the write, so the API handlers, the bulk endpoints, the importer
+and the cascades of a career delete all update it.
+
+Repeated updates of the GPA can leave rounding residue in the sums, the rebuild recomputes every row
+from the base tables and reports the ones that were off.
+
+Usage: python -m sql.stats [--check]
+"""
+from sqlalchemy import Table, Column, Integer, Float, MetaData, PrimaryKeyConstraint, select, func, delete, insert
+from sqlalchemy.engine import Connection
+from sql.definition import Student, Subject
+import math
+import sys
+
+#Derived table, in its own metadata so Base.metadata.create_all() doesn't create it without its triggers.
+#career_stats_ddl() creates it, this is the SQLAlchemy view of it
+stats_metadata = MetaData()
+
+career_stats = Table('CareerStats', stats_metadata,
+                        Column('careerId', Integer, nullable=False),
+                        Column('semester', Integer, nullable=False),
+                        Column('students', Integer, nullable=False),
+                        Column('gpaSum', Float, nullable=False),
+                        Column('gpaSquares', Float, nullable=False),
+                        Column('subjects', Integer, nullable=False),
+                        PrimaryKeyConstraint('careerId', 'semester'))
+
+def add(source : str, students : str, gpa_sum : str, gpa_squares : str, subjects : str) -> str:
+    """Upsert that adds the values to the row of the career and semester of the source row (new or old)"""
+    return (f'INSERT INTO "CareerStats"("careerId", semester, students, "gpaSum", "gpaSquares", subjects) '
+            f'VALUES ({source}."careerId", {source}.semester, {students}, {gpa_sum}, {gpa_squares}, {subjects}) '
+            f'ON CONFLICT("careerId", semester) DO UPDATE SET students = students + excluded.students, '
+            f'"gpaSum" = "gpaSum" + excluded."gpaSum", "gpaSquares" = "gpaSquares" + excluded."gpaSquares", '
+            f'subjects = subjects + excluded.subjects;')
+
+#When the last student of a row leaves, the sums go back to an exact 0 instead of the rounding residue
+REMOVE_STUDENT = ('UPDATE "CareerStats" SET "gpaSum" = CASE WHEN students = 1 THEN 0 ELSE "gpaSum" - old.gpa END, '
+                  '"gpaSquares" = CASE WHEN students = 1 THEN 0 ELSE "gpaSquares" - old.gpa * old.gpa END, students = students - 1 '
+                  'WHERE "careerId" = old."careerId" AND semester = old.semester;')
+REMOVE_SUBJECT = 'UPDATE "CareerStats" SET subjects = subjects - 1 WHERE "careerId" = old."careerId" AND semester = old.semester;'
+#Rows without students nor subjects go away, a missing row reads as zeros
+DROP_EMPTY = 'DELETE FROM "CareerStats" WHERE "careerId" = old."careerId" AND semester = old.semester AND students = 0 AND subjects = 0;'
+
+def career_stats_ddl() -> list:
+    """The table and the triggers that keep it current on every insert, update and delete (cascades included).
+    The removals are plain updates, so a cascade that runs after the stats of its career are gone does nothing"""
+    add_student = add('new', '1', 'new.gpa', 'new.gpa * new.gpa', '0')
+    add_subject = add('new', '0', '0', '0', '1')
+    return [
+        '''CREATE TABLE IF NOT EXISTS "CareerStats" ("careerId" INTEGER NOT NULL, semester INTEGER NOT NULL,
+            students INTEGER NOT NULL DEFAULT 0, "gpaSum" FLOAT NOT NULL DEFAULT 0, "gpaSquares" FLOAT NOT NULL DEFAULT 0,
+            subjects INTEGER NOT NULL DEFAULT 0, PRIMARY KEY ("careerId", semester))''',
+        f'CREATE TRIGGER IF NOT EXISTS "CareerStats_student_insert" AFTER INSERT ON "Students" BEGIN {add_student} END',
+        f'CREATE TRIGGER IF NOT EXISTS "CareerStats_student_delete" AFTER DELETE ON "Students" BEGIN {REMOVE_STUDENT} {DROP_EMPTY} END',
+        f'''CREATE TRIGGER IF NOT EXISTS "CareerStats_student_update" AFTER UPDATE OF "careerId", semester, gpa ON "Students"
+            BEGIN {REMOVE_STUDENT} {DROP_EMPTY} {add_student} END''',
+        f'CREATE TRIGGER IF NOT EXISTS "CareerStats_subject_insert" AFTER INSERT ON "Subjects" BEGIN {add_subject} END',
+        f'CREATE TRIGGER IF NOT EXISTS "CareerStats_subject_delete" AFTER DELETE ON "Subjects" BEGIN {REMOVE_SUBJECT} {DROP_EMPTY} END',
+        f'''CREATE TRIGGER IF NOT EXISTS "CareerStats_subject_update" AFTER UPDATE OF "careerId", semester ON "Subjects"
+            BEGIN {REMOVE_SUBJECT} {DROP_EMPTY} {add_subject} END''',
+        'CREATE TRIGGER IF NOT EXISTS "CareerStats_career_delete" AFTER DELETE ON "Careers" BEGIN DELETE FROM "CareerStats" WHERE "careerId" = old.id; END',
+    ]
+
+def computed_stats(connection : Connection) -> dict:
+    """(career, semester) -> row of the statistics, grouped from the base tables"""
+    rows = {}
+    statement = select(Student.careerId, Student.semester, func.count(), func.total(Student.gpa),
+                        func.total(Student.gpa * Student.gpa)).group_by(Student.careerId, Student.semester)
+    for career_id, semester, students, gpa_sum, gpa_squares in connection.execute(statement):
+        rows[(career_id, semester)] = {'careerId': career_id, 'semester': semester, 'students': students,
+                                        'gpaSum': gpa_sum, 'gpaSquares': gpa_squares, 'subjects': 0}
+    statement = select(Subject.careerId, Subject.semester, func.count()).group_by(Subject.careerId, Subject.semester)
+    for career_id, semester, subjects in connection.execute(statement):
+        rows.setdefault((career_id, semester), {'careerId': career_id, 'semester': semester, 'students': 0,
+                                                'gpaSum': 0.0, 'gpaSquares': 0.0})['subjects'] = subjects
+    return rows
+
+def same_stats(stored : dict, computed : dict) -> bool:
+    return (stored['students'] == computed['students'] and stored['subjects'] == computed['subjects']
+            and math.isclose(stored['gpaSum'], computed['gpaSum'], rel_tol=1e-9, abs_tol=1e-6)
+            and math.isclose(stored['gpaSquares'], computed['gpaSquares'], rel_tol=1e-9, abs_tol=1e-6))
+
+def rebuild_career_stats(connection : Connection, fix : bool = True) -> list:
+    """Compares the stored statistics with the base tables and, with fix, replaces them with the computed
+    ones. Returns the (career, semester) whose stored row was missing, extra or off"""
+    computed = computed_stats(connection)
+    stored = {(row['careerId'], row['semester']): dict(row) for row in connection.execute(select(career_stats)).mappings()}
+    drifted = sorted(key for key in computed.keys() | stored.keys()
+                        if key not in computed or key not in stored or not same_stats(stored[key], computed[key]))
+    if fix:
+        connection.execute(delete(career_stats))
+        if computed:
+            connection.execute(insert(career_stats), list(computed.values()))
+    return drifted
+
+def create_career_stats(connection : Connection):
+    """Creates the table and its triggers and fills it from the base tables"""
+    for statement in career_stats_ddl():
+        connection.exec_driver_sql(statement)
+    rebuild_career_stats(connection)
+
+def gpa_moments(students : int, gpa_sum : float, gpa_squares : float) -> tuple:
+    """Mean and (population) standard deviation of the GPA from the running sums, None without students"""
+    if not students:
+        return None, None
+    mean = gpa_sum / students
+    return mean, math.sqrt(max(gpa_squares / students - mean * mean, 0.0))
+
+def stats_report(students : int, gpa_sum : float, gpa_squares : float, subjects : int) -> dict:
+    mean, stddev = gpa_moments(students, gpa_sum, gpa_squares)
+    return {'students': students, 'subjects': subjects, 'gpaMean': mean, 'gpaStddev': stddev}
+
+if __name__ == '__main__':
+    from sql.definition import engine
+    check = '--check' in sys.argv
+    with engine.begin() as connection:
+        drifted = rebuild_career_stats(connection, fix=not check)
+    for career_id, semester in drifted:
+        print(f'Career {career_id} semester {semester}: the stored statistics {"are" if check else "were"} off')
+    print(f'{len(drifted)} rows {"off" if check else "rebuilt"}' if drifted else 'The statistics match the base tables')
+    if check and drifted:
+        sys.exit(1)
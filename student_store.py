@@ -0,0 +1,193 @@
+"""Columns of the students for the reports over the whole student body
+
+The career, semester, GPA and birth year of every student are kept in typed arrays (one per column,
+position i of every array is the same student, ordered by id): 23 bytes per student instead of an
+ORM object and its dict. The reports are a pass over the arrays; when NumPy is installed they run on
+NumPy views of the same arrays, without copying them.
+
+Like the occupancy index, it's loaded at startup and updated by the routers after every commit that
+writes students; the deletes that cascade over students (a career) and the imports reload it.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Iterable, List, Union
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.engine import Connection
+from sql.definition import Student, async_engine
+import datetime
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class Student_Store:
+    def __init__(self):
+        self.ids = array('q')
+        self.careers = array('i')
+        self.semesters = array('b')
+        self.gpas = array('d')
+        self.birth_years = array('h')
+        #Use NumPy for the reports when it's installed, it can be turned off to compare both
+        self.vectorized = numpy is not None
+
+    def columns(self) -> tuple:
+        return (self.ids, self.careers, self.semesters, self.gpas, self.birth_years)
+
+    def load(self, connection : Connection):
+        """Replaces the content of the store with the database one, works with run_sync().
+        The birth year is cut from the stored date so a million dates aren't parsed"""
+        ids, careers, semesters, gpas, birth_years = array('q'), array('i'), array('b'), array('d'), array('h')
+        result = connection.execute(select(Student.id, Student.careerId, Student.semester, Student.gpa,
+                                            cast(func.substr(Student.birthday, 1, 4), Integer)).order_by(Student.id))
+        for rows in result.partitions(10000):
+            for id, career_id, semester, gpa, birth_year in rows:
+                ids.append(id)
+                careers.append(career_id)
+                semesters.append(semester)
+                gpas.append(gpa)
+                birth_years.append(birth_year)
+        self.ids, self.careers, self.semesters, self.gpas, self.birth_years = ids, careers, semesters, gpas, birth_years
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in self.columns())
+
+    #region writes
+    def put(self, student_id : int, career_id : int, semester : int, gpa : float, birthday : Union[datetime.date,str]):
+        """Adds a student or replaces their values"""
+        year = birthday.year if isinstance(birthday, datetime.date) else int(birthday[:4])
+        position = bisect_left(self.ids, student_id)
+        if position < len(self.ids) and self.ids[position] == student_id:
+            self.careers[position], self.semesters[position], self.gpas[position], self.birth_years[position] = career_id, semester, gpa, year
+            return
+        #The new ids are the biggest ones, so this is an append almost always
+        for column, value in zip(self.columns(), (student_id, career_id, semester, gpa, year)):
+            column.insert(position, value)
+
+    def remove(self, student_id : int):
+        position = bisect_left(self.ids, student_id)
+        if position < len(self.ids) and self.ids[position] == student_id:
+            for column in self.columns():
+                del column[position]
+
+    def remove_career(self, career_id : int):
+        """Drops the students of a deleted career (the cascade of the foreign key)"""
+        keep = [position for position, career in enumerate(self.careers) if career != career_id]
+        if len(keep) == len(self.careers):
+            return
+        self.ids, self.careers, self.semesters, self.gpas, self.birth_years = [array(column.typecode, [column[position] for position in keep])
+                                                                                for column in self.columns()]
+    #endregion
+
+    #region reports
+    def gpa_percentiles(self, percentiles : Iterable[float], career_id : Union[int,None] = None, semester : Union[int,None] = None) -> List[dict]:
+        """GPA percentiles (linear interpolation, like NumPy's default) of every career and semester"""
+        percentiles = list(percentiles)
+        if self.vectorized:
+            return self.gpa_percentiles_numpy(percentiles, career_id, semester)
+        groups = defaultdict(list)
+        for career, group_semester, gpa in zip(self.careers, self.semesters, self.gpas):
+            if (career_id is None or career == career_id) and (semester is None or group_semester == semester):
+                groups[(career, group_semester)].append(gpa)
+        report = []
+        for (career, group_semester), gpas in sorted(groups.items()):
+            gpas.sort()
+            values = []
+            for percentile in percentiles:
+                rank = percentile / 100 * (len(gpas) - 1)
+                low, high = math.floor(rank), math.ceil(rank)
+                values.append(gpas[low] + (gpas[high] - gpas[low]) * (rank - low))
+            report.append(group_report(career, group_semester, len(gpas), percentiles, values))
+        return report
+
+    def gpa_percentiles_numpy(self, percentiles : List[float], career_id : Union[int,None], semester : Union[int,None]) -> List[dict]:
+        careers, semesters, gpas = self.views(self.careers, self.semesters, self.gpas)
+        selected = self.mask(careers, semesters, career_id, semester)
+        if selected is not None:
+            careers, semesters, gpas = careers[selected], semesters[selected], gpas[selected]
+        if not len(gpas):
+            return []
+        #Sorted by group, and then every group (a run) by GPA: the groups are few and big, so this beats a lexsort
+        #by the three columns. Every group's percentiles are interpolated in one go
+        groups = careers.astype(numpy.int64) * 128 + semesters
+        order = numpy.argsort(groups)
+        groups, gpas = groups[order], gpas[order]
+        starts = numpy.flatnonzero(numpy.r_[True, groups[1:] != groups[:-1]])
+        counts = numpy.diff(numpy.r_[starts, len(gpas)])
+        for start, count in zip(starts.tolist(), counts.tolist()):
+            gpas[start:start + count].sort()
+        ranks = starts[:, None] + (counts[:, None] - 1) * (numpy.asarray(percentiles) / 100)[None, :]
+        low, high = numpy.floor(ranks).astype(numpy.int64), numpy.ceil(ranks).astype(numpy.int64)
+        values = gpas[low] + (gpas[high] - gpas[low]) * (ranks - low)
+        return [group_report(int(groups[start] // 128), int(groups[start] % 128), int(count), percentiles, row.tolist())
+                for start, count, row in zip(starts, counts, values)]
+
+    def birth_year_counts(self, career_id : Union[int,None] = None) -> List[dict]:
+        if self.vectorized:
+            careers, birth_years = self.views(self.careers, self.birth_years)
+            if career_id is not None:
+                birth_years = birth_years[careers == career_id]
+            years, counts = numpy.unique(birth_years, return_counts=True)
+            return [{'year': int(year), 'students': int(count)} for year, count in zip(years, counts)]
+        if career_id is None:
+            counts = Counter(self.birth_years)
+        else:
+            counts = Counter(year for career, year in zip(self.careers, self.birth_years) if career == career_id)
+        return [{'year': year, 'students': count} for year, count in sorted(counts.items())]
+
+    def at_risk(self, threshold : float, career_id : Union[int,None] = None, semester : Union[int,None] = None, limit : int = 100) -> tuple:
+        """Students with a GPA below the threshold, the lowest first: (how many, the first ones)"""
+        if self.vectorized:
+            ids, careers, semesters, gpas = self.views(self.ids, self.careers, self.semesters, self.gpas)
+            selected = gpas < threshold
+            mask = self.mask(careers, semesters, career_id, semester)
+            if mask is not None:
+                selected &= mask
+            ids, careers, semesters, gpas = ids[selected], careers[selected], semesters[selected], gpas[selected]
+            count = len(ids)
+            if count > limit:
+                #Only the first ones are sorted: the ones up to the GPA at the limit, ties included
+                first = gpas <= numpy.partition(gpas, limit - 1)[limit - 1]
+                ids, careers, semesters, gpas = ids[first], careers[first], semesters[first], gpas[first]
+            order = numpy.lexsort((ids, gpas))[:limit]
+            return count, [student_report(*values) for values in zip(ids[order].tolist(), careers[order].tolist(),
+                                                                        semesters[order].tolist(), gpas[order].tolist())]
+        students = [(gpa, id, career, student_semester) for id, career, student_semester, gpa in zip(*self.columns()[:4])
+                    if gpa < threshold and (career_id is None or career == career_id) and (semester is None or student_semester == semester)]
+        first = sorted(students)[:limit]
+        return len(students), [student_report(id, career, student_semester, gpa) for gpa, id, career, student_semester in first]
+    #endregion
+
+    @staticmethod
+    def views(*columns : array) -> list:
+        """NumPy arrays over the memory of the columns, the columns can't change size while they live"""
+        return [numpy.frombuffer(column, dtype=numpy.dtype(column.typecode)) if len(column) else numpy.empty(0, numpy.dtype(column.typecode))
+                for column in columns]
+
+    @staticmethod
+    def mask(careers, semesters, career_id : Union[int,None], semester : Union[int,None]):
+        mask = None
+        if career_id is not None:
+            mask = careers == career_id
+        if semester is not None:
+            mask = semesters == semester if mask is None else mask & (semesters == semester)
+        return mask
+
+def group_report(career_id : int, semester : int, students : int, percentiles : List[float], values : List[float]) -> dict:
+    return {'careerId': career_id, 'semester': semester, 'students': students,
+            'percentiles': {f'{percentile:g}': value for percentile, value in zip(percentiles, values)}}
+
+def student_report(student_id : int, career_id : int, semester : int, gpa : float) -> dict:
+    return {'id': student_id, 'careerId': career_id, 'semester': semester, 'gpa': gpa}
+
+student_store = Student_Store()
+
+async def reload_student_store():
+    """Reloads the store after writes that the routers can't follow one by one (cascades, imports)"""
+    async with async_engine.connect() as connection:
+        await connection.run_sync(student_store.load)
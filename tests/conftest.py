@@ -0,0 +1,65 @@
+"""Fixtures of the tests: the app runs in-process (benchmarks/app_client.py) over a throwaway database
+
+The settings are read on import, so the database path is set here, before the tests import main,
+settings or sql.*. The metrics middleware opens its own query statistics for every request, it's
+disabled so queries.query_budget() sees the statements of the requests it wraps.
+"""
+import itertools
+import os
+import shutil
+import tempfile
+import pytest
+
+folder = tempfile.mkdtemp(prefix='school-tests-')
+os.environ['SCHOOL_DB_PATH'] = os.path.join(folder, 'school.db')
+os.environ['SCHOOL_METRICS'] = '0'
+
+def pytest_unconfigure(config):
+    shutil.rmtree(folder, ignore_errors=True)
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+@pytest.fixture
+async def client():
+    from benchmarks.app_client import app_client
+    async with app_client(os.environ['SCHOOL_DB_PATH']) as client:
+        yield client
+
+#Every test shares the database, the names and numbers of its records come from these counters
+numbers = itertools.count(1)
+group_numbers = itertools.count(100)
+
+class School:
+    """Creates records through the API and returns their ids"""
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, url : str, body : dict) -> int:
+        response = await self.client.post(url, json=body)
+        assert response.status_code == 201, response.text
+        return response.json()['id']
+
+    async def career(self) -> int:
+        return await self.create('/careers/create/', {'name': f'Test career {next(numbers)}'})
+
+    async def subject(self, career_id : int, semester : int = 1) -> int:
+        return await self.create('/subjects/create', {'name': f'Test subject {next(numbers)}', 'semester': semester, 'careerId': career_id})
+
+    async def teacher(self) -> int:
+        number = next(numbers)
+        return await self.create('/teachers/create/', {'employeeId': 700000 + number, 'firstName': 'Test', 'secondName': f'Teacher {number}'})
+
+    async def class_(self, subject_id : int, teacher_id : int, hour : str, **fields) -> int:
+        return await self.create('/classes/create/', {'hour': hour, 'groupNo': next(group_numbers), 'idTeacher': teacher_id,
+                                                        'idSubject': subject_id, **fields})
+
+    async def student(self, career_id : int, semester : int = 1, **fields) -> int:
+        number = next(numbers)
+        return await self.create('/students/create/', {'firstName': 'Test', 'secondName': f'Student {number}', 'studentId': 800000 + number,
+                                                        'birthday': '2002-04-11', 'semester': semester, 'gpa': 80, 'careerId': career_id, **fields})
+
+@pytest.fixture
+def school(client) -> School:
+    return School(client)
@@ -0,0 +1,52 @@
+"""Invalidation of the cached responses and ETags (cache.py) by the writes and their cascades"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def test_career_delete_invalidates_subjects_and_students(client, school):
+    career = await school.career()
+    subject = await school.subject(career)
+    student = await school.student(career)
+
+    subjects = await client.get('/subjects/obtain/', params={'careerId': career})
+    assert [item['id'] for item in subjects.json()['items']] == [subject]
+    etag = subjects.headers['etag']
+    assert (await client.get('/subjects/obtain/', params={'careerId': career}, headers={'If-None-Match': etag})).status_code == 304
+    students = await client.get('/students/obtain/', params={'careerId': career})
+    assert [item['id'] for item in students.json()['items']] == [student]
+    #The second read is served from the cache
+    assert (await client.get('/students/obtain/', params={'careerId': career})).content == students.content
+
+    response = await client.delete('/careers/erase/', params={'career_id': career})
+    assert response.status_code == 201, response.text
+    subjects = await client.get('/subjects/obtain/', params={'careerId': career}, headers={'If-None-Match': etag})
+    assert subjects.status_code == 200
+    assert subjects.headers['etag'] != etag
+    assert subjects.json()['items'] == []
+    assert (await client.get('/students/obtain/', params={'careerId': career})).json()['items'] == []
+
+async def test_teacher_delete_invalidates_classes(client, school):
+    career = await school.career()
+    teacher = await school.teacher()
+    class_id = await school.class_(await school.subject(career), teacher, '10:30 AM')
+    student = await school.student(career)
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': class_id})
+    assert response.status_code == 201, response.text
+
+    classes = await client.get('/classes/obtain/', params={'idTeacher': teacher})
+    assert [item['id'] for item in classes.json()['items']] == [class_id]
+    availability = await client.get('/classes/availability/', params={'careerId': career})
+    assert [(item['id'], item['enrolled']) for item in availability.json()['classes']] == [(class_id, 1)]
+
+    response = await client.delete('/teachers/erase/', params={'teacher_id': teacher})
+    assert response.status_code == 201, response.text
+    assert (await client.get('/classes/obtain/', params={'idTeacher': teacher})).json()['items'] == []
+    assert (await client.get('/classes/availability/', params={'careerId': career})).json() == {'seats': 0, 'classes': []}
+
+async def test_modify_invalidates_the_page(client, school):
+    career = await school.career()
+    student = await school.student(career, gpa=60)
+    assert (await client.get('/students/obtain/', params={'careerId': career})).json()['items'][0]['gpa'] == 60
+    response = await client.put('/students/modify/', json={'id': student, 'gpa': 99})
+    assert response.status_code == 201, response.text
+    assert (await client.get('/students/obtain/', params={'careerId': career})).json()['items'][0]['gpa'] == 99
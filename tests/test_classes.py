@@ -0,0 +1,16 @@
+"""Teacher slots of the occupancy index (occupancy.py)"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def test_teacher_hours_in_both_forms(client, school):
+    career = await school.career()
+    teacher = await school.teacher()
+    await school.class_(await school.subject(career), teacher, '09:30 AM')
+    response = await client.post('/classes/create/', json={'hour': '9:30 am', 'groupNo': 998, 'idTeacher': teacher,
+                                                            'idSubject': await school.subject(career)})
+    assert response.status_code == 400
+    assert 'at the same hour' in response.json()['detail']['message']
+    response = await client.post('/classes/validate/', json=[{'hour': '9:30 AM', 'groupNo': 998, 'idTeacher': teacher,
+                                                              'idSubject': await school.subject(career)}])
+    assert response.json()[0]['status_code'] == 400
@@ -0,0 +1,147 @@
+"""Enrollments and the bitset index of the student schedules (schedules.py)"""
+import pytest
+from sqlalchemy import select
+from sql.definition import engine, Class, StudentClass
+from schedules import schedules
+
+pytestmark = pytest.mark.anyio
+
+def index_matches_database():
+    """The index knows exactly the classes of the database and every student has the bits of their classes"""
+    with engine.connect() as connection:
+        class_ids = set(connection.execute(select(Class.id)).scalars())
+        masks = {}
+        for student_id, class_id in connection.execute(select(StudentClass.idStudent, StudentClass.idClass)).all():
+            masks[student_id] = masks.get(student_id, 0) | schedules.class_bits[class_id]
+    assert set(schedules.class_bits) == class_ids
+    assert {student_id: mask for student_id, mask in schedules.students.items() if mask} == masks
+
+async def enrolled_classes(client, student_id : int) -> list:
+    response = await client.get(f'/students/{student_id}/schedule')
+    assert response.status_code == 200, response.text
+    return [item['idClass'] for item in response.json()['classes']]
+
+async def test_enroll(client, school):
+    career = await school.career()
+    subject, teacher = await school.subject(career), await school.teacher()
+    class_id = await school.class_(subject, teacher, '07:00 AM')
+    student = await school.student(career)
+
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': class_id})
+    assert response.status_code == 201, response.text
+    assert await enrolled_classes(client, student) == [class_id]
+    assert schedules.mask(student) == schedules.class_bits[class_id]
+
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': class_id})
+    assert response.status_code == 400
+    assert response.json()['detail']['message'] == f'The student is already enrolled in the class {class_id}'
+
+async def test_hour_conflict(client, school):
+    career = await school.career()
+    first = await school.class_(await school.subject(career), await school.teacher(), '08:00 AM')
+    second = await school.class_(await school.subject(career), await school.teacher(), '08:00 AM')
+    student = await school.student(career)
+
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': first})
+    assert response.status_code == 201, response.text
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': second})
+    assert response.status_code == 400
+    assert 'at the same hour' in response.json()['detail']['message']
+    assert await enrolled_classes(client, student) == [first]
+    index_matches_database()
+
+async def test_bulk_enrollment_is_all_or_nothing(client, school):
+    career = await school.career()
+    teacher = await school.teacher()
+    nine = await school.class_(await school.subject(career), teacher, '09:00 AM')
+    ten = await school.class_(await school.subject(career), teacher, '10:00 AM')
+    other_nine = await school.class_(await school.subject(career), await school.teacher(), '09:00 AM')
+    student = await school.student(career)
+
+    response = await client.post('/student_classes/create/bulk', params={'student_id': student}, json=[nine, ten, other_nine])
+    assert response.status_code == 400
+    assert response.json()['detail']['message'] == f'The class {other_nine} is at the same hour than another class of the list'
+    assert await enrolled_classes(client, student) == []
+    assert schedules.mask(student) == 0
+
+    response = await client.post('/student_classes/create/bulk', params={'student_id': student}, json=[nine, ten])
+    assert response.status_code == 201, response.text
+    assert len(response.json()['ids']) == 2
+    assert sorted(await enrolled_classes(client, student)) == sorted([nine, ten])
+    index_matches_database()
+
+async def test_bulk_enrollment_of_a_full_class(client, school):
+    career = await school.career()
+    teacher = await school.teacher()
+    open_class = await school.class_(await school.subject(career), teacher, '11:00 AM')
+    full_class = await school.class_(await school.subject(career), teacher, '12:00 PM', capacity=1)
+    first, second = await school.student(career), await school.student(career)
+
+    response = await client.post('/student_classes/create/', params={'student_id': first, 'class_id': full_class})
+    assert response.status_code == 201, response.text
+    response = await client.post('/student_classes/create/bulk', params={'student_id': second}, json=[open_class, full_class])
+    assert response.status_code == 400
+    group_no = (await client.get('/classes/obtain/', params={'idTeacher': teacher})).json()['items'][-1]['groupNo']
+    assert response.json()['detail']['message'] == f'The class number {group_no} is full'
+    assert await enrolled_classes(client, second) == []
+    index_matches_database()
+
+async def test_drop_clears_the_hour(client, school):
+    career = await school.career()
+    dropped = await school.class_(await school.subject(career), await school.teacher(), '01:00 PM')
+    same_hour = await school.class_(await school.subject(career), await school.teacher(), '01:00 PM')
+    student = await school.student(career)
+
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': dropped})
+    assert response.status_code == 201, response.text
+    response = await client.delete('/student_classes/erase/', params={'student_id': student, 'class_id': dropped})
+    assert response.status_code == 201, response.text
+    assert schedules.mask(student) == 0
+    assert await enrolled_classes(client, student) == []
+
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': same_hour})
+    assert response.status_code == 201, response.text
+    index_matches_database()
+
+@pytest.mark.parametrize('deleted', ['subject', 'teacher'])
+async def test_index_after_a_cascade(client, school, deleted):
+    career = await school.career()
+    subject, teacher = await school.subject(career), await school.teacher()
+    removed = await school.class_(subject, teacher, '02:00 PM')
+    kept = await school.class_(await school.subject(career), await school.teacher(), '03:00 PM')
+    same_hour = await school.class_(await school.subject(career), await school.teacher(), '02:00 PM')
+    student = await school.student(career)
+    response = await client.post('/student_classes/create/bulk', params={'student_id': student}, json=[removed, kept])
+    assert response.status_code == 201, response.text
+
+    if deleted == 'subject':
+        response = await client.delete('/subjects/erase/', params={'subject_id': subject})
+    else:
+        response = await client.delete('/teachers/erase/', params={'teacher_id': teacher})
+    assert response.status_code == 201, response.text
+    assert not schedules.has_class(removed)
+    assert schedules.mask(student) == schedules.class_bits[kept]
+    assert await enrolled_classes(client, student) == [kept]
+    index_matches_database()
+
+    #The hour of the deleted class is free again
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': same_hour})
+    assert response.status_code == 201, response.text
+
+async def test_moving_a_class_keeps_the_students_free(client, school):
+    career = await school.career()
+    moved = await school.class_(await school.subject(career), await school.teacher(), '07:00 PM')
+    other = await school.class_(await school.subject(career), await school.teacher(), '08:00 PM')
+    student = await school.student(career)
+    response = await client.post('/student_classes/create/bulk', params={'student_id': student}, json=[moved, other])
+    assert response.status_code == 201, response.text
+
+    response = await client.put('/classes/modify/', json={'id': moved, 'hour': '08:00 PM'})
+    assert response.status_code == 400
+    assert response.json()['detail']['message'] == f'Cannot move the class to 08:00 PM, the student with the id {student} has another class at that hour'
+    index_matches_database()
+
+    response = await client.put('/classes/modify/', json={'id': moved, 'hour': '09:00 PM'})
+    assert response.status_code == 201, response.text
+    assert schedules.mask(student) == schedules.class_bits[moved] | schedules.class_bits[other]
+    index_matches_database()
@@ -0,0 +1,24 @@
+"""Synthetic schools of sql/generator.py"""
+from sqlalchemy import create_engine, select, func
+from sql.definition import Class, StudentClass
+from sql.generator import generate_school
+
+def test_seats_follow_the_placed_sections(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "school.db"}')
+    try:
+        #14 hours for the 18 classes of every semester, so some sections aren't placed
+        report = generate_school(engine, students=2000, enrollments=6, subjects_per_semester=6, sections=3, teachers=200)
+        assert report['unplaced_classes'] > 0
+        with engine.connect() as connection:
+            assert connection.execute(select(func.count()).where(Class.enrolled > Class.capacity)).scalar() == 0
+            assert connection.execute(select(func.count()).select_from(StudentClass)).scalar() == report['enrollments']
+    finally:
+        engine.dispose()
+
+def test_full_classes_are_skipped(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "school.db"}')
+    try:
+        report = generate_school(engine, careers=1, semesters=1, students=100, enrollments=4, capacity=5)
+        assert report['enrollments'] == report['classes'] * 5
+    finally:
+        engine.dispose()
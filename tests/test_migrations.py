@@ -0,0 +1,34 @@
+"""Migrations of sql/migrations.py over a new database"""
+from sqlalchemy import create_engine
+from sql.migrations import MIGRATIONS, HOT_QUERIES, migrate, schema_version, check_query_plans, query_plan
+
+def test_hot_queries_use_an_index(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "school.db"}')
+    try:
+        with engine.begin() as connection:
+            assert migrate(connection) == [version for version, _, _ in MIGRATIONS]
+            assert schema_version(connection) == MIGRATIONS[-1][0]
+        with engine.connect() as connection:
+            assert check_query_plans(connection) == {}
+            for name, statement in HOT_QUERIES.items():
+                assert any('USING' in step and 'INDEX' in step for step in query_plan(connection, statement)), name
+    finally:
+        engine.dispose()
+
+def test_search_tables_follow_the_names(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "school.db"}')
+    try:
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.exec_driver_sql('INSERT INTO "Careers"(name) VALUES (\'Law\')')
+            connection.exec_driver_sql('''INSERT INTO "Students"("firstName", "secondName", "studentId", birthday, semester, gpa, "careerId")
+                                            VALUES ('Horacio', 'Gomez', 19930, '2002-04-11', 3, 80, 1)''')
+            connection.exec_driver_sql('UPDATE "Students" SET gpa = 90, semester = 4')
+            connection.exec_driver_sql('UPDATE "Students" SET "secondName" = \'Fuentes\'')
+        with engine.connect() as connection:
+            search = 'SELECT rowid FROM "StudentsSearch" WHERE "StudentsSearch" MATCH ?'
+            assert connection.exec_driver_sql(search, ('Fuentes',)).all() == [(1,)]
+            assert connection.exec_driver_sql(search, ('Gomez',)).all() == []
+            connection.exec_driver_sql('INSERT INTO "StudentsSearch"("StudentsSearch", rank) VALUES (\'integrity-check\', 1)')
+    finally:
+        engine.dispose()
@@ -0,0 +1,28 @@
+"""The modify endpoints map the broken constraints to the same 400 messages as the create ones"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def test_modify_student_constraints(client, school):
+    career = await school.career()
+    first, second = await school.student(career), await school.student(career)
+    taken = (await client.get('/students/obtain/', params={'after': first - 1, 'limit': 1})).json()['items'][0]['studentId']
+
+    response = await client.put('/students/modify/', json={'id': second, 'studentId': taken})
+    assert response.status_code == 400
+    assert response.json()['detail']['message'] == 'A student with the same student id is already registered'
+    response = await client.put('/students/modify/', json={'id': second, 'careerId': 999999})
+    assert response.status_code == 400
+    assert response.json()['detail']['message'] == 'The career with the id 999999 does not exist in the database'
+
+    response = await client.put('/students/modify/', json={'id': second, 'gpa': 55})
+    assert response.status_code == 201, response.text
+    assert response.json()['gpa'] == 55
+
+async def test_modify_teacher_constraints(client, school):
+    first, second = await school.teacher(), await school.teacher()
+    taken = (await client.get('/teachers/obtain/', params={'after': first - 1, 'limit': 1})).json()['items'][0]['employeeId']
+
+    response = await client.put('/teachers/modify/', json={'id': second, 'employeeId': taken})
+    assert response.status_code == 400
+    assert response.json()['detail']['message'] == "The given employee ID it's already assigned"
@@ -0,0 +1,50 @@
+"""The hot endpoints stay within their budget of statements in queries.QUERY_BUDGETS"""
+import pytest
+from queries import QUERY_BUDGETS, query_budget
+
+pytestmark = pytest.mark.anyio
+
+async def within_budget(client, route : str, **arguments):
+    """Sends the request of the route with the response caches empty, so its queries do run"""
+    await client.delete('/admin/cache/')
+    method, url = route.split(' ', 1)
+    with query_budget(QUERY_BUDGETS[route], route) as stats:
+        response = await client.request(method, arguments.pop('url', url), **arguments)
+    assert response.status_code in (200, 201), response.text
+    #A request that ran nothing would pass any budget, so these endpoints must have been counted
+    assert stats.count > 0
+    return response
+
+@pytest.mark.parametrize('route, params', [
+    ('GET /careers/obtain/', {}),
+    ('GET /subjects/obtain/', {'semester': 1}),
+    ('GET /teachers/obtain/', {}),
+    ('GET /students/obtain/', {'limit': 50}),
+    ('GET /classes/obtain/', {'limit': 50}),
+    ('GET /classes/availability/', {'semester': 1, 'open_only': True}),
+])
+async def test_lists(client, school, route, params):
+    career = await school.career()
+    await school.class_(await school.subject(career), await school.teacher(), '04:00 PM')
+    await school.student(career)
+    await within_budget(client, route, params=params)
+
+async def test_obtain_by_id(client, school):
+    career = await school.career()
+    response = await within_budget(client, 'GET /careers/search/', params={'id': career})
+    assert response.json()['id'] == career
+
+async def test_schedule(client, school):
+    career = await school.career()
+    class_id = await school.class_(await school.subject(career), await school.teacher(), '05:00 PM')
+    student = await school.student(career)
+    response = await client.post('/student_classes/create/', params={'student_id': student, 'class_id': class_id})
+    assert response.status_code == 201, response.text
+    response = await within_budget(client, 'GET /students/{student_id}/schedule', url=f'/students/{student}/schedule')
+    assert [item['idClass'] for item in response.json()['classes']] == [class_id]
+
+async def test_enroll(client, school):
+    career = await school.career()
+    class_id = await school.class_(await school.subject(career), await school.teacher(), '06:00 PM')
+    student = await school.student(career)
+    await within_budget(client, 'POST /student_classes/create/', params={'student_id': student, 'class_id': class_id})
@@ -0,0 +1,79 @@
+"""Running statistics of the careers (sql/stats.py) against a GROUP BY of the base tables"""
+import pytest
+from sql.definition import engine
+from sql.stats import computed_stats, rebuild_career_stats, stats_report
+
+pytestmark = pytest.mark.anyio
+
+def expected_stats(career_id : int) -> dict:
+    """The response of /careers/{id}/stats grouped from the Students and Subjects tables"""
+    with engine.connect() as connection:
+        rows = [row for (career, _), row in sorted(computed_stats(connection).items()) if career == career_id]
+    columns = ('students', 'gpaSum', 'gpaSquares', 'subjects')
+    totals = [sum(row[column] for row in rows) for column in columns]
+    return {'careerId': career_id, **stats_report(*totals),
+            'semesters': [{'semester': row['semester'], **stats_report(*(row[column] for column in columns))} for row in rows]}
+
+def same_report(actual : dict, expected : dict):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        if key == 'semesters':
+            assert len(actual[key]) == len(value)
+            for actual_semester, expected_semester in zip(actual[key], value):
+                same_report(actual_semester, expected_semester)
+        else:
+            assert actual[key] == (pytest.approx(value) if value is not None else None), key
+
+async def check_career(client, career_id : int):
+    response = await client.get(f'/careers/{career_id}/stats')
+    assert response.status_code == 200, response.text
+    same_report(response.json(), expected_stats(career_id))
+    with engine.connect() as connection:
+        assert rebuild_career_stats(connection, fix=False) == []
+
+async def test_stats_follow_the_writes(client, school):
+    career, other_career = await school.career(), await school.career()
+    await check_career(client, career)
+
+    subject = await school.subject(career, semester=2)
+    await school.subject(career, semester=3)
+    first = await school.student(career, semester=2, gpa=91.5)
+    second = await school.student(career, semester=2, gpa=62)
+    third = await school.student(career, semester=5, gpa=77.3)
+    number = 900000 + first
+    response = await client.post('/students/create/bulk', json=[{'firstName': 'Bulk', 'secondName': f'Student {number + offset}',
+                                    'studentId': number + offset, 'birthday': '2001-01-01', 'semester': 3, 'gpa': 50 + offset,
+                                    'careerId': career} for offset in range(3)])
+    assert response.status_code == 201, response.text
+    await check_career(client, career)
+
+    for change in ({'id': first, 'gpa': 45.25}, {'id': second, 'semester': 7}, {'id': third, 'careerId': other_career},
+                    {'id': third, 'careerId': career, 'semester': 2, 'gpa': 88}):
+        response = await client.put('/students/modify/', json=change)
+        assert response.status_code == 201, response.text
+        await check_career(client, career)
+        await check_career(client, other_career)
+
+    response = await client.put('/subjects/modify/', json={'id': subject, 'semester': 4})
+    assert response.status_code == 201, response.text
+    await check_career(client, career)
+
+    response = await client.delete('/students/erase/', params={'student_id': second})
+    assert response.status_code == 201, response.text
+    response = await client.delete('/subjects/erase/', params={'subject_id': subject})
+    assert response.status_code == 201, response.text
+    await check_career(client, career)
+
+async def test_stats_of_a_deleted_career(client, school):
+    career = await school.career()
+    await school.subject(career, semester=1)
+    await school.student(career, semester=1, gpa=70)
+    await school.student(career, semester=4, gpa=99)
+    await check_career(client, career)
+
+    response = await client.delete('/careers/erase/', params={'career_id': career})
+    assert response.status_code == 201, response.text
+    assert (await client.get(f'/careers/{career}/stats')).status_code == 404
+    assert expected_stats(career)['semesters'] == []
+    with engine.connect() as connection:
+        assert rebuild_career_stats(connection, fix=False) == []
@@ -0,0 +1,107 @@
+"""Timetable generator
+
+Assigns an hour and a teacher to every class of a career so that no teacher has two classes at the
+same hour and the subjects of the same semester group never clash. The clash graph is one clique per
+semester group, it's colored with DSatur (the class whose group has used the most hours goes first)
+and each class takes the hour with the most free teachers left. When a class finds no hour, a repair
+step moves one class that holds a teacher at a free hour of the group to another hour of that teacher.
+
+The generator works on plain ids and hour labels, so it doesn't touch the database; it stops when the
+time budget runs out and reports the classes it couldn't place with the reason.
+"""
+from typing import Hashable, Iterable, List, Tuple, Union
+import heapq
+import time
+
+NO_SLOTS = 'Every time slot already has a class of the semester group'
+NO_TEACHER = 'No teacher is free at the hours left for the semester group'
+NO_TIME = 'The time budget ran out before placing the class'
+
+def generate_timetable(classes : List[Tuple[Hashable,Hashable]], slots : List[str], teachers : Iterable[int],
+                        busy : Iterable[Tuple[int,str]] = (), time_budget : float = 2.0) -> dict:
+    """classes: (class key, semester group key) of every class to place.
+    busy: (teacher, slot) pairs already taken by other classes.
+    Returns {'placed': {class key: (slot, teacher)}, 'unplaced': {class key: reason}, 'elapsed': seconds}"""
+    start = time.perf_counter()
+    deadline = start + time_budget
+    busy = set(busy)
+    #slot -> teachers free at that slot
+    free = {slot: {teacher for teacher in teachers if (teacher, slot) not in busy} for slot in slots}
+    #semester group -> indexes of its classes, and semester group -> {slot: class index}
+    groups = {}
+    for index, (_, group) in enumerate(classes):
+        groups.setdefault(group, []).append(index)
+    used = {group: {} for group in groups}
+    #class index -> (slot, teacher), and slot -> placed class indexes
+    assigned = {}
+    at_slot = {slot: set() for slot in slots}
+    unplaced = {}
+
+    def place(index : int, slot : str, teacher : int):
+        assigned[index] = (slot, teacher)
+        used[classes[index][1]][slot] = index
+        at_slot[slot].add(index)
+        free[slot].discard(teacher)
+
+    def unplace(index : int):
+        slot, teacher = assigned.pop(index)
+        del used[classes[index][1]][slot]
+        at_slot[slot].discard(index)
+        free[slot].add(teacher)
+
+    def repair(index : int) -> Union[str,None]:
+        """Frees a teacher at one of the hours left for the group by moving one of their classes"""
+        taken = used[classes[index][1]]
+        #A class can only move to an hour where somebody is still free
+        open_slots = [slot for slot in slots if free[slot]]
+        if not open_slots:
+            return None
+        for slot in slots:
+            if slot in taken:
+                continue
+            if time.perf_counter() > deadline:
+                return None
+            for other in list(at_slot[slot]):
+                teacher = assigned[other][1]
+                other_taken = used[classes[other][1]]
+                for new_slot in open_slots:
+                    if new_slot not in other_taken and teacher in free[new_slot]:
+                        unplace(other)
+                        place(other, new_slot, teacher)
+                        return slot
+        return None
+
+    #DSatur: highest saturation (hours already used by the group) first, then the biggest groups
+    saturation = [0] * len(classes)
+    queue = [(0, -len(groups[group]), index) for index, (_, group) in enumerate(classes)]
+    heapq.heapify(queue)
+    while queue:
+        negative_saturation, _, index = heapq.heappop(queue)
+        if index in assigned or index in unplaced or -negative_saturation != saturation[index]:
+            continue
+        if time.perf_counter() > deadline:
+            break
+        group = classes[index][1]
+        taken = used[group]
+        if len(taken) == len(slots):
+            unplaced[index] = NO_SLOTS
+            continue
+        #The hour with the most free teachers keeps the others open for the next classes
+        slot = max((slot for slot in slots if slot not in taken and free[slot]), key=lambda slot: len(free[slot]), default=None)
+        if slot is None:
+            slot = repair(index)
+        if slot is None:
+            unplaced[index] = NO_TEACHER
+            continue
+        place(index, slot, next(iter(free[slot])))
+        for neighbour in groups[group]:
+            if neighbour not in assigned and neighbour not in unplaced:
+                saturation[neighbour] += 1
+                heapq.heappush(queue, (-saturation[neighbour], -len(groups[group]), neighbour))
+
+    for index in range(len(classes)):
+        if index not in assigned and index not in unplaced:
+            unplaced[index] = NO_TIME
+    return {'placed': {classes[index][0]: value for index, value in assigned.items()},
+            'unplaced': {classes[index][0]: reason for index, reason in unplaced.items()},
+            'elapsed': time.perf_counter() - start}
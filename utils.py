@@ -1,10 +1,77 @@
-def model_to_dict(model):
-    model_dict = model.__dict__
-    del model_dict['_sa_instance_state']
-    return model_dict
+from sqlalchemy import Select, Insert, Update, insert, update, select, exists, literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Union, AsyncIterator
+from sql.connection import AsyncSessionLocal
+import orjson
+
+#Hour of a class in format hh:mm AM/PM
+HOUR_PATTERN = r'^\d{1,2}:\d{2} [APap][Mm]$'
+
+def model_to_dict(model) -> dict:
+    """Column values of an ORM object, the object itself is left untouched"""
+    return {column.key: getattr(model, column.key) for column in model.__table__.columns}
 
 class Error400(Exception):
     pass
 
+def insert_unless(model, values : dict, *duplicate) -> Insert:
+    """INSERT ... RETURNING id of one row that is skipped (no row returned) if a row matches the
+    duplicate conditions, for the uniqueness rules that aren't constraints of the table. It's a
+    single statement, so no other write can get between the check and the insert"""
+    columns = model.__table__.columns
+    row = select(*[literal(value, columns[name].type).label(name) for name, value in values.items()])
+    return insert(model.__table__).from_select(list(values), row.where(~exists().where(*duplicate))).returning(model.id)
+
+def constraint_message(error : IntegrityError, messages : dict) -> str:
+    """Message of the constraint an insert or update broke. messages: text of the SQLite error
+    ('Table.column' of a UNIQUE constraint, 'FOREIGN KEY') -> message. The error is raised again
+    if it isn't one of them"""
+    text = str(error.orig)
+    for constraint, message in messages.items():
+        if constraint in text:
+            return message
+    raise error
+
 class Error404(Exception):
-    pass
\ No newline at end of file
+    pass
+
+def partial_update(model, record_id : int, item) -> Update:
+    """UPDATE ... RETURNING the whole row of only the fields given in item, the empty ones (None,
+    0, '') keep the value in the database. No row comes back if the id doesn't exist"""
+    values = {name: value for name, value in item.dict(exclude={'id'}).items() if value}
+    table = model.__table__
+    return update(table).where(table.c.id == record_id).values(values).returning(*table.columns)
+
+def chunks(items : list, size : int = 500):
+    """Splits a list in slices small enough to be bound in one IN (...) without hitting SQLite's variable limit"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def keyset_page(session : AsyncSession, statement : Select, key, after : Union[int,None], limit : int):
+    """Runs a select of columns (e.g. select(Model.__table__)) one page at a time ordered by the key
+    column (usually the primary key). Returns the rows of the page as dicts, ready to be encoded
+    without building ORM objects or models, and the cursor of the next one, None when there are no more rows"""
+    if after is not None:
+        statement = statement.where(key > after)
+    rows = [dict(row) for row in (await session.execute(statement.order_by(key).limit(limit + 1))).mappings()]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1][key.key]
+    return rows, None
+
+async def ndjson_stream(statement : Select, chunk_size : int) -> AsyncIterator[bytes]:
+    """Streams the rows of a select as newline-delimited JSON, one chunk of rows at a time.
+    It opens its own session because the response keeps streaming after the handler returns"""
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(statement.execution_options(yield_per=chunk_size))
+        async for rows in result.mappings().partitions(chunk_size):
+            yield b''.join(orjson.dumps(dict(row), default=str) + b'\n' for row in rows)
+
+async def offset_page(session : AsyncSession, statement : Select, offset : int, limit : int):
+    """Like keyset_page but for results that aren't ordered by a key (e.g. ranked searches),
+    the cursor of the next page is the offset to send back"""
+    rows = [dict(row) for row in (await session.execute(statement.offset(offset).limit(limit + 1))).mappings()]
+    if len(rows) > limit:
+        return rows[:limit], offset + limit
+    return rows, None